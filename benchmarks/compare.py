@@ -0,0 +1,86 @@
+"""Compare two result files of benchmarks.suite, eg. of two versions of the
+SDK, and report the cases whose throughput or p99 latency regressed.
+
+Exits with status 1 if a case regressed by more than the threshold.
+
+Usage: python -m benchmarks.compare [--threshold PERCENT] BASELINE RESULTS
+"""
+
+import argparse
+import json
+import sys
+
+from benchmarks.suite import case_key
+
+
+def _change(old, new):
+    """relative change from old to new in percent, or None"""
+    if not old or new is None:
+        return None
+    return (new - old) * 100.0 / old
+
+
+def _format(change):
+    return "%+7.1f%%" % change if change is not None else "%8s" % "-"
+
+
+def compare(baseline, results, threshold):
+    """print the comparison of the results of the cases found in both
+    reports. Returns the list of keys of the cases which regressed.
+    """
+    old = dict((case_key(r), r) for r in baseline["results"])
+    regressed = []
+    print("baseline: %s, %s" % (baseline["sdk_version"], baseline["python"]))
+    print("results:  %s, %s" % (results["sdk_version"], results["python"]))
+    print("%-36s %10s %8s %9s %8s %9s %8s" % (
+        "case", "ops/s", "change", "p99 (ms)", "change", "bytes/req",
+        "change"))
+    for name, report in (("baseline", baseline), ("results", results)):
+        for case in report.get("skipped", []):
+            print("skipped in %s: %s %s, %s" % (
+                name, case["workload"], case["mode"], case["reason"]))
+    for result in results["results"]:
+        key = case_key(result)
+        before = old.get(key)
+        if before is None:
+            continue
+        ops = _change(before["ops_per_second"], result["ops_per_second"])
+        p99 = _change(before["p99_ms"], result["p99_ms"])
+        memory = _change(before["bytes_per_request"],
+                         result["bytes_per_request"])
+        worse = ((ops is not None and ops < -threshold) or
+                 (p99 is not None and p99 > threshold))
+        if worse:
+            regressed.append(key)
+        print("%-36s %10.0f %s %9s %s %9s %s%s" % (
+            "%s %s threads=%s qsize=%s" % key, result["ops_per_second"],
+            _format(ops), "%.2f" % result["p99_ms"]
+            if result["p99_ms"] is not None else "-", _format(p99),
+            "%.0f" % result["bytes_per_request"]
+            if result["bytes_per_request"] is not None else "-",
+            _format(memory), "  REGRESSED" if worse else ""))
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline", help="results of the reference version")
+    parser.add_argument("results", help="results to compare")
+    parser.add_argument("--threshold", type=float, default=10,
+                        help="regression threshold in percent of the "
+                             "throughput and p99 latency")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.results) as f:
+        results = json.load(f)
+    regressed = compare(baseline, results, args.threshold)
+    if regressed:
+        print("%d cases regressed by more than %s%%" % (len(regressed),
+                                                      args.threshold))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""Compare format_event_time() with the two strftime calls it replaces, and
+check that both produce the same strings.
+
+Usage: python -m benchmarks.event_time [--number N]
+"""
+
+import argparse
+import timeit
+
+from datetime import datetime
+
+import pytz
+
+from predictionio import format_event_time
+
+
+def strftime_event_time(t):
+    return t.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + t.strftime("%z")
+
+
+TIMES = [
+    datetime(2014, 12, 13, 21, 38, 45, 618000, pytz.utc),
+    pytz.timezone('US/Pacific').localize(datetime(2014, 8, 31, 4, 56)),
+    pytz.timezone('Asia/Kolkata').localize(datetime(1999, 1, 1, 0, 0, 0, 1)),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=200000)
+    args = parser.parse_args()
+
+    for t in TIMES:
+        assert format_event_time(t) == strftime_event_time(t), t
+
+    print("%-28s %12s %12s %8s" % ("event_time", "strftime", "format",
+                                   "speedup"))
+    cases = [(t.tzinfo.zone, t, strftime_event_time) for t in TIMES]
+    cases.append(("None (now)", None,
+                  lambda t: strftime_event_time(datetime.now(pytz.utc))))
+    for name, t, old in cases:
+        old_time = timeit.timeit(lambda: old(t), number=args.number)
+        new_time = timeit.timeit(lambda: format_event_time(t),
+                                 number=args.number)
+        print("%-28s %10.2fus %10.2fus %7.1fx" % (
+            name, old_time / args.number * 1e6, new_time / args.number * 1e6,
+            old_time / new_time))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Compare the latency of synchronous send_query() between the threaded
+(threads=1) and the inline (threads=0) modes of EngineClient.
+
+Usage: python -m benchmarks.inline [--queries N]
+"""
+
+import argparse
+import time
+
+from predictionio import EngineClient
+
+from benchmarks.mock_server import MockServer
+
+
+def measure(url, threads, queries):
+    """return the sorted latencies in microseconds of queries sequential
+    send_query() calls"""
+    client = EngineClient(url=url, threads=threads)
+    client.send_query({"user": "warm-up"})
+    latencies = []
+    for i in range(queries):
+        start = time.time()
+        client.send_query({"user": str(i), "num": 10})
+        latencies.append((time.time() - start) * 1e6)
+    client.close()
+    return sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=5000)
+    args = parser.parse_args()
+
+    with MockServer() as server:
+        print("%-10s %10s %10s %10s" % ("threads", "p50 (us)", "p99 (us)",
+                                        "queries/s"))
+        for threads in (1, 0):
+            latencies = measure(server.url, threads, args.queries)
+            print("%-10s %10.1f %10.1f %10.0f" % (
+                threads, latencies[len(latencies) // 2],
+                latencies[int(len(latencies) * 0.99)],
+                len(latencies) / (sum(latencies) / 1e6)))
+
+
+if __name__ == "__main__":
+    main()
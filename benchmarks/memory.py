@@ -0,0 +1,80 @@
+"""Measure the memory used per asynchronous event, with tracemalloc:
+
+  queued     requests waiting in the queue, the server holding the responses
+  completed  requests whose responses arrived, but were not read yet
+  compact    the same, with compact_responses=True
+
+Usage: python -m benchmarks.memory [--events N]
+"""
+
+import argparse
+import gc
+import tracemalloc
+
+from predictionio import EventClient
+from predictionio import wait
+
+from benchmarks.mock_server import MockServer
+
+ACCESS_KEY = "benchmark" * 5
+
+
+def _send(client, n):
+    return [client.acreate_event("view", "user", str(i), "item",
+                                 str(i % 100), properties={"rating": 4.5})
+            for i in range(n)]
+
+
+def measure_queued(server, n):
+    """return the bytes allocated per queued request"""
+    client = EventClient(ACCESS_KEY, url=server.url, threads=1)
+    _send(client, 1)[0].get_response()  # warm up
+    server.hold()
+    try:
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        requests = _send(client, n)
+        used = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+    finally:
+        server.release()
+    client.close()
+    del requests
+    return used / float(n)
+
+
+def measure_completed(server, n, compact):
+    """return the bytes kept per completed request which was not read"""
+    client = EventClient(ACCESS_KEY, url=server.url, threads=4,
+                         compact_responses=compact)
+    _send(client, 1)[0].get_response()  # warm up
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    requests = _send(client, n)
+    wait(requests)  # without reading the responses
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    client.close()
+    del requests
+    return used / float(n)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=10000)
+    args = parser.parse_args()
+
+    with MockServer() as server:
+        print("%-10s %14s" % ("requests", "bytes/event"))
+        print("%-10s %14.0f" % ("queued", measure_queued(server,
+                                                         args.events)))
+        print("%-10s %14.0f" % ("completed", measure_completed(
+            server, args.events, False)))
+        print("%-10s %14.0f" % ("compact", measure_completed(
+            server, args.events, True)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Local stand-in for the PredictionIO Event Server and Engine Server, for
+benchmarking the SDK without a PredictionIO installation.
+
+It answers the endpoints used by the SDK with canned responses:
+
+  GET    /                     status
+  POST   /events.json          create an event
+  POST   /batch/events.json    create events
+  GET    /events.json          get events
+  GET    /events/<id>.json     get an event
+  DELETE /events/<id>.json     delete an event
+  POST   /queries.json         query, the prediction echoes the query
+  POST   /batch/queries.json   batch query
+
+Each response can be delayed by a fixed latency, and a fraction of the
+requests can fail with status 503, to benchmark the SDK against a slow or
+overloaded server. Queries which are not JSON objects fail with status 400,
+like a batch query containing one.
+"""
+
+import json
+import random
+import socket
+import threading
+import time
+
+try:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+except ImportError:
+    # pylint: disable=F0401
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        # the SDK and the servers of PredictionIO disable Nagle's algorithm;
+        # without this, small responses wait for delayed ACKs
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.server.count_connection()
+        BaseHTTPRequestHandler.setup(self)
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, obj):
+        body = json.dumps(obj).encode("utf8")
+        lines = [
+            "%s %d %s" % (self.protocol_version, status,
+                          self.responses.get(status, ("",))[0]),
+            "Content-Type: application/json",
+            "Content-Length: %d" % len(body),
+        ]
+        # write headers and body at once
+        self.wfile.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") +
+                         body)
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return None
+        return json.loads(self.rfile.read(length).decode("utf8"))
+
+    def _handle(self):
+        server = self.server
+        server.count_request()
+        path = self.path.split("?", 1)[0]
+        body = self._read_body() if self.command == "POST" else None
+        server.running.wait()
+        if server.latency:
+            time.sleep(server.latency)
+        if server.error_rate and random.random() < server.error_rate:
+            return self._reply(503, {"message": "Service Unavailable"})
+        if self.command == "GET" and path == "/":
+            return self._reply(200, {"status": "alive"})
+        elif self.command == "POST" and path == "/events.json":
+            return self._reply(201, {"eventId": server.next_event_id()})
+        elif self.command == "POST" and path == "/batch/events.json":
+            return self._reply(200, [
+                {"status": 201, "eventId": server.next_event_id()}
+                for e in body])
+        elif self.command == "GET" and path == "/events.json":
+            return self._reply(200, [])
+        elif path.startswith("/events/") and self.command == "GET":
+            return self._reply(200, {"eventId": path[8:-5]})
+        elif path.startswith("/events/") and self.command == "DELETE":
+            return self._reply(200, {"message": "Found"})
+        elif self.command == "POST" and path == "/queries.json":
+            if not isinstance(body, dict):
+                return self._reply(400, {"message": "Invalid query"})
+            return self._reply(200, {"query": body})
+        elif self.command == "POST" and path == "/batch/queries.json":
+            if not all(isinstance(q, dict) for q in body):
+                return self._reply(400, {"message": "Invalid query"})
+            return self._reply(200, [{"query": q} for q in body])
+        self._reply(404, {"message": "Not Found"})
+
+    do_GET = _handle
+    do_POST = _handle
+    do_DELETE = _handle
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, latency=0, error_rate=0):
+        HTTPServer.__init__(self, address, _Handler)
+        self.latency = latency
+        self.error_rate = error_rate
+        # cleared while the server holds the responses
+        self.running = threading.Event()
+        self.running.set()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self._event_id = 0
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def count_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def next_event_id(self):
+        with self._lock:
+            self._event_id += 1
+            return "event-%s" % self._event_id
+
+
+class MockServer(object):
+    """mock PredictionIO server running in a background thread
+
+    Use it as a context manager, its url attribute is the url of the server.
+
+    Args:
+      latency: time in seconds the server waits before each response
+      error_rate: fraction of the requests answered with status 503
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0, error_rate=0):
+        self._server = _Server((host, port), latency, error_rate)
+        self.url = "http://%s:%s" % self._server.server_address[:2]
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+
+    @property
+    def requests(self):
+        """number of http requests received"""
+        return self._server.requests
+
+    @property
+    def connections(self):
+        """number of connections accepted"""
+        return self._server.connections
+
+    def hold(self):
+        """stop answering requests until release() is called, eg. to keep
+        requests in flight"""
+        self._server.running.clear()
+
+    def release(self):
+        """answer the requests held by hold()"""
+        self._server.running.set()
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.release()
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
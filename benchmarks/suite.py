@@ -0,0 +1,348 @@
+"""Benchmark suite of the SDK against the local mock server
+
+Runs a matrix of cases, ie. workload x client mode x threads x queue size,
+and measures for each one:
+
+  ops_per_second     events or queries completed per second
+  p50_ms, p99_ms     latency of the requests, from their creation to their
+                     response
+  errors             events or queries which failed
+  bytes_per_request  memory allocated per request in flight, measured with
+                     tracemalloc while the server holds the responses
+
+The workloads are "events" (acreate_event) and "queries" (asend_query). The
+client modes are:
+
+  threads   asynchronous requests sent by the connection threads
+  pipeline  the same, with pipeline=8
+  batch     the same, with batch_size=50 for events and asend_queries() for
+            queries
+  inline    synchronous requests sent with threads=0 by as many calling
+            threads
+
+Each case is run several times, and the run with the median throughput is
+kept. The results are written as JSON, to be compared between two versions
+of the SDK with benchmarks.compare. The mock server is a threaded
+http.server, so the absolute numbers are lower than with a PredictionIO
+server; compare results measured on the same machine.
+
+The options and modes are detected in the installed SDK, so that earlier
+versions can be measured too: the modes it does not support are skipped and
+listed in the "skipped" entry of the results, and the latencies are not
+measured without the callback option.
+
+Usage: python -m benchmarks.suite [options] [--output FILE]
+"""
+
+import argparse
+import json
+import platform
+import sys
+import threading
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    # python 2
+    tracemalloc = None
+
+import predictionio
+
+from predictionio import EngineClient
+from predictionio import EventClient
+from predictionio import PredictionIOAPIError
+
+try:
+    from predictionio import RetryPolicy
+except ImportError:
+    # earlier versions of the SDK
+    RetryPolicy = None
+
+from benchmarks.mock_server import MockServer
+
+ACCESS_KEY = "benchmark" * 5
+
+MODES = {
+    "threads": {},
+    "pipeline": {"pipeline": 8},
+    "batch": {"batch_size": 50, "linger_ms": 5},
+    "inline": {},
+}
+
+
+class Unsupported(Exception):
+    """the installed SDK does not support a client mode or option"""
+
+
+def _client(url, workload, mode, threads, qsize, retry=None, callback=None):
+    """return the client of the case, raises Unsupported if the installed
+    SDK does not support its mode or options"""
+    options = dict(MODES[mode], threads=0 if mode == "inline" else threads,
+                   qsize=qsize, timeout=30)
+    # only the options set, which earlier versions may not accept
+    if retry is not None:
+        options["retry"] = retry
+    if callback is not None:
+        options["callback"] = callback
+    try:
+        if workload == "events":
+            client = EventClient(ACCESS_KEY, url=url, **options)
+        else:
+            options.pop("batch_size", None)
+            options.pop("linger_ms", None)
+            client = EngineClient(url=url, **options)
+    except TypeError as e:
+        raise Unsupported(str(e))
+    reason = None
+    if mode == "inline" and not getattr(client._connection, "inline", False):
+        reason = "no inline mode (threads=0)"
+    elif (mode == "batch" and workload == "queries" and
+          not hasattr(client, "asend_queries")):
+        reason = "no asend_queries()"
+    if reason is not None:
+        client.close()
+        raise Unsupported(reason)
+    return client
+
+
+def unsupported(url, workload, mode):
+    """return why the installed SDK does not support the mode for the
+    workload, or None if it does"""
+    try:
+        _client(url, workload, mode, 1, 0).close()
+    except Unsupported as e:
+        return str(e)
+    return None
+
+
+def _submit(client, workload, mode, n):
+    """send n events or queries asynchronously. Returns the list of
+    (AsyncRequest, number of events or queries)"""
+    if workload == "events":
+        return [(client.acreate_event("view", "user", str(i), "item",
+                                      str(i % 100)), 1)
+                for i in range(n)]
+    queries = [{"user": str(i), "num": 10} for i in range(n)]
+    if mode == "batch":
+        return [(request, min(50, n - i * 50)) for i, request in
+                enumerate(client.asend_queries(queries, 50))]
+    return [(client.asend_query(query), 1) for query in queries]
+
+
+def _failures(request, ops):
+    """number of events or queries of the request which failed"""
+    try:
+        result = request.get_response()
+    except PredictionIOAPIError:
+        return ops
+    if isinstance(result, list):
+        return sum(isinstance(r, PredictionIOAPIError) for r in result)
+    return 0
+
+
+def _run_async(client, workload, mode, n):
+    start = time.time()
+    submitted = _submit(client, workload, mode, n)
+    errors = sum(_failures(request, ops) for request, ops in submitted)
+    return time.time() - start, errors
+
+
+def _run_inline(client, workload, threads, n, latencies):
+    errors = []
+
+    def send(indexes):
+        for i in indexes:
+            start = time.time()
+            try:
+                if workload == "events":
+                    client.create_event("view", "user", str(i), "item",
+                                        str(i % 100))
+                else:
+                    client.send_query({"user": str(i), "num": 10})
+            except PredictionIOAPIError:
+                errors.append(i)
+            latencies.append(time.time() - start)
+
+    workers = [threading.Thread(target=send, args=(range(t, n, threads),))
+               for t in range(threads)]
+    start = time.time()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.time() - start, len(errors)
+
+
+def _percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(len(values) * p / 100.0), len(values) - 1)]
+
+
+def measure_memory(server, workload, mode, threads, n):
+    """return the memory in bytes allocated per request in flight, or None
+    if it cannot be measured"""
+    if tracemalloc is None or mode == "inline":
+        return None
+    client = _client(server.url, workload, mode, threads, 0)
+    _submit(client, workload, mode, 1)[0][0].get_response()  # warm up
+    server.hold()
+    try:
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        submitted = _submit(client, workload, mode, n)
+        used = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+    finally:
+        server.release()
+    for request, ops in submitted:
+        _failures(request, ops)
+    client.close()
+    return used / float(n)
+
+
+def run_case(server, workload, mode, threads, qsize, n, retry=None):
+    """run one case of the matrix, returns its results as a dict"""
+    latencies = []
+
+    def done(request):
+        latencies.append(time.time() - request.created)
+
+    # the latencies of synchronous requests are measured by _run_inline,
+    # those of the asynchronous ones only if the callback option exists
+    try:
+        client = _client(server.url, workload, mode, threads, qsize, retry,
+                         None if mode == "inline" else done)
+    except Unsupported:
+        client = _client(server.url, workload, mode, threads, qsize, retry)
+    try:
+        if mode == "inline":
+            seconds, errors = _run_inline(client, workload, threads, n,
+                                          latencies)
+        else:
+            seconds, errors = _run_async(client, workload, mode, n)
+    finally:
+        client.close()
+    p50 = _percentile(latencies, 50)
+    p99 = _percentile(latencies, 99)
+    return {
+        "workload": workload,
+        "mode": mode,
+        "threads": threads,
+        "qsize": qsize,
+        "requests": n,
+        "seconds": seconds,
+        "ops_per_second": n / seconds,
+        "p50_ms": None if p50 is None else p50 * 1e3,
+        "p99_ms": None if p99 is None else p99 * 1e3,
+        "errors": errors,
+    }
+
+
+def case_key(result):
+    """the parameters identifying a case in the results"""
+    return (result["workload"], result["mode"], result["threads"],
+            result["qsize"])
+
+
+def _ms(value):
+    return "%8.2fms" % value if value is not None else "%10s" % "-"
+
+
+def _list(convert):
+    return lambda value: [convert(v) for v in value.split(",")]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workloads", type=_list(str),
+                        default=["events", "queries"])
+    parser.add_argument("--modes", type=_list(str),
+                        default=["threads", "pipeline", "batch", "inline"])
+    parser.add_argument("--threads", type=_list(int), default=[1, 4, 16],
+                        help="comma-separated numbers of threads")
+    parser.add_argument("--qsize", type=_list(int), default=[0, 100],
+                        help="comma-separated queue sizes, 0 is unbounded")
+    parser.add_argument("--requests", type=int, default=2000,
+                        help="events or queries sent per case")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="runs of each case, the run with the median "
+                             "throughput is kept")
+    parser.add_argument("--memory-requests", type=int, default=1000,
+                        help="requests in flight when measuring the memory, "
+                             "0 to skip it")
+    parser.add_argument("--latency", type=float, default=0,
+                        help="latency of the server in seconds")
+    parser.add_argument("--error-rate", type=float, default=0,
+                        help="fraction of the requests failing with 503")
+    parser.add_argument("--retry", action="store_true",
+                        help="retry the failed requests with RetryPolicy()")
+    parser.add_argument("--output", help="JSON file of the results. "
+                                         "Default: stdout")
+    args = parser.parse_args(argv)
+    for mode in args.modes:
+        if mode not in MODES:
+            parser.error("unknown mode %s" % mode)
+    if args.retry and RetryPolicy is None:
+        parser.error("--retry: this version of the SDK has no RetryPolicy")
+
+    retry = RetryPolicy(backoff=0.01) if args.retry else None
+    results = []
+    skipped = []
+    with MockServer(latency=args.latency,
+                    error_rate=args.error_rate) as server:
+        for workload in args.workloads:
+            for mode in args.modes:
+                reason = unsupported(server.url, workload, mode)
+                if reason is not None:
+                    skipped.append({"workload": workload, "mode": mode,
+                                    "reason": reason})
+                    sys.stderr.write("%-8s %-9s skipped: %s\n" % (
+                        workload, mode, reason))
+                    continue
+                for threads in args.threads:
+                    memory = None
+                    if args.memory_requests:
+                        memory = measure_memory(server, workload, mode,
+                                                threads, args.memory_requests)
+                    # the queue is not used in inline mode
+                    for qsize in (args.qsize[:1] if mode == "inline"
+                                  else args.qsize):
+                        runs = sorted(
+                            (run_case(server, workload, mode, threads, qsize,
+                                      args.requests, retry)
+                             for i in range(args.repeat)),
+                            key=lambda r: r["ops_per_second"])
+                        result = runs[len(runs) // 2]
+                        result["bytes_per_request"] = memory
+                        results.append(result)
+                        sys.stderr.write(
+                            "%-8s %-9s threads=%-3s qsize=%-4s %9.0f ops/s "
+                            "p99 %s\n" % (
+                                workload, mode, threads, qsize,
+                                result["ops_per_second"],
+                                _ms(result["p99_ms"])))
+
+    report = {
+        "sdk_version": predictionio.__version__,
+        "python": "%s %s" % (platform.python_implementation(),
+                             platform.python_version()),
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "server": {"latency": args.latency, "error_rate": args.error_rate},
+        "retry": args.retry,
+        "results": results,
+        "skipped": skipped,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
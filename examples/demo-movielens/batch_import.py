@@ -85,31 +85,28 @@ def batch_import_task(app_data, client, all_info=False):
     sys.stdout.flush()
 
     print("[Info] Importing rate actions to PredictionIO...")
+    # import_stream keeps a bounded number of requests in flight, instead of
+    # keeping every AsyncRequest until the end
+    rate_events = (
+        dict(event="rate",
+             entity_type="user",
+             entity_id=v.uid,
+             target_entity_type="item",
+             target_entity_id=v.iid,
+             properties={"rating": int(v.rating)},
+             event_time=v.t.replace(tzinfo=pytz.utc))
+        for v in app_data.get_rate_actions())
     count = 0
-    create_event_request_list = []
-    for v in app_data.get_rate_actions():
+    for event, result in client.import_stream(rate_events, max_in_flight=500):
         count += 1
-        if all_info:
-            print("[Info] Importing %s..." % v)
-        else:
-            if count % 32 == 0:
-                sys.stdout.write('\r[Info] %s' % count)
-                sys.stdout.flush()
-
-        properties = {"rating": int(v.rating)}
-        req = client.acreate_event(
-            event="rate",
-            entity_type="user",
-            entity_id=v.uid,
-            target_entity_type="item",
-            target_entity_id=v.iid,
-            properties=properties,
-            event_time=v.t.replace(tzinfo=pytz.utc),
-        )
-
-        create_event_request_list.append(req)
+        if isinstance(result, predictionio.PredictionIOAPIError):
+            print("[Error] %s" % result)
+        elif all_info:
+            print("[Info] Imported %s..." % event)
+        elif count % 32 == 0:
+            sys.stdout.write('\r[Info] %s' % count)
+            sys.stdout.flush()
 
-    [r.get_response() for r in create_event_request_list]
     sys.stdout.write('\r[Info] %s rate actions were imported.\n' % count)
     sys.stdout.flush()
 
@@ -7,7 +7,19 @@ Python applications with PredictionIO REST API services.
 __version__ = "0.9.10.dev1"
 
 # import packages
+import bz2
+import multiprocessing
+import numbers
+import os
 import re
+import threading
+import time
+import zlib
+try:
+  import Queue
+except ImportError:
+  # pylint: disable=F0401
+  import queue as Queue
 try:
   import httplib
 except ImportError:
@@ -32,9 +44,45 @@ import json
 from datetime import datetime
 import pytz
 
+from predictionio.cache import QueryCache
+from predictionio.codec import DEFAULT_DECODER
+from predictionio.codec import DEFAULT_ENCODER
+from predictionio.codec import get_codec
+from predictionio.concurrency import AdaptiveConcurrency
+from predictionio.ratelimit import RateLimiter
+from predictionio.requestlog import RequestLog
+from predictionio.tracing import OpenTelemetryTracer
+from predictionio.tracing import Tracer
 from predictionio.connection import Connection
+from predictionio.connection import ConnectionPool
+from predictionio.connection import get_default_pool
 from predictionio.connection import AsyncRequest
+from predictionio.connection import ALL_COMPLETED
+from predictionio.connection import FIRST_COMPLETED
+from predictionio.connection import FIRST_EXCEPTION
+from predictionio.connection import TimeoutError
+from predictionio.connection import as_completed
+from predictionio.connection import wait
 from predictionio.connection import PredictionIOAPIError
+from predictionio.connection import DeadlineExceededError
+from predictionio.connection import RequestCancelledError
+from predictionio.connection import RateLimitExceededError
+from predictionio.connection import RetryPolicy
+
+# use generators for python2 and python3
+try:
+  xrange
+except NameError:
+  xrange = range
+
+try:
+  _string_types = basestring
+except NameError:
+  _string_types = str
+
+# maximum number of events the Event Server accepts in one batch request
+MAX_BATCH_EVENTS = 50
+MAX_BATCH_QUERIES = 50
 
 
 class NotCreatedError(PredictionIOAPIError):
@@ -65,39 +113,243 @@ def event_time_validation(t):
   return t
 
 
+# tzinfo -> "%z" string, for the tzinfo classes whose offset does not depend
+# on the datetime they are attached to
+_tz_offsets = {}
+_fixed_offset_tz_types = (pytz.BaseTzInfo, )
+try:
+  from datetime import timezone
+  _fixed_offset_tz_types += (timezone, )
+except ImportError:
+  pass
+
+
+def format_event_time(t):
+  """ Format event_time according to EventAPI Specification, ie. ISO 8601
+  with milliseconds and the UTC offset, eg. "2014-09-09T16:17:42.937-0800".
+  :param t: a datetime with tzinfo, milliseconds since the epoch (int or
+    float), a str which is returned as is, or None for the current time.
+  """
+  if type(t) is datetime:
+    tz = t.tzinfo
+    # NOTE: other tzinfos may not be hashable, eg. those of dateutil
+    if isinstance(tz, _fixed_offset_tz_types):
+      offset = _tz_offsets.get(tz)
+      if offset is None:
+        offset = t.strftime("%z")
+        if len(_tz_offsets) >= 1024:
+          _tz_offsets.clear()
+        _tz_offsets[tz] = offset
+    elif tz is None:
+      raise AttributeError("event_time must have tzinfo")
+    else:
+      offset = t.strftime("%z")
+    if t.year < 1000:
+      # strftime does not zero-pad such years on every platform
+      return t.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + offset
+    # EventServer uses milliseconds, but python datetime class uses micro.
+    return "%04d-%02d-%02dT%02d:%02d:%02d.%03d%s" % (
+        t.year, t.month, t.day, t.hour, t.minute, t.second,
+        t.microsecond // 1000, offset)
+
+  if t is None:
+    t = time.time() * 1000
+  elif isinstance(t, _string_types):
+    return t
+  elif not isinstance(t, numbers.Real) or isinstance(t, bool):
+    raise AttributeError("event_time must be datetime.datetime")
+
+  ms = int(t)
+  y, m, d, hh, mm, ss = time.gmtime(ms // 1000)[:6]
+  return "%04d-%02d-%02dT%02d:%02d:%02d.%03d+0000" % (
+      y, m, d, hh, mm, ss, ms % 1000)
+
+
+def event_data(event, entity_type, entity_id,
+    target_entity_type=None, target_entity_id=None, properties=None,
+    event_time=None):
+  """ Build the JSON payload of an event according to EventAPI Specification.
+  (please refer to EventClient's acreate_event() for the arguments)
+  """
+  data = {
+      "event": event,
+      "entityType": entity_type,
+      "entityId": entity_id,
+      }
+
+  if target_entity_type is not None:
+    data["targetEntityType"] = target_entity_type
+
+  if target_entity_id is not None:
+    data["targetEntityId"] = target_entity_id
+
+  if properties is not None:
+    data["properties"] = properties
+
+  data["eventTime"] = format_event_time(event_time)
+
+  return data
+
+
+def _parse_url(url):
+  """ Parse the url of a PredictionIO server.
+  :returns:
+    (https, host) tuple. https is True for a https url.
+  :raises:
+    InvalidArgumentError if the url is not a http or https url.
+  """
+  https_pattern = r'^https://(.*)'
+  http_pattern = r'^http://(.*)'
+  m = re.match(https_pattern, url)
+  https = True
+  if m is None:  # not matching https
+    m = re.match(http_pattern, url)
+    https = False
+    if m is None:  # not matching http either
+      raise InvalidArgumentError("url is not valid: %s" % url)
+  return https, m.group(1)
+
+
 class BaseClient(object):
-  def __init__(self, url, threads=1, qsize=0, timeout=5):
+  def __init__(self, url, threads=1, qsize=0, timeout=5, batch_size=1,
+      linger_ms=0, pipeline=1, pool=None, encoder=None, decoder=None,
+      callback=None, concurrency=None, retry=None, rate_limiter=None,
+      metrics=True, tracer=None, request_log=None, compact_responses=False):
     """Constructor of Client object.
+    :param url: the url of the PredictionIO server.
+    :param threads: number of threads to handle PredictionIO API requests.
+      0 means the requests are sent by the calling thread.
+    :param qsize: the max size of the request queue.
+    :param timeout: timeout for HTTP connection attempts and requests in
+      seconds.
+    :param batch_size: max number of batchable requests sent in one batch
+      request.
+    :param linger_ms: max time in milliseconds to wait for more requests to
+      fill up a batch.
+    :param pipeline: max number of queued requests a thread sends
+      back-to-back on its connection before reading their responses (HTTP/1.1
+      pipelining). Useful when the latency to the server is high.
+      Default value is 1, which means no pipelining.
+    :param pool: ConnectionPool to take the connection from, eg.
+      get_default_pool(). Clients of the same server sharing a pool share
+      their threads and http connections. The pool may start fewer threads
+      than requested.
+      Default value is None, which means the client has its own connection.
+    :param encoder: function encoding a request body (dict or list) to a
+      JSON str or bytes, eg. get_codec("ujson")[0].
+      Default value is None, which means the fastest JSON library installed
+      among orjson, ujson and json.
+    :param decoder: function decoding the bytes of a response body. It is
+      only called when the json_body of a response is accessed.
+      Default value is None, which means the fastest JSON library installed
+      among orjson, ujson and json.
+    :param callback: function called with every AsyncRequest of this client
+      once it completes, eg. to handle results as they arrive instead of
+      keeping the requests. It is called in the thread completing the
+      request, and must not block.
+      Default value is None.
+    :param concurrency: AdaptiveConcurrency growing and shrinking the
+      threads between its min_threads and max_threads with the load of the
+      server. threads is ignored then, and its current number of threads is
+      concurrency.limit. It cannot be used with a pool.
+      Default value is None, which means a fixed number of threads.
+    :param retry: RetryPolicy of the failed requests, eg. RetryPolicy() to
+      retry responses with status 429 or 503 with exponential backoff. The
+      retries wait in a scheduler thread, not in the connection threads.
+      Default value is None, which means requests are only retried right
+      away on connection errors, at most MAX_RETRY times. With a
+      RetryPolicy, POST requests creating events are not retried after
+      connection errors any more once they may have reached the server.
+    :param rate_limiter: RateLimiter capping the events (or queries) and
+      bytes sent per second. Requests beyond the limit wait in the
+      connection threads or, if it does not block, are not sent: they fail
+      like requests whose connection failed, the error of their response
+      being a RateLimitExceededError.
+      Default value is None, which means no limit.
+    :param metrics: collect latency histograms and counters of the requests,
+      returned by stats() and prometheus_text().
+      Default value is True.
+    :param tracer: Tracer called at each stage of the requests (enqueued,
+      dequeued, connect, request sent, first byte, body read, delivered,
+      json decoded), eg. OpenTelemetryTracer() to record a span per request.
+      Default value is None, which means the requests are not traced.
+    :param request_log: RequestLog logging the failed http requests and a
+      sample of the successful ones, with truncated bodies, from a
+      background thread, eg. RequestLog(sample_rate=1000).
+      Default value is None, which means the requests are not logged.
+    :param compact_responses: check the responses as soon as they arrive, in
+      the connection threads, and drop their raw body and headers, keeping
+      only the result of the request (eg. the decoded json_body of a created
+      event). This saves memory when many responses are kept before their
+      results are read, eg. millions of asynchronous events.
+      Default value is False, which means the responses are checked by
+      get_response() and keep their body and headers.
     """
     self.threads = threads
     self.url = url
     self.qsize = qsize
     self.timeout = timeout
+    self.batch_size = batch_size
+    self.linger_ms = linger_ms
+    self.pipeline = pipeline
+    self.encoder = encoder or DEFAULT_ENCODER
+    self.decoder = decoder or DEFAULT_DECODER
+    self.callback = callback
+    self.concurrency = concurrency
+    self.retry = retry
+    self.rate_limiter = rate_limiter
+    self.metrics = metrics
+    self.tracer = tracer
+    self.request_log = request_log
+    self.compact_responses = compact_responses
 
     # check connection type
-    https_pattern = r'^https://(.*)'
-    http_pattern = r'^http://(.*)'
-    m = re.match(https_pattern, url)
-    self.https = True
-    if m is None:  # not matching https
-      m = re.match(http_pattern, url)
-      self.https = False
-      if m is None:  # not matching http either
-        raise InvalidArgumentError("url is not valid: %s" % url)
-    self.host = m.group(1)
+    self.https, self.host = _parse_url(url)
 
     self._uid = None  # identified uid
-    self._connection = Connection(host=self.host, threads=self.threads,
-                    qsize=self.qsize, https=self.https,
-                    timeout=self.timeout)
+    self._pool = pool
+    if pool is None:
+      self._connection = Connection(host=self.host, threads=self.threads,
+                      qsize=self.qsize, https=self.https,
+                      timeout=self.timeout, batch_size=self.batch_size,
+                      linger_ms=self.linger_ms, pipeline=self.pipeline,
+                      encoder=self.encoder, decoder=self.decoder,
+                      concurrency=self.concurrency, retry=self.retry,
+                      rate_limiter=self.rate_limiter, metrics=self.metrics,
+                      tracer=self.tracer, request_log=self.request_log)
+    elif concurrency is not None:
+      raise InvalidArgumentError(
+          "concurrency cannot be used with a pool")
+    else:
+      self._connection = pool.acquire(host=self.host, threads=self.threads,
+                      qsize=self.qsize, https=self.https,
+                      timeout=self.timeout, batch_size=self.batch_size,
+                      linger_ms=self.linger_ms, pipeline=self.pipeline,
+                      encoder=self.encoder, decoder=self.decoder,
+                      retry=self.retry, rate_limiter=self.rate_limiter,
+                      metrics=self.metrics, tracer=self.tracer,
+                      request_log=self.request_log)
 
   def close(self):
     """Close this client and the connection.
     Call this method when you want to completely terminate the connection
     with PredictionIO.
-    It will wait for all pending requests to finish.
+    It will wait for all pending requests to finish. If the connection is
+    shared through a ConnectionPool, only the last client closing it waits.
     """
-    self._connection.close()
+    if self._pool is None:
+      self._connection.close()
+    else:
+      self._pool.release(self._connection)
+
+  def _make_request(self, request):
+    request.compact = self.compact_responses
+    self._add_client_callback(request)
+    self._connection.make_request(request)
+
+  def _add_client_callback(self, request):
+    if self.callback is not None:
+      request.add_done_callback(self.callback)
 
   def pending_requests(self):
     """Return the number of pending requests.
@@ -106,6 +358,26 @@ class BaseClient(object):
     """
     return self._connection.pending_requests()
 
+  def stats(self):
+    """Return a snapshot of the metrics of the requests of this client.
+    :returns:
+      dict with the number of requests, requests in flight, queued requests
+      (queue_depth), threads, bytes sent and received, retries, errors by
+      type, and latency summaries in seconds (count, sum, mean, p50, p90,
+      p99, p999) of the time requests wait in the queue (queue_time), of the
+      time they take once taken by a thread (wire_time) and of the http
+      requests per endpoint (latency). If the connection is shared through a
+      ConnectionPool, the metrics are the ones of all its clients.
+    """
+    return self._connection.stats()
+
+  def prometheus_text(self, prefix="predictionio"):
+    """Return the metrics of stats() in the Prometheus text exposition
+    format, eg. to serve them to a Prometheus scrape.
+    :param prefix: prefix of the metric names.
+    """
+    return self._connection.prometheus_text(prefix)
+
   def get_status(self):
     """Get the status of the PredictionIO API Server
     :returns:
@@ -113,12 +385,16 @@ class BaseClient(object):
     :raises:
       ServerStatusError.
     """
+    request = self._get_status_request()
+    self._make_request(request)
+    result = request.get_response()
+    return result
+
+  def _get_status_request(self):
     path = "/"
     request = AsyncRequest("GET", path)
     request.set_rfunc(self._aget_resp)
-    self._connection.make_request(request)
-    result = request.get_response()
-    return result
+    return request
 
   def _acreate_resp(self, response):
     if response.error is not None:
@@ -142,6 +418,32 @@ class BaseClient(object):
 
     return response.json_body
 
+  def _acreate_batch_resp(self, response):
+    if response.error is not None:
+      raise NotCreatedError("Exception happened: %s for request %s" %
+                    (response.error, response.request))
+    elif response.status != httplib.OK:
+      raise NotCreatedError("request: %s status: %s body: %s" %
+                    (response.request, response.status,
+                     response.body))
+
+    statuses = response.json_body
+    events = response.request.items
+    if not isinstance(statuses, list) or len(statuses) != len(events):
+      raise NotCreatedError("request: %s unexpected batch response: %s" %
+                    (response.request, response.body))
+
+    return list(zip(events, statuses))
+
+  def _aget_batch_resp(self, response):
+    predictions = self._aget_resp(response)
+    if (not isinstance(predictions, list) or
+        len(predictions) != len(response.request.items)):
+      raise NotFoundError("request: %s unexpected batch response: %s" %
+                  (response.request, response.body))
+
+    return predictions
+
   def _adelete_resp(self, response):
     if response.error is not None:
       raise NotFoundError("Exception happened: %s for request %s" %
@@ -161,7 +463,10 @@ class EventClient(BaseClient):
   :param access_key: the access key for your application.
   :param url: the url of PredictionIO Event Server.
   :param threads: number of threads to handle PredictionIO API requests.
-          Must be >= 1.
+          Must be >= 0. 0 means no threads: every request is sent by the
+          calling thread on its own keep-alive connection, and asynchronous
+          methods block like the synchronous ones. This has the lowest
+          latency for synchronous requests.
   :param qsize: the max size of the request queue (optional).
       The asynchronous request becomes blocking once this size has been
       reached, until the queued requests are handled.
@@ -170,16 +475,32 @@ class EventClient(BaseClient):
     seconds (optional).
     Default value is 5.
   :param channel: channel name (optional)
+  :param batch_size: max number of events created by acreate_event() and its
+    helper functions which are coalesced into one batch request (optional).
+    Must be <= MAX_BATCH_EVENTS.
+    Default value is 1, which means every event is sent in its own request.
+  :param linger_ms: max time in milliseconds to wait for more events to fill
+    up a batch (optional). Only used when batch_size > 1.
+    Default value is 0, which means only the events already queued are
+    batched.
+  :param kwargs: other connection options of BaseClient (optional), eg.
+    pipeline.
   """
 
   def __init__(self, access_key,
       url="http://localhost:7070",
-      threads=1, qsize=0, timeout=5, channel=None):
+      threads=1, qsize=0, timeout=5, channel=None, batch_size=1,
+      linger_ms=0, **kwargs):
     assert type(access_key) is str, ("access_key must be string. "
         "Notice that app_id has been deprecated in Prediction.IO 0.8.2. "
         "Please use access_key instead.")
 
-    super(EventClient, self).__init__(url, threads, qsize, timeout)
+    if not 1 <= batch_size <= MAX_BATCH_EVENTS:
+      raise InvalidArgumentError("batch_size must be between 1 and %s: %s" %
+          (MAX_BATCH_EVENTS, batch_size))
+
+    super(EventClient, self).__init__(url, threads, qsize, timeout,
+        batch_size=batch_size, linger_ms=linger_ms, **kwargs)
 
     if len(access_key) <= 8:
       raise DeprecationWarning(
@@ -192,7 +513,7 @@ class EventClient(BaseClient):
 
   def acreate_event(self, event, entity_type, entity_id,
       target_entity_type=None, target_entity_id=None, properties=None,
-      event_time=None):
+      event_time=None, deadline=None):
     """Asynchronously create an event.
     :param event: event name. type str.
     :param entity_type: entity type. It is the namespace of the entityId and
@@ -206,31 +527,26 @@ class EventClient(BaseClient):
     :param target_entity_id: target entity id. type str.
     :param properties: a custom dict associated with an event. type dict.
     :param event_time: the time of the event. type datetime, must contain
-      timezone info.
+      timezone info. Milliseconds since the epoch (int or float) and
+      ISO 8601 strings formatted like format_event_time() are accepted too.
+    :param deadline: max time in seconds the request may wait in the queue.
+      If it is not sent by then, it is not sent at all and fails.
+      Default value is None, which means no deadline.
     :returns:
       AsyncRequest object. You can call the get_response() method using this
       object to get the final resuls or status of this asynchronous request.
     """
-    data = {
-        "event": event,
-        "entityType": entity_type,
-        "entityId": entity_id,
-        }
-
-    if target_entity_type is not None:
-      data["targetEntityType"] = target_entity_type
-
-    if target_entity_id is not None:
-      data["targetEntityId"] = target_entity_id
-
-    if properties is not None:
-      data["properties"] = properties
+    request = self._create_event_request(event, entity_type, entity_id,
+        target_entity_type, target_entity_id, properties, event_time)
+    request.set_deadline(deadline)
+    self._make_request(request)
+    return request
 
-    et = event_time_validation(event_time)
-    # EventServer uses milliseconds, but python datetime class uses micro. Hence
-    # need to skip the last three digits.
-    et_str = et.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + et.strftime("%z")
-    data["eventTime"] = et_str
+  def _create_event_request(self, event, entity_type, entity_id,
+      target_entity_type=None, target_entity_id=None, properties=None,
+      event_time=None):
+    data = event_data(event, entity_type, entity_id, target_entity_type,
+        target_entity_id, properties, event_time)
 
     qparam = {
         "accessKey" : self.access_key
@@ -239,11 +555,13 @@ class EventClient(BaseClient):
     if self.channel is not None:
       qparam["channel"] = self.channel
 
-    path = "/events.json?%s" % (urlencode(qparam), )
+    enc_qparam = urlencode(qparam)
+    path = "/events.json?%s" % (enc_qparam, )
 
     request = AsyncRequest("POST", path, **data)
+    if self.batch_size > 1:
+      request.batch_path = "/batch/events.json?%s" % (enc_qparam, )
     request.set_rfunc(self._acreate_resp)
-    self._connection.make_request(request)
     return request
 
   def create_event(self, event, entity_type, entity_id,
@@ -254,6 +572,116 @@ class EventClient(BaseClient):
         target_entity_type, target_entity_id, properties,
         event_time).get_response()
 
+  def acreate_events(self, events):
+    """Asynchronously create events in batches.
+    The events are sent to the batch endpoint of the Event Server, at most
+    MAX_BATCH_EVENTS events per request.
+    :param events: an iterable of events. Each event is a dict whose keys are
+      the arguments of acreate_event(), eg. {"event": "view",
+      "entity_type": "user", "entity_id": "1"}.
+    :returns:
+      list of AsyncRequest objects, one per batch. The get_response() method
+      of each returns a list of (event, status) tuples, in the same order as
+      the events of the batch. event is the dict passed in, and status is the
+      dict returned by the Event Server for that event, eg. {"status": 201,
+      "eventId": "..."} or {"status": 400, "message": "..."}.
+    """
+    requests = []
+    for request in self._create_events_requests(events):
+      self._make_request(request)
+      requests.append(request)
+    return requests
+
+  def _create_events_requests(self, events):
+    """Generate the batch requests creating the events.
+    """
+    qparam = {
+        "accessKey" : self.access_key
+        }
+
+    if self.channel is not None:
+      qparam["channel"] = self.channel
+
+    path = "/batch/events.json?%s" % (urlencode(qparam), )
+
+    batch = []
+    for e in events:
+      batch.append(e)
+      if len(batch) == MAX_BATCH_EVENTS:
+        yield self._create_batch_request(path, batch)
+        batch = []
+
+    if batch:
+      yield self._create_batch_request(path, batch)
+
+  def _create_batch_request(self, path, events):
+    request = AsyncRequest("POST", path)
+    request.set_body([event_data(**e) for e in events])
+    request.items = events
+    request.set_rfunc(self._acreate_batch_resp)
+    return request
+
+  def create_events(self, events):
+    """Synchronously (blocking) create events in batches.
+    (please refer to acreate_events())
+    :returns:
+      list of (event, status) tuples, in the same order as the events.
+    """
+    results = []
+    for request in self.acreate_events(events):
+      results.extend(request.get_response())
+    return results
+
+  def import_stream(self, events, max_in_flight=1000):
+    """Create events with a bounded number of requests in flight.
+    A generator: the events are taken from the iterable only as fast as
+    the requests complete, so that memory use does not grow with the number
+    of events. Events are sent with acreate_event(), and thus are coalesced
+    into batch requests if batch_size > 1.
+    :param events: an iterable of events. Each event is a dict whose keys are
+      the arguments of acreate_event(), eg. {"event": "view",
+      "entity_type": "user", "entity_id": "1"}.
+    :param max_in_flight: max number of events sent and not yielded yet
+      (optional).
+      Default value is 1000.
+    :returns:
+      generator of (event, result) tuples, in the order the requests
+      complete. result is the response of acreate_event(), or the
+      PredictionIOAPIError raised by it if the event was not created.
+    """
+    if max_in_flight < 1:
+      raise InvalidArgumentError(
+          "max_in_flight must be >= 1: %s" % max_in_flight)
+
+    completed = Queue.Queue()
+    in_flight = 0
+    for e in events:
+      while in_flight >= max_in_flight:
+        yield self._import_result(*completed.get())
+        in_flight -= 1
+      request = self.acreate_event(**e)
+      request.add_done_callback(lambda r, e=e: completed.put((e, r)))
+      in_flight += 1
+
+      # hand out what already completed without waiting
+      while True:
+        try:
+          result = completed.get_nowait()
+        except Queue.Empty:
+          break
+        yield self._import_result(*result)
+        in_flight -= 1
+
+    while in_flight:
+      yield self._import_result(*completed.get())
+      in_flight -= 1
+
+  def _import_result(self, event, request):
+    try:
+      return event, request.get_response()
+    except PredictionIOAPIError as e:
+      return event, e
+
   def aget_event(self, event_id):
     """Asynchronouly get an event from Event Server.
     :param event_id: event id returned by the EventServer when creating the
@@ -261,6 +689,11 @@ class EventClient(BaseClient):
     :returns:
       AsyncRequest object.
     """
+    request = self._get_event_request(event_id)
+    self._make_request(request)
+    return request
+
+  def _get_event_request(self, event_id):
     qparam = {
         "accessKey" : self.access_key
         }
@@ -272,7 +705,6 @@ class EventClient(BaseClient):
     path = "/events/%s.json" % (enc_event_id, )
     request = AsyncRequest("GET", path, **qparam)
     request.set_rfunc(self._aget_resp)
-    self._connection.make_request(request)
     return request
 
   def get_event(self, event_id):
@@ -290,6 +722,13 @@ class EventClient(BaseClient):
     :returns:
       AsyncRequest object.
     """
+    request = self._get_events_request(startTime, untilTime, entityType,
+        entityId, limit, reversed)
+    self._make_request(request)
+    return request
+
+  def _get_events_request(self, startTime=None, untilTime=None,
+      entityType=None, entityId=None, limit=None, reversed=False):
     qparam = {
         "accessKey" : self.access_key,
         "reversed": reversed
@@ -315,7 +754,6 @@ class EventClient(BaseClient):
     path = "/events.json"
     request = AsyncRequest("GET", path, **qparam)
     request.set_rfunc(self._aget_resp)
-    self._connection.make_request(request)
     return request
 
   def get_events(self, startTime=None, untilTime=None, entityType=None, entityId=None, limit=None, reversed=False):
@@ -336,6 +774,11 @@ class EventClient(BaseClient):
     :returns:
       AsyncRequest object.
     """
+    request = self._delete_event_request(event_id)
+    self._make_request(request)
+    return request
+
+  def _delete_event_request(self, event_id):
     qparam = {
         "accessKey" : self.access_key
         }
@@ -347,7 +790,6 @@ class EventClient(BaseClient):
     path = "/events/%s.json" % (enc_event_id, )
     request = AsyncRequest("DELETE", path, **qparam)
     request.set_rfunc(self._adelete_resp)
-    self._connection.make_request(request)
     return request
 
   def delete_event(self, event_id):
@@ -480,7 +922,10 @@ class EngineClient(BaseClient):
   Instance.
   :param url: the url of the PredictionIO Engine Instance.
   :param threads: number of threads to handle PredictionIO API requests.
-          Must be >= 1.
+          Must be >= 0. 0 means no threads: every request is sent by the
+          calling thread on its own keep-alive connection, and asynchronous
+          methods block like the synchronous ones. This has the lowest
+          latency for synchronous requests.
   :param qsize: the max size of the request queue (optional).
       The asynchronous request becomes blocking once this size has been
       reached, until the queued requests are handled.
@@ -488,24 +933,132 @@ class EngineClient(BaseClient):
   :param timeout: timeout for HTTP connection attempts and requests in
     seconds (optional).
     Default value is 5.
+  :param cache: QueryCache caching the predictions of the queries sent
+    (optional). A cached prediction is returned without sending the query
+    again until it expires.
+    Default value is None, which means no caching.
+  :param single_flight: if True, a query identical to a query already queued
+    or in flight is not sent again: all the callers get the prediction of the
+    request already sent, and must not modify it (optional).
+    Default value is False.
+  :param kwargs: other connection options of BaseClient (optional), eg.
+    pipeline.
   """
   def __init__(self, url="http://localhost:8000", threads=1,
-      qsize=0, timeout=5):
-    super(EngineClient, self).__init__(url, threads, qsize, timeout)
-
-  def asend_query(self, data):
+      qsize=0, timeout=5, cache=None, single_flight=False, **kwargs):
+    super(EngineClient, self).__init__(url, threads, qsize, timeout, **kwargs)
+    self.cache = cache
+    self.single_flight = single_flight
+    self._in_flight = {}  # query key -> AsyncRequest queued or in flight
+    self._in_flight_lock = threading.Lock()
+
+  def asend_query(self, data, deadline=None):
     """Asynchronously send a request to the engine instance with data as the
     query.
     :param data: the query: It is coverted to an json object using json.dumps
       method. type dict.
+    :param deadline: max time in seconds the request may wait in the queue.
+      If it is not sent by then, it is not sent at all and fails. With
+      single_flight, the request shared by identical queries is sent unless
+      the deadlines of all of them are exceeded, and they all get its
+      prediction.
+      Default value is None, which means no deadline.
     :returns:
       AsyncRequest object. You can call the get_response() method using this
       object to get the final resuls or status of this asynchronous request.
     """
+    if self.cache is not None:
+      return self._asend_cached_query(data, deadline)
+    return self._asend_query(data, deadline=deadline)
+
+  def _asend_query(self, data, key=None, deadline=None, background=False):
+    # the background requests refreshing the cache are not made by the
+    # application: the callback is not called, and the request log does not
+    # sample them
+    if not self.single_flight:
+      request = self._send_query_request(data)
+      request.set_deadline(deadline)
+      if not background:
+        self._make_request(request)
+        return request
+      request.compact = self.compact_responses
+      request.sampled = False
+      self._connection.make_request(request)
+      return request
+
+    if key is None:
+      key = QueryCache.key(data)
+    # every caller follows the request actually sent, which none of them
+    # holds, so that cancelling its request only affects the caller
+    request = self._send_query_request(data)
+    request.set_deadline(deadline)
+    request.compact = self.compact_responses
+    if not background:
+      self._add_client_callback(request)
+    with self._in_flight_lock:
+      flight = self._in_flight.get(key)
+      if flight is None:
+        flight = self._send_query_request(data)
+        flight.deadline = request.deadline
+        flight.compact = self.compact_responses
+        flight.sampled = not background
+        # forgotten before the callers are completed
+        flight.add_done_callback(lambda r: self._end_flight(key, r))
+        self._in_flight[key] = flight
+        leader = True
+      else:
+        # it is sent as long as one of the callers may wait for it
+        if flight.deadline is not None:
+          if request.deadline is None:
+            flight.deadline = None
+          else:
+            flight.deadline = max(flight.deadline, request.deadline)
+        if not background:
+          flight.sampled = True
+        leader = False
+    request.follow(flight)
+    if leader:
+      self._connection.make_request(flight)
+    return request
+
+  def _end_flight(self, key, flight):
+    with self._in_flight_lock:
+      if self._in_flight.get(key) is flight:
+        del self._in_flight[key]
+
+  def _asend_cached_query(self, data, deadline=None):
+    key = self.cache.key(data)
+    found, prediction, refresh = self.cache.get(key)
+    if refresh:
+      # serve the stale prediction, and refresh it in the background
+      request = self._asend_query(data, key, background=True)
+      request.add_done_callback(lambda r: self._cache_prediction(key, r))
+
+    if found:
+      # a request completed right away with the cached prediction
+      request = self._send_query_request(data)
+      request.set_rfunc(lambda response: prediction)
+      self._add_client_callback(request)
+      request.set_response(None)
+      return request
+
+    request = self._asend_query(data, key, deadline)
+    request.add_done_callback(lambda r: self._cache_prediction(key, r))
+    return request
+
+  def _cache_prediction(self, key, request):
+    try:
+      prediction = request.get_response()
+    except PredictionIOAPIError:
+      self.cache.refresh_failed(key)
+    else:
+      self.cache.put(key, prediction)
+
+  def _send_query_request(self, data):
     path = "/queries.json"
     request = AsyncRequest("POST", path, **data)
+    request.idempotent = True
     request.set_rfunc(self._aget_resp)
-    self._connection.make_request(request)
     return request
 
   def send_query(self, data):
@@ -516,14 +1069,171 @@ class EngineClient(BaseClient):
     """
     return self.asend_query(data).get_response()
 
+  def asend_queries(self, queries, chunk_size=MAX_BATCH_QUERIES):
+    """Asynchronously send queries in batches.
+    The queries are sent to the batch endpoint of the engine instance,
+    chunk_size queries per request, and the requests are handled
+    concurrently by the threads of the client. The cache of the client is
+    not used.
+    :param queries: an iterable of queries, type dict.
+    :param chunk_size: max number of queries per request (optional).
+      Default value is MAX_BATCH_QUERIES.
+    :returns:
+      list of AsyncRequest objects, one per batch. The get_response() method
+      of each returns the list of the predictions of the queries of the
+      batch, in the same order as the queries.
+    """
+    if chunk_size < 1:
+      raise InvalidArgumentError("chunk_size must be >= 1: %s" % chunk_size)
+
+    requests = []
+    for request in self._send_queries_requests(queries, chunk_size):
+      self._make_request(request)
+      requests.append(request)
+    return requests
+
+  def _send_queries_requests(self, queries, chunk_size):
+    """Generate the batch requests sending the queries.
+    """
+    batch = []
+    for q in queries:
+      batch.append(q)
+      if len(batch) == chunk_size:
+        yield self._send_batch_query_request(batch)
+        batch = []
+
+    if batch:
+      yield self._send_batch_query_request(batch)
+
+  def _send_batch_query_request(self, queries):
+    path = "/batch/queries.json"
+    request = AsyncRequest("POST", path)
+    request.set_body(queries)
+    request.idempotent = True
+    request.items = queries
+    request.set_rfunc(self._aget_batch_resp)
+    return request
+
+  def send_queries(self, queries, chunk_size=MAX_BATCH_QUERIES):
+    """Synchronously (blocking) send queries in batches.
+    (please refer to asend_queries())
+    A failed batch does not fail the others: the exception raised for it is
+    returned in place of the prediction of each of its queries.
+    :returns:
+      list of predictions or PredictionIOAPIError objects, in the same order
+      as the queries.
+    """
+    results = []
+    for request in self.asend_queries(queries, chunk_size):
+      try:
+        results.extend(request.get_response())
+      except PredictionIOAPIError as e:
+        results.extend([e] * len(request.items))
+    return results
+
+class _CompressedFile(object):
+  """Write-only file compressing its content into another file object."""
+
+  def __init__(self, fileobj, compressor):
+    self._file = fileobj
+    self._compressor = compressor
+
+  def write(self, data):
+    self._file.write(self._compressor.compress(data))
+
+  def close(self):
+    self._file.write(self._compressor.flush())
+    self._file.close()
+
+
+def _gzip_compressor():
+  # wbits 16 + MAX_WBITS produces the gzip format
+  return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def _lzma_compressor():
+  import lzma
+  return lzma.LZMACompressor()
+
+
+# compression name: (file name extension, compressor factory)
+_COMPRESSIONS = {
+    "gzip": (".gz", _gzip_compressor),
+    "bz2": (".bz2", bz2.BZ2Compressor),
+    "xz": (".xz", _lzma_compressor),
+    }
+
+
 class FileExporter(object):
   """File exporter to write events to JSON file for batch import
   :param file_name: the destination file name
+  :param compression: "gzip", "bz2" or "xz" to compress the file (optional).
+    Default value is None, which means the compression is chosen from the
+    extension of file_name (".gz", ".bz2" or ".xz"), and no compression for
+    any other extension.
+  :param buffer_size: number of bytes of events buffered in memory before
+    they are written to the file (optional).
+    Default value is 1MB.
+  :param max_events: start a new file after this number of events
+    (optional).
+  :param max_bytes: start a new file after this number of bytes, before
+    compression (optional).
+    When max_events or max_bytes is set, the files are numbered: for
+    file_name "events.json.gz", they are "events-00001.json.gz",
+    "events-00002.json.gz", ... Every file can be given to "pio import" on
+    its own.
   """
-  def __init__(self, file_name):
+  def __init__(self, file_name, compression=None, buffer_size=1 << 20,
+      max_events=None, max_bytes=None):
     """Constructor of Exporter.
     """
-    self._file = open(file_name, 'w')
+    if compression is None:
+      for name, (ext, factory) in _COMPRESSIONS.items():
+        if file_name.endswith(ext):
+          compression = name
+    elif compression not in _COMPRESSIONS:
+      raise InvalidArgumentError("compression must be one of %s: %s" %
+          (sorted(_COMPRESSIONS), compression))
+
+    self.compression = compression
+    self.buffer_size = buffer_size
+    self.max_events = max_events
+    self.max_bytes = max_bytes
+    #: names of the files written so far
+    self.file_names = []
+
+    self._file_name = file_name
+    self._file = None
+    self._buffer = []
+    self._buffered = 0  # bytes in _buffer
+    self._events = 0  # events in the current file
+    self._bytes = 0  # bytes in the current file
+    self._open()
+
+  def _next_file_name(self):
+    if self.max_events is None and self.max_bytes is None:
+      return self._file_name
+    # events.json.gz -> events-00001.json.gz
+    head, tail = os.path.split(self._file_name)
+    stem, dot, ext = tail.partition(".")
+    return os.path.join(head, "%s-%05d%s%s" %
+        (stem, len(self.file_names) + 1, dot, ext))
+
+  def _open(self):
+    file_name = self._next_file_name()
+    self._file = open(file_name, 'wb')
+    if self.compression is not None:
+      self._file = _CompressedFile(self._file,
+          _COMPRESSIONS[self.compression][1]())
+    self.file_names.append(file_name)
+    self._events = 0
+    self._bytes = 0
+
+  def _flush(self):
+    if self._buffer:
+      self._file.write(b"".join(self._buffer))
+      self._buffer = []
+      self._buffered = 0
 
   def create_event(self, event, entity_type, entity_id,
       target_entity_type=None, target_entity_id=None, properties=None,
@@ -531,32 +1241,158 @@ class FileExporter(object):
     """Create an event and write to the file.
     (please refer to EventClient's create_event())
     """
-    data = {
-        "event": event,
-        "entityType": entity_type,
-        "entityId": entity_id,
-        }
-
-    if target_entity_type is not None:
-      data["targetEntityType"] = target_entity_type
-
-    if target_entity_id is not None:
-      data["targetEntityId"] = target_entity_id
-
-    if properties is not None:
-      data["properties"] = properties
-
-    et = event_time_validation(event_time)
-    # EventServer uses milliseconds, but python datetime class uses micro. Hence
-    # need to skip the last three digits.
-    et_str = et.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + et.strftime("%z")
-    data["eventTime"] = et_str
+    data = event_data(event, entity_type, entity_id, target_entity_type,
+        target_entity_id, properties, event_time)
 
     j = json.dumps(data, ensure_ascii=ensure_ascii)
-    self._file.write(j+"\n")
+    line = (j+"\n").encode("utf8")
+
+    if ((self.max_events is not None and self._events >= self.max_events) or
+        (self.max_bytes is not None and self._events > 0 and
+         self._bytes + len(line) > self.max_bytes)):
+      self._flush()
+      self._file.close()
+      self._open()
+
+    self._buffer.append(line)
+    self._buffered += len(line)
+    self._events += 1
+    self._bytes += len(line)
+    if self._buffered >= self.buffer_size:
+      self._flush()
 
   def close(self):
     """Close the FileExporter
     Call this method when you finish writing all events to JSON file
     """
+    self._flush()
     self._file.close()
+
+
+def _shard_file_name(file_name, shard, shards):
+  # events.json.gz -> events-00000-of-00004.json.gz
+  head, tail = os.path.split(file_name)
+  stem, dot, ext = tail.partition(".")
+  return os.path.join(head, "%s-%05d-of-%05d%s%s" %
+      (stem, shard, shards, dot, ext))
+
+
+def _export_shard(file_name, options, shard, shards, events, chunks, results):
+  """Write one shard of a ParallelFileExporter, in a worker process."""
+  try:
+    exporter = FileExporter(_shard_file_name(file_name, shard, shards),
+        **options)
+    if events is not None:
+      for e in events(shard, shards):
+        exporter.create_event(**e)
+    else:
+      for chunk in iter(chunks.get, None):
+        for e in chunk:
+          exporter.create_event(**e)
+    exporter.close()
+    results.put((shard, exporter.file_names, None))
+  except Exception as e:
+    results.put((shard, None, "%s: %s" % (type(e).__name__, e)))
+
+
+class ParallelFileExporter(object):
+  """File exporter writing events to JSON files with several processes, for
+  batch import. Building and serializing the events is spread over the
+  processes, each of them writing its own shard of the events: for
+  file_name "events.json.gz" and 4 processes, the shards are
+  "events-00000-of-00004.json.gz" to "events-00003-of-00004.json.gz".
+  :param file_name: the destination file name
+  :param processes: number of worker processes (optional).
+    Default value is the number of CPUs.
+  :param chunk_size: number of events sent to a worker process at once
+    (optional). Default value is 1000.
+  :param options: other arguments of FileExporter (optional), eg.
+    compression or max_events.
+  """
+  def __init__(self, file_name, processes=None, chunk_size=1000, **options):
+    """Constructor of Exporter.
+    """
+    self.file_name = file_name
+    self.processes = processes or multiprocessing.cpu_count()
+    self.chunk_size = chunk_size
+    self.options = options
+
+  def export(self, events):
+    """Export the events, and wait until all shards are written.
+    :param events: an iterable of events, each of them a dict of the
+      arguments of FileExporter's create_event(). Chunks of chunk_size
+      events are handed to the processes in turn, so the content of every
+      shard only depends on the order of the events.
+      Alternatively, a callable producing the events of each shard:
+      events(shard, shards) is called in every worker process and returns
+      the iterable of events of that shard. It must be picklable, eg. a
+      function defined at module level.
+    :returns:
+      list of the names of the files written, in shard order.
+    """
+    shards = self.processes
+    results = multiprocessing.Queue()
+    producer = events if callable(events) else None
+    workers = []
+    for shard in xrange(shards):
+      chunks = multiprocessing.Queue(4) if producer is None else None
+      p = multiprocessing.Process(target=_export_shard,
+          args=(self.file_name, self.options, shard, shards, producer,
+              chunks, results))
+      p.daemon = True
+      p.start()
+      workers.append((p, chunks))
+
+    if producer is None:
+      chunk = []
+      n = 0
+      for e in events:
+        chunk.append(e)
+        if len(chunk) == self.chunk_size:
+          self._put(workers[n % shards], chunk)
+          chunk = []
+          n += 1
+      if chunk:
+        self._put(workers[n % shards], chunk)
+      for worker in workers:
+        self._put(worker, None)
+
+    file_names = {}
+    errors = []
+    dead = set()
+    while len(file_names) < shards:
+      try:
+        shard, names, error = results.get(True, 1)
+      except Queue.Empty:
+        # a process sends its result before exiting, it may still be on its
+        # way when the process is seen dead, but not one second later
+        died = set(shard for shard, (p, chunks) in enumerate(workers)
+            if shard not in file_names and not p.is_alive())
+        if died & dead:
+          for p, chunks in workers:
+            if p.is_alive():
+              p.terminate()
+          raise PredictionIOAPIError("export process %s died" %
+              workers[min(died & dead)][0].name)
+        dead = died
+        continue
+      if error is not None:
+        errors.append("shard %s: %s" % (shard, error))
+      file_names[shard] = names
+    for p, chunks in workers:
+      p.join()
+    if errors:
+      raise PredictionIOAPIError("export failed: %s" % "; ".join(errors))
+
+    return [name for shard in sorted(file_names)
+        for name in file_names[shard]]
+
+  def _put(self, worker, chunk):
+    p, chunks = worker
+    while True:
+      try:
+        chunks.put(chunk, True, 1)
+        return
+      except Queue.Full:
+        if not p.is_alive():
+          raise PredictionIOAPIError("export process %s died" % p.name)
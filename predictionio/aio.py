@@ -0,0 +1,442 @@
+"""asyncio clients of the PredictionIO Python SDK
+
+AsyncEventClient and AsyncEngineClient are the asyncio counterparts of
+EventClient and EngineClient. Instead of handing requests to connection
+threads, their methods are coroutines which send the requests through a pool
+of non-blocking HTTP/1.1 keep-alive connections, so that a single thread can
+have thousands of requests in flight.
+
+Requires Python 3.5 or later.
+"""
+
+import asyncio
+import ssl
+
+from predictionio import BaseClient
+from predictionio import EngineClient
+from predictionio import EventClient
+from predictionio import InvalidArgumentError
+from predictionio import MAX_BATCH_QUERIES
+from predictionio import _parse_url
+from predictionio.codec import DEFAULT_DECODER
+from predictionio.codec import DEFAULT_ENCODER
+from predictionio.connection import AsyncResponse
+from predictionio.connection import MAX_RETRY
+from predictionio.connection import PredictionIOAPIError
+from predictionio.connection import _encode_request
+
+
+class AsyncHTTPConnectionPool(object):
+    """pool of keep-alive HTTP/1.1 connections to one host
+
+    At most max_connections connections are open at the same time; requests
+    beyond that wait for a connection to be released.
+    """
+
+    def __init__(self, host, https=True, timeout=5, max_connections=10,
+                 encoder=DEFAULT_ENCODER, decoder=DEFAULT_DECODER):
+        """constructor
+
+        Args:
+          host: host of the server, with an optional port (eg. "host:7070")
+          https: indicate it is httpS (True) or http connection (False)
+          timeout: timeout for HTTP connection attempts and requests in
+            seconds
+          max_connections: max number of connections opened to the host
+          encoder: function encoding request bodies to JSON
+          decoder: function decoding JSON response bodies
+        """
+        self.host = host
+        self.https = https
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.encoder = encoder
+        self.decoder = decoder
+        hostname, sep, port = host.rpartition(":")
+        if sep and port.isdigit():
+            self._hostname = hostname
+            self._port = int(port)
+        else:
+            self._hostname = host
+            self._port = 443 if https else 80
+        self._ssl = ssl.create_default_context() if https else None
+        self._idle = []  # (reader, writer) of idle connections
+        self._semaphore = None  # created lazily in the running event loop
+
+    async def request(self, method, url, body=None, headers=None,
+                      resend=True):
+        """send a http request and return its AsyncResponse
+
+        Like PredictionIOHttpConnection.request, errors are stored in the
+        AsyncResponse instead of being raised, and the request is retried on
+        a new connection in case of connection errors.
+
+        Args:
+          method: http method, type str
+          url: url path, type str
+          body: http request body content, type dict or list
+          headers: http request header, type dict
+          resend: if False, the request is not sent again after an error
+            once it may have reached the server
+        """
+        response = AsyncResponse()
+        try:
+            data = _encode_request(method, url, self.host, body, headers,
+                                   self.encoder)
+        except Exception as e:
+            response.set_error(e)
+            return response
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_connections)
+
+        async with self._semaphore:
+            for i in range(MAX_RETRY + 1):
+                conn = None
+                try:
+                    conn = await self._acquire()
+                    result = await asyncio.wait_for(
+                        _send(conn, method, data), self.timeout)
+                except asyncio.CancelledError:
+                    if conn is not None:
+                        conn[1].close()
+                    raise
+                except Exception as e:
+                    if conn is not None:
+                        conn[1].close()
+                    if i == MAX_RETRY or (conn is not None and not resend):
+                        response.set_error(e)
+                        break
+                else:
+                    version, status, reason, resp_headers, resp_body, \
+                        keep_alive = result
+                    if keep_alive:
+                        self._idle.append(conn)
+                    else:
+                        conn[1].close()
+                    response.set_resp(version=version, status=status,
+                                      reason=reason, headers=resp_headers,
+                                      body=resp_body, decoder=self.decoder)
+                    break
+        return response
+
+    async def _acquire(self):
+        while self._idle:
+            reader, writer = self._idle.pop()
+            # the server may have closed an idle connection meanwhile.
+            # NOTE: StreamWriter.is_closing() needs python 3.7
+            try:
+                if (not reader.at_eof() and
+                        not writer.transport.is_closing()):
+                    return reader, writer
+            except Exception:
+                pass
+            writer.close()
+        return await asyncio.wait_for(
+            asyncio.open_connection(self._hostname, self._port,
+                                    ssl=self._ssl),
+            self.timeout)
+
+    def close(self):
+        """close the idle connections of the pool
+        """
+        while self._idle:
+            self._idle.pop()[1].close()
+
+
+async def _send(conn, method, data):
+    """write the request data to the connection and read the response
+
+    Returns (version, status, reason, headers, body, keep_alive).
+    """
+    reader, writer = conn
+    writer.write(data)
+    await writer.drain()
+
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("connection closed by the server")
+    parts = status_line.decode("latin-1").rstrip("\r\n").split(" ", 2)
+    version = 11 if parts[0] == "HTTP/1.1" else 10
+    status = int(parts[1])
+    reason = parts[2] if len(parts) > 2 else ""
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip()] = value.strip()
+    lower = dict((k.lower(), v.lower()) for k, v in headers.items())
+
+    keep_alive = (version == 11 and lower.get("connection") != "close" or
+                  lower.get("connection") == "keep-alive")
+    if method == "HEAD" or status in (204, 304) or 100 <= status < 200:
+        body = b""
+    elif lower.get("transfer-encoding") == "chunked":
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b";")[0], 16)
+            if size == 0:
+                # skip trailers
+                while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                    pass
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+        body = b"".join(chunks)
+    elif "content-length" in lower:
+        body = await reader.readexactly(int(lower["content-length"]))
+    else:
+        body = await reader.read()
+        keep_alive = False
+    return version, status, reason, headers, body, keep_alive
+
+
+class AsyncBaseClient(object):
+    """Base of the asyncio clients.
+
+    The payloads of the requests and the validation of the responses are
+    shared with the threaded clients.
+    """
+
+    _acreate_resp = BaseClient._acreate_resp
+    _aget_resp = BaseClient._aget_resp
+    _acreate_batch_resp = BaseClient._acreate_batch_resp
+    _aget_batch_resp = BaseClient._aget_batch_resp
+    _adelete_resp = BaseClient._adelete_resp
+    _get_status_request = BaseClient._get_status_request
+
+    def __init__(self, url, timeout=5, max_connections=10, encoder=None,
+                 decoder=None, retry=None):
+        self.url = url
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.encoder = encoder or DEFAULT_ENCODER
+        self.decoder = decoder or DEFAULT_DECODER
+        self.retry = retry
+        self.https, self.host = _parse_url(url)
+        self._pool = AsyncHTTPConnectionPool(
+            self.host, https=self.https, timeout=self.timeout,
+            max_connections=self.max_connections, encoder=self.encoder,
+            decoder=self.decoder)
+
+    async def _execute(self, request):
+        """send the AsyncRequest and return the result of its rfunc
+        """
+        method = request.method
+        # the RetryPolicy does not retry the requests which may have reached
+        # the server, nor must the pool
+        resend = self.retry is None or request.idempotent
+        while True:
+            if method == "POST":
+                body = request.params if request.body is None else \
+                    request.body
+                response = await self._pool.request(method, request.path,
+                                                    body, resend=resend)
+            else:
+                response = await self._pool.request(method, request.qpath,
+                                                    resend=resend)
+            delay = None
+            if self.retry is not None:
+                delay = self.retry.delay(request, response)
+            if delay is None:
+                break
+            request.attempts += 1
+            await asyncio.sleep(delay)
+        response.set_request(request)
+        request.set_response(response)
+        return request.get_response()
+
+    def close(self):
+        """Close the idle connections of this client.
+        """
+        self._pool.close()
+
+    async def get_status(self):
+        """Get the status of the PredictionIO API Server
+        :returns:
+          status message.
+        """
+        return await self._execute(self._get_status_request())
+
+
+class AsyncEventClient(AsyncBaseClient):
+    """asyncio client for importing data into PredictionIO Event Server.
+    :param access_key: the access key for your application.
+    :param url: the url of PredictionIO Event Server.
+    :param timeout: timeout for HTTP connection attempts and requests in
+      seconds (optional).
+      Default value is 5.
+    :param channel: channel name (optional)
+    :param max_connections: max number of connections opened to the Event
+      Server (optional).
+      Default value is 10.
+    :param encoder: function encoding request bodies to JSON (optional).
+      (please refer to BaseClient)
+    :param decoder: function decoding JSON response bodies (optional).
+      (please refer to BaseClient)
+    :param retry: RetryPolicy of the failed requests (optional). The delays
+      are awaited without blocking the event loop.
+      (please refer to BaseClient)
+    """
+
+    _create_event_request = EventClient._create_event_request
+    _create_events_requests = EventClient._create_events_requests
+    _create_batch_request = EventClient._create_batch_request
+    _get_event_request = EventClient._get_event_request
+    _get_events_request = EventClient._get_events_request
+    _delete_event_request = EventClient._delete_event_request
+
+    def __init__(self, access_key, url="http://localhost:7070", timeout=5,
+                 channel=None, max_connections=10, encoder=None, decoder=None,
+                 retry=None):
+        super(AsyncEventClient, self).__init__(url, timeout, max_connections,
+                                               encoder, decoder, retry)
+        self.access_key = access_key
+        self.channel = channel
+        # used by the shared request builders, events are never coalesced
+        self.batch_size = 1
+
+    async def create_event(self, event, entity_type, entity_id,
+                           target_entity_type=None, target_entity_id=None,
+                           properties=None, event_time=None):
+        """Create an event.
+        (please refer to EventClient's acreate_event())
+        """
+        return await self._execute(self._create_event_request(
+            event, entity_type, entity_id, target_entity_type,
+            target_entity_id, properties, event_time))
+
+    async def create_events(self, events):
+        """Create events in batches of at most MAX_BATCH_EVENTS events. The
+        batches are sent concurrently.
+        (please refer to EventClient's acreate_events())
+        :returns:
+          list of (event, status) tuples, in the same order as the events.
+        """
+        batches = await asyncio.gather(*[
+            self._execute(r) for r in self._create_events_requests(events)])
+        return [result for batch in batches for result in batch]
+
+    async def get_event(self, event_id):
+        """Get an event from Event Server."""
+        return await self._execute(self._get_event_request(event_id))
+
+    async def get_events(self, startTime=None, untilTime=None,
+                         entityType=None, entityId=None, limit=None,
+                         reversed=False):
+        """Get events from Event Server.
+        (please refer to EventClient's aget_events())
+        """
+        return await self._execute(self._get_events_request(
+            startTime, untilTime, entityType, entityId, limit, reversed))
+
+    async def delete_event(self, event_id):
+        """Delete an event from Event Server."""
+        return await self._execute(self._delete_event_request(event_id))
+
+    # Below are helper functions
+
+    async def set_user(self, uid, properties={}, event_time=None):
+        """Set properties of a user"""
+        return await self.create_event("$set", "user", uid,
+                                       properties=properties,
+                                       event_time=event_time)
+
+    async def unset_user(self, uid, properties, event_time=None):
+        """Unset properties of an user"""
+        return await self.create_event("$unset", "user", uid,
+                                       properties=properties,
+                                       event_time=event_time)
+
+    async def delete_user(self, uid, event_time=None):
+        """Delete a user."""
+        return await self.create_event("$delete", "user", uid,
+                                       event_time=event_time)
+
+    async def set_item(self, iid, properties={}, event_time=None):
+        """Set properties of an item."""
+        return await self.create_event("$set", "item", iid,
+                                       properties=properties,
+                                       event_time=event_time)
+
+    async def unset_item(self, iid, properties={}, event_time=None):
+        """Unset properties of an item."""
+        return await self.create_event("$unset", "item", iid,
+                                       properties=properties,
+                                       event_time=event_time)
+
+    async def delete_item(self, iid, event_time=None):
+        """Delete an item."""
+        return await self.create_event("$delete", "item", iid,
+                                       event_time=event_time)
+
+    async def record_user_action_on_item(self, action, uid, iid,
+                                         properties={}, event_time=None):
+        """Create a user-to-item action."""
+        return await self.create_event(action, "user", uid, "item", iid,
+                                       properties=properties,
+                                       event_time=event_time)
+
+
+class AsyncEngineClient(AsyncBaseClient):
+    """asyncio client for extracting prediction results from an PredictionIO
+    Engine Instance.
+    :param url: the url of the PredictionIO Engine Instance.
+    :param timeout: timeout for HTTP connection attempts and requests in
+      seconds (optional).
+      Default value is 5.
+    :param max_connections: max number of connections opened to the Engine
+      Instance (optional).
+      Default value is 10.
+    :param encoder: function encoding request bodies to JSON (optional).
+      (please refer to BaseClient)
+    :param decoder: function decoding JSON response bodies (optional).
+      (please refer to BaseClient)
+    :param retry: RetryPolicy of the failed requests (optional). The delays
+      are awaited without blocking the event loop.
+      (please refer to BaseClient)
+    """
+
+    _send_query_request = EngineClient._send_query_request
+    _send_queries_requests = EngineClient._send_queries_requests
+    _send_batch_query_request = EngineClient._send_batch_query_request
+
+    def __init__(self, url="http://localhost:8000", timeout=5,
+                 max_connections=10, encoder=None, decoder=None, retry=None):
+        super(AsyncEngineClient, self).__init__(url, timeout, max_connections,
+                                                encoder, decoder, retry)
+
+    async def send_query(self, data):
+        """Send a query to the engine instance.
+        :param data: the query: It is coverted to an json object using
+          json.dumps method. type dict.
+        :returns: the prediction.
+        """
+        return await self._execute(self._send_query_request(data))
+
+    async def send_queries(self, queries, chunk_size=MAX_BATCH_QUERIES):
+        """Send queries in batches of at most chunk_size queries. The batches
+        are sent concurrently.
+        (please refer to EngineClient's send_queries())
+        :returns:
+          list of predictions or PredictionIOAPIError objects, in the same
+          order as the queries.
+        """
+        if chunk_size < 1:
+            raise InvalidArgumentError(
+                "chunk_size must be >= 1: %s" % chunk_size)
+        requests = list(self._send_queries_requests(queries, chunk_size))
+        batches = await asyncio.gather(
+            *[self._execute(r) for r in requests], return_exceptions=True)
+        results = []
+        for request, batch in zip(requests, batches):
+            if isinstance(batch, PredictionIOAPIError):
+                results.extend([batch] * len(request.items))
+            elif isinstance(batch, BaseException):
+                raise batch
+            else:
+                results.extend(batch)
+        return results
@@ -0,0 +1,109 @@
+"""Client-side cache of the predictions of an engine
+
+QueryCache maps queries to the predictions returned for them, so that
+EngineClient can answer repeated queries without a round trip to the
+engine server.
+"""
+
+import json
+import threading
+import time
+
+from collections import OrderedDict
+
+
+class QueryCache(object):
+    """size-bounded cache of predictions with per-entry time-to-live
+
+    The least recently used entries are evicted when the cache is full.
+    An entry expired for less than stale_ttl seconds is still served, while
+    the client refreshes it in the background, so that expiry never adds the
+    latency of a query.
+
+    The cached predictions are shared by all the callers getting them, and
+    must not be modified.
+    """
+
+    def __init__(self, max_size=1024, ttl=60, stale_ttl=0):
+        """constructor
+
+        Args:
+          max_size: max number of cached predictions
+          ttl: time in seconds a prediction is fresh
+          stale_ttl: time in seconds an expired prediction is still served
+            while it is refreshed. 0 means expired predictions are not used.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (prediction, expiry time)
+        self._refreshing = set()  # keys being refreshed
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(query):
+        """canonical serialization of the query, used as cache key"""
+        return json.dumps(query, sort_keys=True, separators=(",", ":"))
+
+    def get(self, key):
+        """look up a prediction
+
+        Returns (found, prediction, refresh). refresh is True if the
+        prediction is stale and the caller should refresh it, by calling
+        put() or refresh_failed() when done.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                prediction, expiry = entry
+                if now < expiry:
+                    self.hits += 1
+                    # mark as most recently used
+                    del self._entries[key]
+                    self._entries[key] = entry
+                    return True, prediction, False
+                if now < expiry + self.stale_ttl:
+                    self.stale_hits += 1
+                    refresh = key not in self._refreshing
+                    self._refreshing.add(key)
+                    return True, prediction, refresh
+                del self._entries[key]
+            self.misses += 1
+            return False, None, False
+
+    def put(self, key, prediction):
+        """cache the prediction of a query"""
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (prediction, time.time() + self.ttl)
+            self._refreshing.discard(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def refresh_failed(self, key):
+        """the refresh of key failed, the next get() may retry it"""
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def invalidate(self, query=None):
+        """remove the prediction of the query, or all predictions if query is
+        None"""
+        with self._lock:
+            if query is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(self.key(query), None)
+
+    def stats(self):
+        """return a dict of the size and hit/miss counters of the cache"""
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,62 @@
+"""JSON codecs for the bodies of the requests and responses
+
+A codec is a pair of functions: an encoder, turning a dict or a list into a
+JSON str or bytes, and a decoder, turning the bytes of a response body into
+a dict or a list. orjson and ujson are used when installed, as they are much
+faster than the json module of the standard library.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def json_encode(obj):
+    return json.dumps(obj)
+
+
+def json_decode(data):
+    if isinstance(data, bytes):
+        data = data.decode("utf8")
+    return json.loads(data)
+
+
+def orjson_encode(obj):
+    try:
+        # non-str keys are converted to str, like json does
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+    except TypeError:
+        # what orjson does not support, eg. ints beyond 64 bits
+        return json.dumps(obj)
+
+
+CODECS = {"json": (json_encode, json_decode)}
+if ujson is not None:
+    CODECS["ujson"] = (ujson.dumps, ujson.loads)
+if orjson is not None:
+    CODECS["orjson"] = (orjson_encode, orjson.loads)
+
+
+def get_codec(name=None):
+    """return the (encoder, decoder) functions of a JSON library
+
+    Args:
+      name: "orjson", "ujson" or "json". None means the fastest one
+        installed.
+    """
+    if name is None:
+        for name in ("orjson", "ujson", "json"):
+            if name in CODECS:
+                break
+    return CODECS[name]
+
+
+DEFAULT_ENCODER, DEFAULT_DECODER = get_codec()
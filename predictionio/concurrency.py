@@ -0,0 +1,123 @@
+"""Adaptive number of connection threads
+
+AdaptiveConcurrency resizes the connection_worker threads of a Connection
+to the load of the server, instead of using a fixed number of threads: it
+adds a thread while requests wait in the queue and the latency is normal,
+and removes threads multiplicatively (AIMD) when the latency rises above its
+baseline or requests fail, ie. when the server is overloaded.
+"""
+
+import threading
+
+
+class AdaptiveConcurrency(object):
+    """AIMD controller of the number of threads of a Connection
+
+    Every interval seconds, the limit (number of threads) is updated from
+    the requests completed meanwhile:
+
+    - errors (connection errors, 429 and 5xx statuses) or a mean latency
+      above tolerance times the baseline latency: limit * backoff
+    - requests waiting in the queue: limit + 1
+    - no request at all: limit - 1
+
+    The baseline latency is the lowest mean latency observed, slowly
+    forgotten so that it follows lasting changes of the server.
+    """
+
+    def __init__(self, min_threads=1, max_threads=16, interval=1.0,
+                 tolerance=2.0, backoff=0.75):
+        """constructor
+
+        Args:
+          min_threads: min number of threads, and initial limit
+          max_threads: max number of threads
+          interval: time in seconds between updates of the limit
+          tolerance: ratio of the mean latency to the baseline latency above
+            which the server is considered overloaded
+          backoff: factor applied to the limit when the server is
+            overloaded
+        """
+        if not 1 <= min_threads <= max_threads:
+            raise ValueError("expected 1 <= min_threads <= max_threads: "
+                             "%s, %s" % (min_threads, max_threads))
+        self.min_threads = min_threads
+        self.max_threads = max_threads
+        self.interval = interval
+        self.tolerance = tolerance
+        self.backoff = backoff
+        #: current number of threads
+        self.limit = min_threads
+        self._lock = threading.Lock()
+        self._latency = 0.0  # sum of the latencies since the last update
+        self._samples = 0
+        self._errors = 0
+        self._baseline = None
+        self._connection = None
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def sample(self, latency, requests):
+        """record the latency in seconds of requests sent together
+
+        Called by the connection_worker threads.
+        """
+        errors = 0
+        for request in requests:
+            response = request._raw_response
+            if response is not None and (
+                    response.error is not None or response.status == 429 or
+                    response.status >= 500):
+                errors += 1
+        with self._lock:
+            self._latency += latency
+            self._samples += 1
+            self._errors += errors
+
+    def update(self, queue_depth):
+        """compute the new limit from the samples recorded since the last
+        update and the number of requests waiting in the queue
+        """
+        with self._lock:
+            latency, samples, errors = self._latency, self._samples, \
+                self._errors
+            self._latency, self._samples, self._errors = 0.0, 0, 0
+
+        limit = self.limit
+        if samples:
+            mean = latency / samples
+            if self._baseline is None or mean < self._baseline:
+                self._baseline = mean
+            else:
+                self._baseline *= 1.01
+            if errors or mean > self._baseline * self.tolerance:
+                limit = int(limit * self.backoff)
+            elif queue_depth > 0:
+                limit += 1
+        elif queue_depth == 0:
+            limit -= 1
+        self.limit = max(self.min_threads, min(self.max_threads, limit))
+        return self.limit
+
+    def start(self, connection):
+        """start controlling the threads of the Connection
+        """
+        self._connection = connection
+        connection.resize(self.limit)
+        self._thread = threading.Thread(target=self._run,
+                                        name="PredictionIOConcurrency")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """stop resizing the Connection
+        """
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            limit = self.update(self._connection.pending_requests())
+            if limit != self._connection.threads:
+                self._connection.resize(limit)
@@ -18,9 +18,31 @@ except ImportError:
     # pylint: disable=F0401,E0611
     from urllib.parse import urlencode
 
+try:
+    from concurrent.futures import Future
+    from concurrent.futures import TimeoutError
+except ImportError:
+    # python 2 without the futures package
+    Future = None
+
+    class TimeoutError(Exception):
+        pass
+
 import datetime
-import json
+import heapq
 import logging
+import random
+import select
+import time
+import weakref
+
+from email.utils import mktime_tz
+from email.utils import parsedate_tz
+
+from predictionio.codec import DEFAULT_DECODER
+from predictionio.codec import DEFAULT_ENCODER
+from predictionio.metrics import Metrics
+from predictionio import tracing
 
 # use generators for python2 and python3
 try:
@@ -31,29 +53,65 @@ except NameError:
 # some constants
 MAX_RETRY = 1  # 0 means no retry
 
+# return_when values of wait(), as in concurrent.futures
+FIRST_COMPLETED = "FIRST_COMPLETED"
+FIRST_EXCEPTION = "FIRST_EXCEPTION"
+ALL_COMPLETED = "ALL_COMPLETED"
+
+# timeout of the blocking calls which must not block forever. Larger
+# timeouts overflow on some platforms, eg. windows.
+_MAX_TIMEOUT = min(1e9, getattr(threading, "TIMEOUT_MAX", 1e9))
+
 
 # logger
 logger = None
 DEBUG_LOG = False
+LOG_BODY_SIZE = 200  # max number of bytes of a body in the debug log
+_log_handler = None
 
 
 def enable_log(filename=None):
+    """write the debug log of the predictionio loggers to a file. Other
+    loggers, eg. the root logger, are not changed.
+    """
     global logger
     global DEBUG_LOG
+    global _log_handler
     timestamp = datetime.datetime.today()
     if not filename:
         logfile = "./log/predictionio_%s.log" % timestamp.strftime(
             "%Y-%m-%d_%H:%M:%S.%f")
     else:
         logfile = filename
-    logging.basicConfig(filename=logfile,
-                        filemode='w',
-                        level=logging.DEBUG,
-                        format='[%(levelname)s] %(name)s (%(threadName)s) %(message)s')
+    handler = logging.FileHandler(logfile, mode='w')
+    handler.setFormatter(logging.Formatter(
+        '[%(levelname)s] %(name)s (%(threadName)s) %(message)s'))
+    package_logger = logging.getLogger("predictionio")
+    if _log_handler is not None:
+        package_logger.removeHandler(_log_handler)
+        _log_handler.close()
+    package_logger.addHandler(handler)
+    package_logger.setLevel(logging.DEBUG)
+    _log_handler = handler
     logger = logging.getLogger(__name__)
     DEBUG_LOG = True
 
 
+def _truncate(body):
+    """return the beginning of a body for the debug log"""
+    if body and len(body) > LOG_BODY_SIZE:
+        return "%r... (%d bytes)" % (body[:LOG_BODY_SIZE], len(body))
+    return body
+
+
+def _summary(response):
+    """return a short description of an AsyncResponse for the debug
+    log"""
+    if response.error is not None:
+        return "e:%r" % (response.error,)
+    return "s:%s b:%s" % (response.status, _truncate(response.body))
+
+
 class PredictionIOAPIError(Exception):
     pass
 
@@ -66,23 +124,186 @@ class ProgramError(PredictionIOAPIError):
     pass
 
 
+class RateLimitExceededError(PredictionIOAPIError):
+    pass
+
+
+class DeadlineExceededError(PredictionIOAPIError):
+    pass
+
+
+class RequestCancelledError(PredictionIOAPIError):
+    pass
+
+
+_callbacks_lock = threading.Lock()
+
+
+def _call_callback(func, request):
+    try:
+        func(request)
+    except Exception:
+        # logged whether enable_log() was called or not, like the errors of
+        # the callbacks of concurrent.futures
+        logging.getLogger(__name__).exception(
+            "callback %s of request %s failed", func, request)
+
+
+def _call_tracer(request, stage, timestamp, start=None):
+    try:
+        request.tracer.stage(request, stage, timestamp, start)
+    except Exception:
+        # a failing tracer must not fail the request, nor kill the thread
+        logging.getLogger(__name__).exception(
+            "tracer %s failed at stage %s of request %s", request.tracer,
+            stage, request)
+
+
+def _retry_after(headers):
+    """return the delay in seconds of the Retry-After header, or None
+    """
+    for name, value in (headers or {}).items():
+        if name.lower() != "retry-after":
+            continue
+        value = value.strip()
+        if value.isdigit():
+            return int(value)
+        date = parsedate_tz(value)
+        if date is not None:
+            return max(mktime_tz(date) - time.time(), 0)
+    return None
+
+
+class RetryPolicy(object):
+    """when to send a failed request again, and after how long
+
+    A request is sent again if its response has one of the retry_statuses,
+    or if the http request failed (eg. connection refused, timeout) and the
+    request is idempotent: a failed POST may have been handled by the server,
+    and sending it again could create an event twice. For the same reason,
+    the connections do not send such a request again right away once it may
+    have reached the server, as they do without a RetryPolicy.
+
+    The n-th retry waits backoff * 2 ** (n - 1) seconds, at most
+    max_backoff, of which a random fraction jitter is removed so that the
+    clients of a recovering server do not retry all at the same time. A
+    longer Retry-After header of the response is honored.
+    """
+
+    def __init__(self, max_attempts=3, backoff=0.1, max_backoff=10,
+                 jitter=1.0, retry_statuses=(429, 503), deadline=None):
+        """constructor
+
+        Args:
+          max_attempts: max number of times a request is sent
+          backoff: delay in seconds before the first retry
+          max_backoff: max delay in seconds before a retry
+          jitter: fraction of the delay randomly removed, between 0 and 1
+          retry_statuses: http statuses of the responses to retry
+          deadline: max time in seconds from the creation of a request to
+            its last retry. None means no limit.
+        """
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.retry_statuses = frozenset(retry_statuses)
+        self.deadline = deadline
+
+    def delay(self, request, response):
+        """return the time in seconds to wait before sending the request
+        again, or None if its response is final
+        """
+        if request.attempts >= self.max_attempts:
+            return None
+        if response.error is not None:
+            if not request.idempotent:
+                return None
+        elif response.status not in self.retry_statuses:
+            return None
+
+        delay = min(self.backoff * 2 ** (request.attempts - 1),
+                    self.max_backoff)
+        delay -= delay * self.jitter * random.random()
+        retry_after = _retry_after(response.headers)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        if (self.deadline is not None and
+                time.time() + delay - request.created > self.deadline):
+            return None
+        if (request.deadline is not None and
+                time.time() + delay > request.deadline):
+            return None
+        return delay
+
+
 class AsyncRequest(object):
     """AsyncRequest object
 
     """
 
+    # no __dict__: millions of requests may be in flight
+    __slots__ = ("method", "path", "params", "body", "batch_path", "items",
+                 "idempotent", "created", "queued", "attempts", "deadline",
+                 "compact", "sampled", "tracer", "trace_context", "rfunc",
+                 "_sending",
+                 "_done", "_raw_response", "_qpath", "_resolved",
+                 "_response", "_exception", "_callbacks")
+
     def __init__(self, method, path, **params):
         self.method = method  # "GET" "POST" etc
         # the sub path eg. POST /v1/users.json  GET /v1/users/1.json
         self.path = path
         # dictionary format eg. {"appkey" : 123, "id" : 3}
         self.params = params
-        # use queue to implement response, store AsyncResponse object
-        self.response_q = Queue.Queue(1)
-        self.qpath = "%s?%s" % (self.path, urlencode(self.params))
+        # request body overriding params (eg. a list for the batch endpoints)
+        self.body = None
+        # path of the batch endpoint this POST request may be coalesced into
+        # by the connection workers. None if it cannot be batched.
+        self.batch_path = None
+        # events or queries of a batch request, matching the items of its
+        # response
+        self.items = None
+        # sending the request twice has the same effect as sending it once
+        self.idempotent = method in ("GET", "DELETE")
+        self.created = time.time()
+        self.queued = self.created  # last time it was put into a queue
+        self.attempts = 1  # number of times the request was sent
+        # time after which the request is not sent any more. None means never
+        self.deadline = None
+        # apply rfunc as soon as the response is set, then drop the body and
+        # headers of the response
+        self.compact = False
+        # the RequestLog of the connection may log the successful response.
+        # False for the requests the application did not make itself
+        self.sampled = True
+        # taken by a worker to be sent, it cannot be cancelled any more
+        self._sending = False
+        # Tracer reporting the stages of the request, if any
+        self.tracer = None
+        # data of the tracer, eg. a span
+        self.trace_context = None
+        # set once the AsyncResponse object is stored in _raw_response
+        self._done = False
+        self._raw_response = None
+        self._qpath = None
+        self._resolved = False  # rfunc was applied to the response
         self._response = None
+        self._exception = None
         # response function to be called to handle the response
         self.rfunc = None
+        # functions called with this request once its response is set, None
+        # if there is none
+        self._callbacks = None
+
+    @property
+    def qpath(self):
+        """path with the params as query string, built on first use since
+        POST requests do not use it
+        """
+        if self._qpath is None:
+            self._qpath = "%s?%s" % (self.path, urlencode(self.params))
+        return self._qpath
 
     def __str__(self):
         return "%s %s %s %s" % (self.method, self.path, self.params,
@@ -91,27 +312,270 @@ class AsyncRequest(object):
     def set_rfunc(self, func):
         self.rfunc = func
 
+    def set_body(self, body):
+        """Send body instead of params as the content of a POST request.
+        """
+        self.body = body
+
+    def set_deadline(self, timeout):
+        """Do not send the request if it is still queued after timeout
+        seconds. It then fails with a DeadlineExceededError as its response
+        error. None means no deadline.
+        """
+        self.deadline = None if timeout is None else time.time() + timeout
+
     def set_response(self, response):
         """ store the response
 
-        NOTE: Must be only called once
+        Ignored if the request is already complete, eg. cancelled. If the
+        request is compact, rfunc is applied right away, and the body and
+        headers of the response are dropped.
+        """
+        with _callbacks_lock:
+            if self._done:
+                return
+            self._raw_response = response
+            if not self.compact:
+                self._done = True
+                callbacks, self._callbacks = self._callbacks, None
+        if self.compact:
+            # resolved before get_response() can see the response
+            self._resolve()
+            self._compact()
+            with _callbacks_lock:
+                self._done = True
+                callbacks, self._callbacks = self._callbacks, None
+        if self.tracer is not None:
+            _call_tracer(self, tracing.DELIVERED, time.time())
+        for func in callbacks or ():
+            _call_callback(func, self)
+
+    def add_done_callback(self, func):
+        """Call func with this request once its response is set, in the
+        thread setting the response, or right away if it is already set.
         """
-        self.response_q.put(response)
+        with _callbacks_lock:
+            if not self._done:
+                if self._callbacks is None:
+                    self._callbacks = []
+                self._callbacks.append(func)
+                return
+        _call_callback(func, self)
+
+    def _wait(self, timeout=None):
+        """wait until the response is set. Returns False after timeout
+        seconds without response.
+        """
+        event = threading.Event()  # only the waiting requests need one
+
+        def wake(request):
+            event.set()
+
+        self.add_done_callback(wake)
+        if event.wait(timeout):
+            return True
+        with _callbacks_lock:
+            if self._done:
+                return True
+            self._callbacks.remove(wake)
+        return False
+
+    def follow(self, request):
+        """Complete this request with the response of another request once
+        it is set, instead of sending this one, eg. to share one http request
+        between identical requests.
+        """
+        def complete(request):
+            response = request._raw_response
+            if request.cancelled():
+                response = AsyncResponse()
+                response.set_error(RequestCancelledError(
+                    "shared request cancelled"))
+                response.set_request(self)
+            self.set_response(response)
+
+        request.add_done_callback(complete)
+
+    def done(self):
+        """Return True if the response is set, ie. get_response() does not
+        block.
+        """
+        return self._done
 
-    def get_response(self):
+    def cancel(self):
+        """Cancel the request if it is not being sent yet: it will not be
+        sent, and get_response() raises RequestCancelledError.
+
+        :returns: True if the request was cancelled.
+        """
+        with _callbacks_lock:
+            if self._sending or self._done:
+                return False
+            self._sending = True  # no worker takes it any more
+            self._exception = RequestCancelledError("request cancelled: %s" %
+                                                    self)
+            self._resolved = True
+        self.set_response(None)
+        return True
+
+    def cancelled(self):
+        """Return True if the request was cancelled.
+        """
+        return isinstance(self._exception, RequestCancelledError)
+
+    def _claim(self):
+        """take the request to send it. Returns False if it must not be sent
+        because it is cancelled or its deadline is exceeded, in which case
+        its response is set.
+        """
+        with _callbacks_lock:
+            # a cancelled request is taken before its response is set
+            if self._done or self._sending:
+                return False
+            self._sending = True
+        if self.deadline is not None and time.time() > self.deadline:
+            response = AsyncResponse()
+            response.set_error(DeadlineExceededError(
+                "deadline exceeded, request not sent"))
+            response.set_request(self)
+            self.set_response(response)
+            return False
+        return True
+
+    def _release(self):
+        """give the request back, eg. to wait for a retry. It can be
+        cancelled again.
+        """
+        with _callbacks_lock:
+            self._sending = False
+
+    def get_response(self, timeout=None):
         """Get the response. Blocking.
 
+        :param timeout: max number of seconds to wait for the response.
+          None means no limit.
         :returns: self.rfunc's return type.
+        :raises: the exception raised by self.rfunc, every time it is called.
+          TimeoutError if the response is not set after timeout seconds.
         """
-        if self._response is None:
-            tmp_response = self.response_q.get(True)  # NOTE: blocking
-            if self.rfunc is None:
-                self._response = tmp_response
-            else:
-                self._response = self.rfunc(tmp_response)
-
+        if not self._resolved:
+            if not self._done and not self._wait(timeout):  # NOTE: blocking
+                raise TimeoutError("no response after %s seconds for "
+                                   "request %s" % (timeout, self))
+            self._resolve()
+
+        if self._exception is not None:
+            raise self._exception
         return self._response
 
+    def _resolve(self):
+        """apply rfunc to the response, once"""
+        if self._resolved:
+            return
+        if self.rfunc is None:
+            self._response = self._raw_response
+        else:
+            try:
+                self._response = self.rfunc(self._raw_response)
+            except Exception as e:
+                self._exception = e
+        self._resolved = True
+
+    def _compact(self):
+        """drop the body and headers of the response, keeping its decoded
+        body, which may be the result or be used by followers
+        """
+        response = self._raw_response
+        if response is None:
+            return
+        response.json_body  # decoded before the body is dropped
+        response.body = None
+        response.headers = None
+
+    # the interface of concurrent.futures.Future
+    result = get_response
+
+    def exception(self, timeout=None):
+        """Return the exception raised by get_response(), or None.
+        Blocking, like get_response().
+        """
+        try:
+            self.get_response(timeout)
+        except TimeoutError:
+            raise
+        except Exception as e:
+            return e
+        return None
+
+    def as_future(self):
+        """Return a concurrent.futures.Future resolved with the result of
+        this request, eg. to use it with asyncio.wrap_future().
+        """
+        if Future is None:
+            raise ProgramError("concurrent.futures is not available")
+        future = Future()
+        future.set_running_or_notify_cancel()
+
+        def resolve(request):
+            try:
+                future.set_result(request.get_response())
+            except Exception as e:
+                future.set_exception(e)
+
+        self.add_done_callback(resolve)
+        return future
+
+
+def as_completed(requests, timeout=None):
+    """Generate the AsyncRequest objects of requests as they complete.
+
+    :param requests: iterable of AsyncRequest objects
+    :param timeout: max number of seconds to wait for all of them. None
+      means no limit.
+    :raises: TimeoutError if they do not all complete in time.
+    """
+    requests = set(requests)
+    end = None if timeout is None else time.time() + timeout
+    completed = Queue.Queue()
+    for request in requests:
+        request.add_done_callback(completed.put)
+    for _ in xrange(len(requests)):
+        try:
+            if end is None:
+                # a blocking get() without timeout ignores KeyboardInterrupt
+                # on python 2
+                request = completed.get(True, _MAX_TIMEOUT)
+            else:
+                request = completed.get(True, max(end - time.time(), 0))
+        except Queue.Empty:
+            raise TimeoutError("%d requests not completed after %s seconds"
+                               % (len(requests), timeout))
+        requests.discard(request)
+        yield request
+
+
+def wait(requests, timeout=None, return_when=ALL_COMPLETED):
+    """Wait for AsyncRequest objects to complete, like
+    concurrent.futures.wait().
+
+    :param requests: iterable of AsyncRequest objects
+    :param timeout: max number of seconds to wait. None means no limit.
+    :param return_when: FIRST_COMPLETED, FIRST_EXCEPTION or ALL_COMPLETED.
+    :returns: (done, not_done) sets of requests.
+    """
+    requests = set(requests)
+    try:
+        for request in as_completed(requests, timeout):
+            if return_when == FIRST_COMPLETED:
+                break
+            if (return_when == FIRST_EXCEPTION and
+                    request.exception() is not None):
+                break
+    except TimeoutError:
+        pass
+    done = set(r for r in requests if r.done())
+    return done, requests - done
+
 
 class AsyncResponse(object):
     """Store the response of asynchronous request
@@ -121,6 +585,9 @@ class AsyncResponse(object):
     If error is None, then should check if the status is expected.
     """
 
+    __slots__ = ("error", "version", "status", "reason", "headers", "body",
+                 "_json_body", "_decoder", "request")
+
     def __init__(self):
         #: exception object if any happens
         self.error = None
@@ -132,8 +599,9 @@ class AsyncResponse(object):
         self.headers = None
         #: Response body. str
         self.body = None
-        #: Jsonified response body. Remains None if conversion is unsuccessful.
-        self.json_body = None
+        # decoded body, see json_body
+        self._json_body = None
+        self._decoder = None
         #: Point back to the AsyncRequest object
         self.request = None
 
@@ -142,70 +610,142 @@ class AsyncResponse(object):
                                                   self.status, self.reason,
                                                   self.headers, self.body)
 
-    def set_resp(self, version, status, reason, headers, body):
+    @property
+    def json_body(self):
+        """Jsonified response body. None if conversion is unsuccessful.
+
+        The body is only decoded when json_body is first accessed.
+        """
+        if self._decoder is not None:
+            decoder = self._decoder
+            self._decoder = None
+            start = time.time()
+            try:
+                self._json_body = decoder(self.body)
+            except ValueError:
+                self._json_body = None
+            request = self.request
+            if request is not None and request.tracer is not None:
+                _call_tracer(request, tracing.JSON_DECODED, time.time(),
+                             start)
+        return self._json_body
+
+    @json_body.setter
+    def json_body(self, json_body):
+        self._decoder = None
+        self._json_body = json_body
+
+    def set_resp(self, version, status, reason, headers, body,
+                 decoder=DEFAULT_DECODER):
         self.version = version
         self.status = status
         self.reason = reason
         self.headers = headers
         self.body = body
-        # Try to extract the json.
-        try:
-            self.json_body = json.loads(body)
-        except ValueError as ex:  # noqa
-            self.json_body = None
+        # json_body is extracted with decoder when needed
+        self._decoder = decoder
+        self._json_body = None
 
     def set_error(self, error):
         self.error = error
 
-class AsyncResponse(object):
-  """Store the response of asynchronous request
-
-  When get the response, user should check if error is None (which means no
-  Exception happens).
-  If error is None, then should check if the status is expected.
-  """
-
-  def __init__(self):
-    #: exception object if any happens
-    self.error = None
-
-    self.version = None
-    self.status = None
-    self.reason = None
-    #: Response header. str
-    self.headers = None
-    #: Response body. str
-    self.body = None
-    #: Jsonified response body. Remains None if conversion is unsuccessful.
-    self.json_body = None
-    #: Point back to the AsyncRequest object
-    self.request = None  
-
-  def __str__(self):
-    return "e:%s v:%s s:%s r:%s h:%s b:%s" % (self.error, self.version,
-                          self.status, self.reason,
-                          self.headers, self.body)
-
-  def set_resp(self, version, status, reason, headers, body):
-    self.version = version
-    self.status = status
-    self.reason = reason
-    self.headers = headers
-    self.body = body
-    # Try to extract the json.
-    try:
-      self.json_body = json.loads(body.decode('utf8'))
-    except ValueError as ex:
-      self.json_body = None
+    def set_request(self, request):
+        self.request = request
+
+    def copy(self, request):
+        """Return a copy of this response for another request.
+        """
+        response = AsyncResponse()
+        response.error = self.error
+        response.version = self.version
+        response.status = self.status
+        response.reason = self.reason
+        response.headers = self.headers
+        response.body = self.body
+        response.json_body = self.json_body
+        response.request = request
+        return response
+
+
+def _encode_body(body, encoder=DEFAULT_ENCODER):
+    """encode the body of a request to JSON bytes, unless it already is"""
+    if isinstance(body, bytes):
+        return body
+    enc_body = encoder(body)
+    if not isinstance(enc_body, bytes):
+        enc_body = enc_body.encode("utf8")
+    return enc_body
+
+
+def _encode_request(method, url, host, body=None, headers=None,
+                    encoder=DEFAULT_ENCODER):
+    """serialize a http/1.1 request, for sending it on a raw socket
+
+    Returns the request as bytes.
+    """
+    mod_headers = dict(headers or {})  # copy the headers
+    mod_headers["Host"] = host
+    mod_headers["Accept-Encoding"] = "identity"
+    mod_headers["Connection"] = "keep-alive"
+    enc_body = b""
+    if body:  # if body is not empty
+        enc_body = _encode_body(body, encoder)
+        mod_headers["Content-type"] = "application/json"
+    if enc_body or method == "POST":
+        mod_headers["Content-Length"] = str(len(enc_body))
+    lines = ["%s %s HTTP/1.1" % (method, url)]
+    lines.extend("%s: %s" % kv for kv in mod_headers.items())
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + enc_body
+
+
+class _SharedFile(object):
+    """socket stand-in handing the same buffered file to every HTTPResponse
+    reading from it, so that the data buffered while reading one pipelined
+    response is not lost for the next one
+    """
 
-  def set_error(self, error):
-    self.error = error
+    def __init__(self, fp):
+        self._fp = fp
+
+    def makefile(self, *args, **kwargs):
+        return self
+
+    def close(self):
+        # NOTE: HTTPResponse closes its file once the body is read
+        pass
+
+    def __getattr__(self, name):
+        return getattr(self._fp, name)
+
+
+def _dropped(sock):
+    """return True if the idle connection of sock cannot be used any more,
+    ie. the server closed it or sent unexpected data on it
+    """
+    if sock.fileno() < 0:
+        return True
+    if hasattr(select, "poll"):
+        # unlike select(), not limited to the file descriptors < 1024
+        poller = select.poll()
+        poller.register(sock, select.POLLIN | select.POLLHUP)
+        return bool(poller.poll(0))
+    try:
+        return bool(select.select([sock], [], [], 0)[0])
+    except ValueError:
+        # its file descriptor is too large for select(): it may be fine
+        return False
+    except (select.error, OSError):
+        return True
 
-  def set_request(self, request):
-    self.request = request
 
 class PredictionIOHttpConnection(object):
-    def __init__(self, host, https=True, timeout=5):
+    def __init__(self, host, https=True, timeout=5, encoder=DEFAULT_ENCODER,
+                 decoder=DEFAULT_DECODER):
+        self.host = host
+        self.encoder = encoder
+        self.decoder = decoder
+        self.metrics = None  # Metrics recording the requests, if any
+        self.request_log = None  # RequestLog of the requests, if any
         if https:  # https connection
             self._connection = httplib.HTTPSConnection(host, timeout=timeout)
         else:
@@ -217,7 +757,33 @@ class PredictionIOHttpConnection(object):
     def close(self):
         self._connection.close()
 
-    def request(self, method, url, body={}, headers={}):
+    def _connect(self, trace=None):
+        """open the http connection, reporting its connect_start,
+        connect_end and, for https, tls_done stages to trace, if any
+        """
+        connection = self._connection
+        if trace is None:
+            connection.connect()
+            return
+        trace(tracing.CONNECT_START)
+        context = getattr(connection, "_context", None)
+        if context is None:
+            # http, or an https connection whose TLS handshake cannot be
+            # told apart from the TCP connection
+            connection.connect()
+            trace(tracing.CONNECT_END)
+            return
+        # what HTTPSConnection.connect() does, in two steps
+        httplib.HTTPConnection.connect(connection)
+        trace(tracing.CONNECT_END)
+        server_hostname = (getattr(connection, "_tunnel_host", None) or
+                           connection.host)
+        connection.sock = context.wrap_socket(
+            connection.sock, server_hostname=server_hostname)
+        trace(tracing.TLS_DONE)
+
+    def request(self, method, url, body={}, headers={}, trace=None,
+                resend=True, sampled=True):
         """
         http request wrapper function, with retry capability in case of error.
         catch error exception and store it in AsyncResponse object
@@ -226,8 +792,16 @@ class PredictionIOHttpConnection(object):
         Args:
           method: http method, type str
           url: url path, type str
-          body: http request body content, type dict
+          body: http request body content, type dict, or bytes if it is
+            already encoded
           header: http request header , type dict
+          trace: function called with the tracing stages of the request, if
+            it is traced
+          resend: if False, the request is not sent again after an error
+            once it may have reached the server, eg. a POST creating an
+            event. It is still sent again if the connection failed.
+          sampled: if False, the request log only logs the request if it
+            failed
         """
 
         response = AsyncResponse()
@@ -242,7 +816,7 @@ class PredictionIOHttpConnection(object):
                 # enc_body = urlencode(body)
                 # mod_headers[
                 # "Content-type"] = "application/x-www-form-urlencoded"
-                enc_body = json.dumps(body)
+                enc_body = _encode_body(body, self.encoder)
                 mod_headers[
                     "Content-type"] = "application/json"
                 # mod_headers["Accept"] = "text/plain"
@@ -251,32 +825,46 @@ class PredictionIOHttpConnection(object):
             return response
 
         if DEBUG_LOG:
-            logger.debug("Request m:%s u:%s h:%s b:%s", method, url,
-                         mod_headers, enc_body)
+            logger.debug("Request m:%s u:%s b:%s", method, url,
+                         _truncate(enc_body))
+        start = time.time()
         # retry loop
         for i in xrange(retry_limit + 1):
+            written = False
             try:
                 if i != 0:
                     if DEBUG_LOG:
                         logger.debug("retry request %s times" % i)
+                sock = self._connection.sock
+                if sock is not None and not resend and _dropped(sock):
+                    # not sent on a connection closed by the server, since
+                    # it could not be sent again
+                    self._connection.close()
                 if self._connection.sock is None:
-                    self._connection.connect()
+                    self._connect(trace)
+                written = True
                 self._connection.request(method, url, enc_body, mod_headers)
+                if trace is not None:
+                    trace(tracing.REQUEST_SENT)
             except Exception as e:
                 self._connection.close()
-                if i == retry_limit:
+                if i == retry_limit or (written and not resend):
                     # new copy of e created everytime??
                     response.set_error(e)
+                    break
             else:  # NOTE: this is try's else clause
                 # connect() and request() OK
                 try:
                     resp = self._connection.getresponse()
                 except Exception as e:
                     self._connection.close()
-                    if i == retry_limit:
+                    if i == retry_limit or not resend:
                         response.set_error(e)
+                        break
                 else:  # NOTE: this is try's else clause
                     # getresponse() OK
+                    if trace is not None:
+                        trace(tracing.FIRST_BYTE)
                     resp_version = resp.version  # int
                     resp_status = resp.status  # int
                     resp_reason = resp.reason  # str
@@ -286,17 +874,506 @@ class PredictionIOHttpConnection(object):
                     # NOTE: have to read the response before sending out next
                     # http request
                     resp_body = resp.read()  # str
+                    if trace is not None:
+                        trace(tracing.BODY_READ)
                     response.set_resp(version=resp_version, status=resp_status,
                                       reason=resp_reason, headers=resp_headers,
-                                      body=resp_body)
+                                      body=resp_body, decoder=self.decoder)
                     break  # exit retry loop
         # end of retry loop
+        if self.metrics is not None:
+            self.metrics.record_exchange(
+                url, time.time() - start,
+                len(url) + (len(enc_body) if enc_body else 0), response)
+        if self.request_log is not None:
+            self.request_log.log(method, url, time.time() - start, response,
+                                 sampled)
         if DEBUG_LOG:
-            logger.debug("Response %s", response)
+            logger.debug("Response %s", _summary(response))
         return response  # AsyncResponse object
 
+    def pipeline_request(self, requests, trace=None, resend=None,
+                         sampled=None):
+        """
+        http/1.1 pipelining: write all requests back-to-back on the connection
+        and then read their responses in order.
+        If the connection drops, or the server closes it, before all responses
+        are read, the unacknowledged requests are sent again on a new
+        connection. Like request(), errors are retried at most MAX_RETRY
+        times, and stored in the AsyncResponse objects.
+        return list of AsyncResponse objects, in the order of requests
+
+        Args:
+          requests: list of (method, url, body) tuples. The bodies may be
+            already encoded, as bytes.
+          trace: function called with the tracing stages of the requests,
+            and the index of the request for the stages of a response, if
+            they are traced
+          resend: list of booleans, False for the requests which must not be
+            sent again once they may have reached the server (please refer
+            to request()). None means they all may be sent again.
+          sampled: list of booleans, False for the requests the request log
+            only logs if they failed. None means they are all sampled.
+        """
+
+        responses = [AsyncResponse() for r in requests]
+        pending = []  # (index, encoded request) of unacknowledged requests
+        for i, (method, url, body) in enumerate(requests):
+            try:
+                pending.append((i, _encode_request(method, url, self.host,
+                                                   body,
+                                                   encoder=self.encoder)))
+            except Exception as e:
+                responses[i].set_error(e)
+
+        if DEBUG_LOG:
+            logger.debug("Pipeline %s requests: %s", len(pending),
+                         [requests[i][:2] for i, data in pending])
+        start = time.time()
+        sent = dict(pending)
+        retry = 0
+        while pending:
+            done = 0
+            written = False
+            try:
+                sock = self._connection.sock
+                if (sock is not None and resend is not None and
+                        not all(resend[i] for i, data in pending) and
+                        _dropped(sock)):
+                    self._connection.close()
+                if self._connection.sock is None:
+                    self._connect(trace)
+                sock = self._connection.sock
+                written = True
+                sock.sendall(b"".join(data for i, data in pending))
+                if trace is not None:
+                    trace(tracing.REQUEST_SENT)
+                fp = _SharedFile(sock.makefile("rb"))
+                try:
+                    for i, data in pending:
+                        resp = httplib.HTTPResponse(fp,
+                                                    method=requests[i][0])
+                        resp.begin()
+                        if trace is not None:
+                            trace(tracing.FIRST_BYTE, i)
+                        resp_body = resp.read()
+                        if trace is not None:
+                            trace(tracing.BODY_READ, i)
+                        responses[i].set_resp(
+                            version=resp.version, status=resp.status,
+                            reason=resp.reason,
+                            headers=dict(resp.getheaders()), body=resp_body,
+                            decoder=self.decoder)
+                        done += 1
+                        if resp.will_close:
+                            # replay the rest on a new connection
+                            self._connection.close()
+                            break
+                finally:
+                    fp._fp.close()
+            except Exception as e:
+                self._connection.close()
+                if written and resend is not None:
+                    # fail the unanswered requests which cannot be sent again
+                    unanswered = []
+                    for i, data in pending[done:]:
+                        if resend[i]:
+                            unanswered.append((i, data))
+                        else:
+                            responses[i].set_error(e)
+                    pending = pending[:done] + unanswered
+                if done:
+                    # some responses were read, the connection was dropped
+                    # after them. Replay the rest as a fresh attempt.
+                    retry = 0
+                elif retry == MAX_RETRY:
+                    for i, data in pending:
+                        responses[i].set_error(e)
+                    break
+                else:
+                    retry += 1
+                if DEBUG_LOG:
+                    logger.debug("retry %s pipelined requests %s times",
+                                 len(pending) - done, retry)
+            pending = pending[done:]
+        # end of replay loop
+        if self.metrics is not None:
+            latency = time.time() - start
+            for i, response in enumerate(responses):
+                self.metrics.record_exchange(requests[i][1], latency,
+                                             len(sent.get(i, b"")), response)
+        if self.request_log is not None:
+            latency = time.time() - start
+            for i, response in enumerate(responses):
+                self.request_log.log(requests[i][0], requests[i][1], latency,
+                                     response,
+                                     sampled is None or sampled[i])
+        if DEBUG_LOG:
+            logger.debug("Responses %s", [_summary(r) for r in responses])
+        return responses  # AsyncResponse objects
 
-def connection_worker(host, request_queue, https=True, timeout=5, loop=True):
+
+def _http_args(request):
+    """return the (method, url, body) of the http request to send for the
+    AsyncRequest, or None if there is no http request to send
+    """
+    method = request.method
+    if method == "GET":
+        return "GET", request.qpath, None
+    elif method == "POST":
+        body = request.params if request.body is None else request.body
+        return "POST", request.path, body
+    elif method == "DELETE":
+        return "DELETE", request.qpath, None
+    return None
+
+
+def _tracing(requests):
+    """return the function reporting the stages of the http request
+    sending the requests to their tracers, or None if none is traced. It
+    reports a stage for all the requests, or for the i-th one if i is given.
+    """
+    traced = [(i, r) for i, r in enumerate(requests) if r.tracer is not None]
+    if not traced:
+        return None
+
+    def trace(stage, index=None):
+        now = time.time()
+        for i, request in traced:
+            if index is None or i == index:
+                _call_tracer(request, stage, now)
+
+    return trace
+
+
+def _complete(request, response, retries=None):
+    """set the response of the request, unless retries schedules the
+    request to be sent again. Returns False if it was scheduled.
+    """
+    if retries is not None:
+        # the response of the last attempt, eg. for AdaptiveConcurrency.
+        # It is replaced by the response of the next attempt.
+        request._raw_response = response
+        if retries.schedule(request, response):
+            return False
+    request.set_response(response)
+    return True
+
+
+def _fail(request, error, metrics=None):
+    """complete the request, which is not sent, with the error"""
+    d = AsyncResponse()
+    d.set_error(error)
+    d.set_request(request)
+    if metrics is not None:
+        metrics.record_error(type(error).__name__)
+    request.set_response(d)
+
+
+def _throttle(limiter, requests, encoder, metrics=None):
+    """take the tokens of the RateLimiter to send the requests, waiting for
+    them if it blocks. If it rejects them, complete them with a
+    RateLimitExceededError.
+
+    Returns the requests to send, without the rejected ones, and a dict of
+    the bodies encoded to count their bytes, by id of their request, to send
+    them without encoding them again. The requests whose body cannot be
+    encoded are completed with the error.
+    """
+    kept = []
+    bodies = {}
+    events = nbytes = 0
+    for request in requests:
+        args = _http_args(request)
+        if args is None:
+            kept.append(request)
+            continue
+        method, url, body = args
+        if limiter.bytes_per_second is not None:
+            nbytes += len(url)
+            if body:
+                try:
+                    bodies[id(request)] = _encode_body(body, encoder)
+                except Exception as e:
+                    _fail(request, e, metrics)
+                    continue
+                nbytes += len(bodies[id(request)])
+        # a batch request counts as many events as it contains
+        events += len(body) if isinstance(body, list) else 1
+        kept.append(request)
+    if events == 0 or limiter.acquire(events, nbytes):
+        return kept, bodies
+
+    requests, kept = kept, []
+    for request in requests:
+        if _http_args(request) is None:
+            kept.append(request)
+            continue
+        _fail(request, RateLimitExceededError(
+            "rate limit exceeded, request not sent"), metrics)
+    return kept, {}
+
+
+def _claimed(requests, metrics=None):
+    """return the requests to send, ie. without the cancelled and expired
+    ones
+    """
+    claimed = []
+    for request in requests:
+        if request._claim():
+            claimed.append(request)
+        elif metrics is not None:
+            metrics.record_error("RequestCancelledError"
+                                 if request.cancelled()
+                                 else "DeadlineExceededError")
+    return claimed
+
+
+def _dispatch(connect, requests, retries=None, limiter=None, pipeline=1):
+    """send the requests with connect and set their responses
+
+    Requests are pipelined if there are more than one of them and pipeline
+    is more than 1, and sent one after the other otherwise.
+    Returns the number of requests scheduled to be sent again by retries.
+    """
+    bodies = {}
+    if limiter is not None:
+        requests, bodies = _throttle(limiter, requests, connect.encoder,
+                                     connect.metrics)
+    sendable = []
+    for r in requests:
+        args = _http_args(r)
+        if args is not None:
+            if id(r) in bodies:
+                args = args[:2] + (bodies[id(r)],)
+            sendable.append((r, args))
+    # the RetryPolicy does not retry the requests which may have reached
+    # the server, nor must the connection
+    if pipeline > 1 and len(sendable) > 1:
+        responses = connect.pipeline_request(
+            [args for r, args in sendable],
+            _tracing([r for r, args in sendable]),
+            None if retries is None else [r.idempotent
+                                          for r, args in sendable],
+            [r.sampled for r, args in sendable])
+    else:
+        responses = [connect.request(*args, trace=_tracing([r]),
+                                     resend=retries is None or r.idempotent,
+                                     sampled=r.sampled)
+                     for r, args in sendable]
+    sendable = [r for r, args in sendable]
+    responses = dict(zip(map(id, sendable), responses))
+
+    rescheduled = 0
+    for request in requests:
+        d = responses.get(id(request))
+        if d is None:
+            d = AsyncResponse()
+            if request.method != "KILL":
+                d.set_error(NotSupportMethodError(
+                    "Don't Support the method %s" % request.method))
+        d.set_request(request)
+        if not _complete(request, d, retries):
+            rescheduled += 1
+    return rescheduled
+
+
+def _collect_batch(request, request_queue, batch_size, linger_ms):
+    """take more requests with the same batch_path as request from the
+    request_queue, until batch_size requests are collected, linger_ms
+    milliseconds have passed, or a request which cannot join the batch is
+    found.
+
+    Returns the list of batched requests and the list of the other requests
+    (which contains at most one request).
+    """
+    batch = [request]
+    deadline = time.time() + linger_ms / 1000.0
+    while len(batch) < batch_size:
+        try:
+            remaining = deadline - time.time()
+            if remaining > 0:
+                r = request_queue.get(True, remaining)
+            else:
+                r = request_queue.get(False)
+        except Queue.Empty:
+            break
+        if r.batch_path != request.batch_path:
+            # NOTE: stop here, so that a worker never takes more than one KILL
+            return batch, [r]
+        batch.append(r)
+    return batch, []
+
+
+def _collect_pipeline(request, request_queue, pipeline):
+    """take the requests already waiting in the request_queue, up to pipeline
+    requests in total including request. Stop after a KILL request.
+    """
+    requests = [request]
+    while len(requests) < pipeline and request.method != "KILL":
+        try:
+            request = request_queue.get(False)
+        except Queue.Empty:
+            break
+        requests.append(request)
+    return requests
+
+
+def _send_batch(connect, batch, retries=None, limiter=None):
+    """send the batch of requests as one request to their batch_path and set
+    the response of each request from the per-request statuses
+
+    Returns the number of requests scheduled to be sent again by retries.
+    """
+    bodies = {}
+    if limiter is not None:
+        batch, bodies = _throttle(limiter, batch, connect.encoder,
+                                  connect.metrics)
+    # encoded one by one, so that an event which cannot be encoded only
+    # fails its own request
+    encoded = []
+    for r in batch:
+        body = bodies.get(id(r))
+        if body is None:
+            try:
+                body = _encode_body(r.params, connect.encoder)
+            except Exception as e:
+                _fail(r, e, connect.metrics)
+                continue
+        encoded.append((r, body))
+    if not encoded:
+        return 0
+    batch = [r for r, body in encoded]
+    d = connect.request("POST", batch[0].batch_path,
+                        b"[" + b",".join(body for r, body in encoded) + b"]",
+                        trace=_tracing(batch),
+                        resend=(retries is None or
+                                all(r.idempotent for r in batch)),
+                        sampled=any(r.sampled for r in batch))
+    statuses = d.json_body
+    if (d.error is not None or d.status != httplib.OK or
+            not isinstance(statuses, list) or len(statuses) != len(batch)):
+        # the whole batch failed, every request gets the same response
+        return sum(not _complete(r, d.copy(r), retries) for r in batch)
+
+    rescheduled = 0
+    for r, status in zip(batch, statuses):
+        resp = AsyncResponse()
+        body = connect.encoder(status)
+        if not isinstance(body, bytes):
+            body = body.encode("utf8")
+        resp.set_resp(version=d.version, status=status.get("status"),
+                      reason=d.reason, headers=d.headers, body=body)
+        resp.json_body = status
+        resp.set_request(r)
+        rescheduled += not _complete(r, resp, retries)
+    return rescheduled
+
+
+class _RetryScheduler(object):
+    """thread putting the requests to retry back into the request queue once
+    their delay has passed, so that the workers do not wait for it
+
+    The workers do not mark the scheduled requests as done in the queue, so
+    that joining the queue waits for their retries.
+    """
+
+    def __init__(self, policy, request_queue, metrics=None):
+        self.policy = policy
+        self.q = request_queue
+        self.metrics = metrics
+        self._cond = threading.Condition()
+        self._heap = []  # (due time, sequence number, AsyncRequest)
+        self._seq = 0
+        self._closed = False
+        self._thread = None
+
+    def schedule(self, request, response):
+        """schedule the request to be sent again if the policy retries it.
+        Returns True if it was scheduled.
+        """
+        delay = self.policy.delay(request, response)
+        if delay is None:
+            return False
+        request.attempts += 1
+        request._release()
+        if self.metrics is not None:
+            self.metrics.record_retry()
+        if request.tracer is not None:
+            _call_tracer(request, tracing.RETRY, time.time())
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name="PredictionIORetry")
+                self._thread.daemon = True
+                self._thread.start()
+            heapq.heappush(self._heap,
+                           (time.time() + delay, self._seq, request))
+            self._seq += 1
+            self._cond.notify()
+        return True
+
+    def _run(self):
+        with self._cond:
+            while True:
+                if not self._heap:
+                    if self._closed:
+                        return
+                    self._cond.wait()
+                    continue
+                wait = self._heap[0][0] - time.time()
+                if wait > 0:
+                    self._cond.wait(wait)
+                    continue
+                request = heapq.heappop(self._heap)[2]
+                self._cond.release()
+                try:
+                    request.queued = time.time()
+                    self.q.put(request)
+                    # the worker did not mark the previous attempt done
+                    self.q.task_done()
+                finally:
+                    self._cond.acquire()
+
+    def close(self):
+        """stop the thread once the scheduled requests are queued
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+
+class _InlineRetries(object):
+    """retries of the requests sent by the calling thread: the delay is
+    spent sleeping in that thread
+    """
+
+    def __init__(self, policy, metrics=None):
+        self.policy = policy
+        self.metrics = metrics
+
+    def schedule(self, request, response):
+        delay = self.policy.delay(request, response)
+        if delay is None:
+            return False
+        request.attempts += 1
+        request._release()
+        if self.metrics is not None:
+            self.metrics.record_retry()
+        if request.tracer is not None:
+            _call_tracer(request, tracing.RETRY, time.time())
+        time.sleep(delay)
+        return True
+
+
+def connection_worker(host, request_queue, https=True, timeout=5, loop=True,
+                      batch_size=1, linger_ms=0, pipeline=1, idle_timeout=None,
+                      encoder=DEFAULT_ENCODER, decoder=DEFAULT_DECODER,
+                      concurrency=None, retries=None, limiter=None,
+                      metrics=None, request_log=None):
     """worker function which establishes connection and wait for request jobs
     from the request_queue
 
@@ -311,40 +1388,80 @@ def connection_worker(host, request_queue, https=True, timeout=5, loop=True):
       timeout: timeout for HTTP connection attempts and requests in seconds
       loop: This worker function stays in a loop waiting for request
         For testing purpose only. should always be set to True.
+      batch_size: max number of requests with a batch_path to be sent in one
+        batch request. 1 means no batching.
+      linger_ms: max time in milliseconds to wait for more requests to fill
+        up a batch.
+      pipeline: max number of queued requests sent back-to-back on the
+        connection before reading their responses. 1 means no pipelining.
+      idle_timeout: close the http connection after waiting for requests
+        for idle_timeout seconds. None means never.
+      encoder: function encoding request bodies to JSON
+      decoder: function decoding JSON response bodies
+      concurrency: AdaptiveConcurrency to report the latencies to, if any
+      retries: _RetryScheduler of the requests to send again, if any
+      limiter: RateLimiter of the requests sent, if any
+      metrics: Metrics recording the requests, if any
+      request_log: RequestLog of the requests, if any
     """
 
-    connect = PredictionIOHttpConnection(host, https, timeout)
+    connect = PredictionIOHttpConnection(host, https, timeout, encoder,
+                                         decoder)
+    connect.metrics = metrics
+    connect.request_log = request_log
 
     # loop waiting for job form request queue
     killed = not loop
 
     while True:
         # print "thread %s waiting for request" % thread.get_ident()
-        request = request_queue.get(True)  # NOTE: blocking get
+        try:
+            request = request_queue.get(True, idle_timeout)
+        except Queue.Empty:
+            # close the idle connection, the next request reopens it
+            connect.close()
+            request = request_queue.get(True)  # NOTE: blocking get
         # print "get request %s" % request
-        method = request.method
-        if method == "GET":
-            path = request.qpath
-            d = connect.request("GET", path)
-        elif method == "POST":
-            path = request.path
-            body = request.params
-            d = connect.request("POST", path, body)
-        elif method == "DELETE":
-            path = request.qpath
-            d = connect.request("DELETE", path)
-        elif method == "KILL":
+        rescheduled = 0
+        if concurrency is not None:
+            start = time.time()
+        if batch_size > 1 and request.batch_path is not None:
+            batch, requests = _collect_batch(request, request_queue,
+                                             batch_size, linger_ms)
+        elif pipeline > 1:
+            batch, requests = [], _collect_pipeline(request, request_queue,
+                                                    pipeline)
+        else:
+            batch, requests = [], [request]
+        taken = len(batch) + len(requests)
+
+        # skip the cancelled and expired requests
+        batch = _claimed(batch, metrics)
+        requests = _claimed(requests, metrics)
+        if metrics is not None:
+            sending = [r for r in batch + requests if r.method != "KILL"]
+            dequeued = time.time()
+            metrics.record_dequeued(sending, dequeued)
+        for r in batch + requests:
+            if r.tracer is not None:
+                _call_tracer(r, tracing.DEQUEUED, time.time())
+        if len(batch) == 1:
+            requests.insert(0, batch.pop())
+        if batch:
+            rescheduled = _send_batch(connect, batch, retries, limiter)
+
+        if requests and requests[-1].method == "KILL":
             # tell the thread to kill the connection
             killed = True
-            d = AsyncResponse()
-        else:
-            d = AsyncResponse()
-            d.set_error(NotSupportMethodError(
-                "Don't Support the method %s" % method))
-
-        d.set_request(request)
-        request.set_response(d)
-        request_queue.task_done()
+        rescheduled += _dispatch(connect, requests, retries, limiter,
+                                 pipeline)
+        if metrics is not None:
+            metrics.record_sent(sending, time.time() - dequeued)
+        if concurrency is not None and not killed:
+            concurrency.sample(time.time() - start, batch + requests)
+
+        for r in xrange(taken - rescheduled):
+            request_queue.task_done()
         if killed:
             break
 
@@ -352,58 +1469,347 @@ def connection_worker(host, request_queue, https=True, timeout=5, loop=True):
     connect.close()
 
 
+class _ThreadConnection(object):
+    """owner of the http connection of a thread sending requests inline,
+    stored in a threading.local: the connection is closed once the thread
+    ends, eg. in servers running a thread per request
+    """
+
+    def __init__(self, connect):
+        self.connect = connect
+
+    def __del__(self):
+        self.connect.close()
+
+
 class Connection(object):
     """abstract object for connection with server
 
     spawn multiple connection_worker threads to handle jobs in the queue q
     """
 
-    def __init__(self, host, threads=1, qsize=0, https=True, timeout=5):
+    def __init__(self, host, threads=1, qsize=0, https=True, timeout=5,
+                 batch_size=1, linger_ms=0, pipeline=1, idle_timeout=None,
+                 encoder=DEFAULT_ENCODER, decoder=DEFAULT_DECODER,
+                 concurrency=None, retry=None, rate_limiter=None,
+                 metrics=True, tracer=None, request_log=None):
         """constructor
 
         Args:
           host: host of the server.
-          threads: type int, number of threads to be spawn
+          threads: type int, number of threads to be spawn. 0 means no
+            threads: requests are sent by the thread calling make_request,
+            on a keep-alive http connection owned by that thread.
           qsize: size of the queue q
           https: indicate it is httpS (True) or http connection (False)
           timeout: timeout for HTTP connection attempts and requests in
             seconds
+          batch_size: max number of batchable requests coalesced into one
+            batch request by a worker. 1 means no batching.
+          linger_ms: max time in milliseconds a worker waits for more
+            requests to fill up a batch.
+          pipeline: max number of queued requests a worker pipelines on its
+            connection. 1 means no pipelining.
+          idle_timeout: time in seconds after which a worker closes its idle
+            http connection. None means never.
+          encoder: function encoding request bodies to JSON
+          decoder: function decoding JSON response bodies
+          concurrency: AdaptiveConcurrency resizing the threads to the load
+            of the server. threads is ignored then.
+          retry: RetryPolicy of the failed requests. None means they are
+            only retried right away on connection errors, at most MAX_RETRY
+            times.
+          rate_limiter: RateLimiter of the requests sent, shared by the
+            threads. None means no limit.
+          metrics: collect the Metrics of the requests (True) or not (False)
+          tracer: Tracer of the stages of the requests. None means they are
+            not traced.
+          request_log: RequestLog of the http requests. None means they are
+            not logged.
         """
         self.host = host
         self.https = https
         self.q = Queue.Queue(qsize)  # if qsize=0, means infinite
-        self.threads = threads
+        self.qsize = qsize
+        self.threads = 0
         self.timeout = timeout
+        self.batch_size = batch_size
+        self.linger_ms = linger_ms
+        self.pipeline = pipeline
+        self.idle_timeout = idle_timeout
+        self.encoder = encoder
+        self.decoder = decoder
+        self.concurrency = concurrency
+        self.retry = retry
+        self.rate_limiter = rate_limiter
+        self.metrics = Metrics() if metrics else None
+        self.tracer = tracer
+        self.request_log = request_log
         # start thread based on threads number
         self.tid = {}  # dictionary of thread object
+        self._next_tid = 0
+        self._lock = threading.Lock()
+        # inline mode: no threads, make_request sends the request itself
+        self.inline = threads == 0
+        self._local = threading.local()  # http connection of each thread
+        # the connections of the threads, closed by close() unless their
+        # thread ended before
+        self._inline_connections = weakref.WeakSet()
+        if retry is None:
+            self._retries = None
+        elif self.inline and concurrency is None:
+            self._retries = _InlineRetries(retry, self.metrics)
+        else:
+            self._retries = _RetryScheduler(retry, self.q, self.metrics)
+        if concurrency is not None:
+            self.inline = False
+            concurrency.start(self)
+        else:
+            self.resize(threads)
 
-        for i in xrange(threads):
-            tname = "PredictionIOThread-%s" % i  # thread name
-            self.tid[i] = threading.Thread(
-                target=connection_worker, name=tname,
-                kwargs={'host': self.host, 'request_queue': self.q,
-                        'https': self.https, 'timeout': self.timeout})
-            self.tid[i].setDaemon(True)
-            self.tid[i].start()
+    def resize(self, threads):
+        """change the number of connection_worker threads
+
+        New threads are started right away. Removed threads exit once they
+        have handled the requests queued before the resize.
+        """
+        with self._lock:
+            for i, t in list(self.tid.items()):
+                if not t.is_alive():
+                    del self.tid[i]
+
+            while self.threads < threads:
+                i = self._next_tid
+                self._next_tid += 1
+                tname = "PredictionIOThread-%s" % i  # thread name
+                self.tid[i] = threading.Thread(
+                    target=connection_worker, name=tname,
+                    kwargs={'host': self.host, 'request_queue': self.q,
+                            'https': self.https, 'timeout': self.timeout,
+                            'batch_size': self.batch_size,
+                            'linger_ms': self.linger_ms,
+                            'pipeline': self.pipeline,
+                            'idle_timeout': self.idle_timeout,
+                            'encoder': self.encoder,
+                            'decoder': self.decoder,
+                            'concurrency': self.concurrency,
+                            'retries': self._retries,
+                            'limiter': self.rate_limiter,
+                            'metrics': self.metrics,
+                            'request_log': self.request_log})
+                self.tid[i].daemon = True
+                self.tid[i].start()
+                self.threads += 1
+
+            while self.threads > threads:
+                self.make_request(AsyncRequest("KILL", ""))
+                self.threads -= 1
 
     def make_request(self, request):
         """put the request into the q
+
+        In inline mode, send the request and set its response instead.
         """
-        self.q.put(request)
+        if self.tracer is not None and request.method != "KILL":
+            request.tracer = self.tracer
+            _call_tracer(request, tracing.ENQUEUED, time.time())
+        if self.inline:
+            while request._claim() and _dispatch(
+                    self._inline_connection(), [request], self._retries,
+                    self.rate_limiter):
+                pass  # sent again after the delay of the retry
+        else:
+            self.q.put(request)
+
+    def _inline_connection(self):
+        owner = getattr(self._local, "owner", None)
+        if owner is None:
+            connect = PredictionIOHttpConnection(self.host, self.https,
+                                                 self.timeout, self.encoder,
+                                                 self.decoder)
+            connect.metrics = self.metrics
+            connect.request_log = self.request_log
+            owner = self._local.owner = _ThreadConnection(connect)
+            with self._lock:
+                self._inline_connections.add(connect)
+        return owner.connect
 
     def pending_requests(self):
         """number of pending requests in the queue
         """
         return self.q.qsize()
 
+    def stats(self):
+        """return a snapshot of the Metrics of the requests, with the number
+        of queued requests and of threads
+        """
+        stats = self.metrics.snapshot() if self.metrics is not None else {}
+        stats["queue_depth"] = self.q.qsize()
+        stats["threads"] = self.threads
+        return stats
+
+    def prometheus_text(self, prefix="predictionio"):
+        """return the Metrics of the requests in the Prometheus text
+        exposition format
+        """
+        gauges = {"queue_depth": self.q.qsize(), "threads": self.threads}
+        if self.metrics is None:
+            return Metrics().prometheus_text(prefix, gauges)
+        return self.metrics.prometheus_text(prefix, gauges)
+
     def close(self):
         """close this Connection. Call this when main program exits
         """
+        if self.concurrency is not None:
+            self.concurrency.stop()
+
+        if isinstance(self._retries, _RetryScheduler):
+            # wait for the retries before killing the threads
+            self.q.join()
+            self._retries.close()
+
         # set kill message to q
-        for i in xrange(self.threads):
-            self.make_request(AsyncRequest("KILL", ""))
+        self.resize(0)
 
         self.q.join()  # wait for q empty
 
-        for i in xrange(self.threads):  # wait for all thread finish
-            self.tid[i].join()
+        for t in list(self.tid.values()):  # wait for all thread finish
+            t.join()
+
+        with self._lock:
+            for connect in list(self._inline_connections):
+                connect.close()
+            self._inline_connections.clear()
+
+        if self.request_log is not None:
+            self.request_log.flush()
+
+
+def _pool_key(host, https, timeout, options):
+    hostname, sep, port = host.rpartition(":")
+    if not sep or not port.isdigit():
+        hostname, port = host, (443 if https else 80)
+    scheme = "https" if https else "http"
+    return (scheme, hostname, int(port), timeout,
+            tuple(sorted(options.items())))
+
+
+class ConnectionPool(object):
+    """pool of Connection objects shared by clients
+
+    Clients acquiring a Connection for the same scheme, host, port, timeout
+    and connection options share one Connection, ie. one request queue and
+    one set of connection_worker threads, each owning one http connection.
+    The pool bounds the total number of threads (and http connections) of
+    its Connections. When it is full, a new server gets a share of the
+    threads of the servers having more than an equal share.
+    """
+
+    def __init__(self, max_connections=10, max_per_host=None,
+                 idle_timeout=60):
+        """constructor
+
+        Args:
+          max_connections: max number of http connections (ie. threads) of
+            all the Connections of the pool
+          max_per_host: max number of http connections of one Connection.
+            None means max_connections.
+          idle_timeout: time in seconds after which idle http connections
+            are closed. None means never.
+        """
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host or max_connections
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> [Connection, number of users]
+
+    def connections(self):
+        """number of http connections (ie. threads) of the pool
+        """
+        with self._lock:
+            return self._used()
+
+    def _used(self):
+        return sum(c.threads for c, users in self._entries.values())
+
+    def _reserve(self, threads):
+        """return how many of the threads can be started, shrinking the
+        Connections above an equal share of the pool if it is full
+        """
+        fair = max(1, self.max_connections // (len(self._entries) + 1))
+        threads = min(threads, self.max_per_host)
+        if self.max_connections - self._used() < threads:
+            threads = min(threads, fair)
+        while self.max_connections - self._used() < threads:
+            biggest = max(self._entries.values(), key=lambda e: e[0].threads)
+            if biggest[0].threads <= fair:
+                break
+            biggest[0].resize(biggest[0].threads - 1)
+        return min(threads, self.max_connections - self._used())
+
+    def acquire(self, host, threads=1, qsize=0, https=True, timeout=5,
+                **options):
+        """return a Connection to the host, shared with the other users of
+        the same server, timeout and options. The arguments are the ones of
+        Connection's constructor; qsize is only used by the first user.
+        Call release() with the Connection when it is not used any more.
+        """
+        key = _pool_key(host, https, timeout, options)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[1] += 1
+                connection = entry[0]
+                if connection.threads < threads:
+                    extra = self._reserve(threads - connection.threads)
+                    if extra > 0:
+                        connection.resize(connection.threads + extra)
+                return connection
+
+            granted = self._reserve(threads) if threads > 0 else 0
+            if granted < 1 and threads > 0:
+                raise ProgramError(
+                    "connection pool is full: %s connections for %s servers"
+                    % (self.max_connections, len(self._entries)))
+            connection = Connection(host=host, threads=granted, qsize=qsize,
+                                    https=https, timeout=timeout,
+                                    idle_timeout=self.idle_timeout,
+                                    **options)
+            connection._pool_key = key
+            self._entries[key] = [connection, 1]
+            return connection
+
+    def release(self, connection):
+        """stop using the Connection returned by acquire(). The last user
+        closes it, waiting for its pending requests to finish.
+        """
+        with self._lock:
+            entry = self._entries[connection._pool_key]
+            entry[1] -= 1
+            if entry[1] > 0:
+                return
+            del self._entries[connection._pool_key]
+        connection.close()
+
+    def close(self):
+        """close all the Connections of the pool
+        """
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for connection, users in entries:
+            connection.close()
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_default_pool():
+    """return the process-wide ConnectionPool, created on first use
+    """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = ConnectionPool()
+        return _default_pool
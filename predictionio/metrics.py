@@ -0,0 +1,213 @@
+"""Metrics of the requests sent by a client
+
+Metrics collects, at the cost of a lock and a few additions per request:
+
+- latency histograms of the http requests, per endpoint
+- time spent by requests in the queue and on the wire
+- number of requests in flight, bytes sent and received
+- retries, and errors by type
+
+Connection.stats() returns a snapshot of them, and prometheus_text() formats
+them for a Prometheus scrape.
+"""
+
+import math
+import re
+import threading
+
+# histogram buckets: upper bounds growing by a factor of sqrt(2), from 50us
+# to about 2 minutes, ie. percentiles are exact within 41%
+_MIN = 5e-5
+_RATIO = 2 ** 0.5
+_LOG_RATIO = math.log(_RATIO)
+_BUCKETS = 42
+_BOUNDS = [_MIN * _RATIO ** i for i in range(_BUCKETS)] + [float("inf")]
+
+# paths with ids, which would make one histogram per id
+_ENDPOINT_IDS = re.compile(r"^/events/[^/]+\.json$")
+
+
+def endpoint(url):
+    """return the endpoint of a url, without query string nor ids
+    """
+    path = url.split("?", 1)[0]
+    if _ENDPOINT_IDS.match(path):
+        return "/events/{id}.json"
+    return path
+
+
+class Histogram(object):
+    """histogram of durations in seconds, with fixed logarithmic buckets
+    """
+
+    def __init__(self):
+        self.counts = [0] * len(_BOUNDS)
+        self.count = 0
+        self.sum = 0.0
+
+    def record(self, value):
+        if value <= _MIN:
+            i = 0
+        else:
+            i = min(int(math.log(value / _MIN) / _LOG_RATIO) + 1, _BUCKETS)
+        self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, p):
+        """return the upper bound of the bucket of the p-th percentile, or
+        None if the histogram is empty
+        """
+        if not self.count:
+            return None
+        rank = p / 100.0 * self.count
+        seen = 0
+        for bound, n in zip(_BOUNDS, self.counts):
+            seen += n
+            if seen >= rank and n:
+                return bound
+        return _BOUNDS[-1]
+
+    def snapshot(self):
+        return {"count": self.count,
+                "sum": self.sum,
+                "mean": self.sum / self.count if self.count else None,
+                "p50": self.percentile(50),
+                "p90": self.percentile(90),
+                "p99": self.percentile(99),
+                "p999": self.percentile(99.9)}
+
+
+class Metrics(object):
+    """metrics of the requests of a Connection, updated by its threads
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latency = {}  # endpoint -> Histogram
+        self._queue_time = Histogram()
+        self._wire_time = Histogram()
+        self._requests = 0
+        self._in_flight = 0
+        self._bytes_sent = 0
+        self._bytes_received = 0
+        self._retries = 0
+        self._errors = {}  # type -> count
+
+    def record_exchange(self, url, latency, sent, response):
+        """record an http request to url, which took latency seconds and
+        sent bytes, and its AsyncResponse
+        """
+        name = endpoint(url)
+        received = len(response.body) if response.body else 0
+        if response.error is not None:
+            error = type(response.error).__name__
+        elif response.status >= 400:
+            error = "http_%s" % response.status
+        else:
+            error = None
+        with self._lock:
+            histogram = self._latency.get(name)
+            if histogram is None:
+                histogram = self._latency[name] = Histogram()
+            histogram.record(latency)
+            self._requests += 1
+            self._bytes_sent += sent
+            self._bytes_received += received
+            if error is not None:
+                self._errors[error] = self._errors.get(error, 0) + 1
+
+    def record_dequeued(self, requests, now):
+        """record the time the requests waited in the queue, and count them
+        in flight
+        """
+        with self._lock:
+            for request in requests:
+                self._queue_time.record(now - request.queued)
+            self._in_flight += len(requests)
+
+    def record_sent(self, requests, wire_time):
+        """record the time the requests took to be sent and answered
+        """
+        with self._lock:
+            for request in requests:
+                self._wire_time.record(wire_time)
+            self._in_flight -= len(requests)
+
+    def record_retry(self):
+        with self._lock:
+            self._retries += 1
+
+    def record_error(self, error):
+        """count an error which is not the response of an http request, eg.
+        a cancelled request
+        """
+        with self._lock:
+            self._errors[error] = self._errors.get(error, 0) + 1
+
+    def snapshot(self):
+        """return the metrics as a dict
+        """
+        with self._lock:
+            return {
+                "requests": self._requests,
+                "in_flight": self._in_flight,
+                "bytes_sent": self._bytes_sent,
+                "bytes_received": self._bytes_received,
+                "retries": self._retries,
+                "errors": dict(self._errors),
+                "queue_time": self._queue_time.snapshot(),
+                "wire_time": self._wire_time.snapshot(),
+                "latency": dict((name, h.snapshot())
+                                for name, h in self._latency.items()),
+            }
+
+    def prometheus_text(self, prefix="predictionio", gauges=None):
+        """return the metrics in the Prometheus text exposition format
+
+        Args:
+          prefix: prefix of the metric names
+          gauges: dict of other gauges to expose, eg. the queue depth
+        """
+        lines = []
+
+        def histogram(name, h, labels=""):
+            cumulative = 0
+            for bound, n in zip(_BOUNDS, h.counts):
+                cumulative += n
+                le = "+Inf" if bound == float("inf") else "%.6g" % bound
+                lines.append('%s_bucket{%sle="%s"} %d' % (
+                    name, labels, le, cumulative))
+            labels = "{%s}" % labels.rstrip(",") if labels else ""
+            lines.append("%s_sum%s %.6f" % (name, labels, h.sum))
+            lines.append("%s_count%s %d" % (name, labels, h.count))
+
+        with self._lock:
+            name = prefix + "_request_duration_seconds"
+            lines.append("# TYPE %s histogram" % name)
+            for path in sorted(self._latency):
+                histogram(name, self._latency[path],
+                          'endpoint="%s",' % path)
+            for stage, h in (("queue", self._queue_time),
+                             ("wire", self._wire_time)):
+                name = "%s_%s_time_seconds" % (prefix, stage)
+                lines.append("# TYPE %s histogram" % name)
+                histogram(name, h)
+            for counter, value in (("requests", self._requests),
+                                   ("bytes_sent", self._bytes_sent),
+                                   ("bytes_received", self._bytes_received),
+                                   ("retries", self._retries)):
+                name = "%s_%s_total" % (prefix, counter)
+                lines.append("# TYPE %s counter" % name)
+                lines.append("%s %d" % (name, value))
+            name = prefix + "_errors_total"
+            lines.append("# TYPE %s counter" % name)
+            for error in sorted(self._errors):
+                lines.append('%s{type="%s"} %d' % (name, error,
+                                                   self._errors[error]))
+            gauges = dict(gauges or {}, in_flight=self._in_flight)
+        for gauge in sorted(gauges):
+            name = "%s_%s" % (prefix, gauge)
+            lines.append("# TYPE %s gauge" % name)
+            lines.append("%s %s" % (name, gauges[gauge]))
+        return "\n".join(lines) + "\n"
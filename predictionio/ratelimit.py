@@ -0,0 +1,81 @@
+"""Client-side rate limiting
+
+RateLimiter caps the rate at which the connection threads of a client send
+events (or queries) and bytes to the server, so that a bulk import cannot
+saturate a server shared with other applications.
+"""
+
+import threading
+import time
+
+
+class _TokenBucket(object):
+
+    def __init__(self, rate, burst):
+        self.rate = float(rate)
+        self.capacity = self.rate * burst
+        self.tokens = self.capacity
+        self.updated = time.time()
+
+    def wait_time(self, amount, now):
+        """time in seconds before amount tokens can be taken. An amount
+        larger than the capacity only needs a full bucket, and leaves it in
+        debt.
+        """
+        self.tokens = min(self.capacity,
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        missing = min(amount, self.capacity) - self.tokens
+        return max(missing / self.rate, 0)
+
+
+class RateLimiter(object):
+    """token buckets limiting the events and bytes per second sent by a
+    client
+
+    A batch request counts as many events as it contains. Requests beyond
+    the rate wait in the connection threads, or, if block is False, are not
+    sent and get a response whose error is a RateLimitExceededError.
+    """
+
+    def __init__(self, events_per_second=None, bytes_per_second=None,
+                 burst=1.0, block=True):
+        """constructor
+
+        Args:
+          events_per_second: max number of events (or queries) sent per
+            second. None means no limit.
+          bytes_per_second: max number of bytes of urls and request bodies
+            sent per second. None means no limit.
+          burst: time in seconds of traffic that can be sent at once after
+            an idle period
+          block: wait until the requests can be sent (True) or reject them
+            (False)
+        """
+        self.events_per_second = events_per_second
+        self.bytes_per_second = bytes_per_second
+        self.block = block
+        self._buckets = []  # (bucket, index of the amount)
+        if events_per_second is not None:
+            self._buckets.append((_TokenBucket(events_per_second, burst), 0))
+        if bytes_per_second is not None:
+            self._buckets.append((_TokenBucket(bytes_per_second, burst), 1))
+        self._lock = threading.Lock()
+
+    def acquire(self, events, nbytes=0):
+        """take the tokens to send events and nbytes bytes, waiting for them
+        if block is True. Returns False if they were rejected.
+        """
+        amounts = (events, nbytes)
+        while True:
+            with self._lock:
+                now = time.time()
+                wait = max([bucket.wait_time(amounts[i], now)
+                            for bucket, i in self._buckets] or [0])
+                if wait == 0:
+                    for bucket, i in self._buckets:
+                        bucket.tokens -= amounts[i]
+                    return True
+            if not self.block:
+                return False
+            time.sleep(wait)
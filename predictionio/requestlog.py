@@ -0,0 +1,131 @@
+"""Per-client logging of the http requests
+
+RequestLog logs the http requests of a client without slowing down its
+connection threads: every failed request is logged, and one in sample_rate
+successful requests; response bodies are truncated; and the log records are
+handled by a thread of the RequestLog, through a bounded queue, so that a
+slow log handler never blocks a connection thread.
+"""
+
+import itertools
+import logging
+import threading
+
+try:
+    import Queue
+except ImportError:
+    # pylint: disable=F0401
+    import queue as Queue
+
+
+class RequestLog(object):
+    """logging of the http requests of a client to a logger
+
+    A request fails if it gets a connection error or a status >= 400. Each
+    record has the method, url (without query string, which holds the
+    access key), status, error, latency (in seconds) and truncated body of
+    the request as attributes, for structured log handlers.
+
+    Records are dropped, and counted in dropped, when the queue is full.
+    """
+
+    def __init__(self, logger="predictionio.requests", sample_rate=100,
+                 max_body=200, level=logging.DEBUG,
+                 error_level=logging.WARNING, queue_size=10000):
+        """constructor
+
+        Args:
+          logger: logging.Logger, or name of the logger, handling the
+            records. Its handlers are configured by the application.
+          sample_rate: log one in sample_rate successful requests. 1 logs
+            them all, 0 none of them.
+          max_body: max number of bytes of the response body in a record
+          level: level of the records of the successful requests
+          error_level: level of the records of the failed requests
+          queue_size: max number of records waiting to be handled
+        """
+        if not isinstance(logger, logging.Logger):
+            logger = logging.getLogger(logger)
+        self.logger = logger
+        self.sample_rate = sample_rate
+        self.max_body = max_body
+        self.level = level
+        self.error_level = error_level
+        #: number of records dropped because the queue was full
+        self.dropped = 0
+        self._counter = itertools.count(1)
+        self._queue = Queue.Queue(queue_size)
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def log(self, method, url, latency, response, sampled=True):
+        """log the AsyncResponse of an http request, if it failed or is
+        sampled. Called by the connection threads. If sampled is False, the
+        request is only logged if it failed.
+        """
+        error = response.error
+        status = response.status
+        if error is not None or status >= 400:
+            level = self.error_level
+        elif (sampled and self.sample_rate and
+              next(self._counter) % self.sample_rate == 0):
+            level = self.level
+        else:
+            return
+        if not self.logger.isEnabledFor(level):
+            return
+
+        url = url.split("?", 1)[0]
+        body = response.body[:self.max_body] if response.body else b""
+        if error is not None:
+            msg, args = "%s %s failed after %.1fms: %r", (
+                method, url, latency * 1e3, error)
+        else:
+            msg, args = "%s %s %s in %.1fms: %s", (
+                method, url, status, latency * 1e3, body)
+        record = self.logger.makeRecord(
+            self.logger.name, level, __name__, 0, msg, args, None,
+            extra={"method": method, "url": url, "status": status,
+                   "error": error, "latency": latency, "body": body})
+        self._put(record)
+
+    def _put(self, record):
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(record)
+        except Queue.Full:
+            self.dropped += 1
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None:
+                thread = threading.Thread(target=self._run,
+                                          name="PredictionIORequestLog")
+                thread.daemon = True
+                thread.start()
+                self._thread = thread
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            try:
+                if record is None:
+                    return
+                self.logger.handle(record)
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """wait until the queued records are handled
+        """
+        self._queue.join()
+
+    def close(self):
+        """handle the queued records and stop the thread of the RequestLog
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
@@ -0,0 +1,248 @@
+"""Offline bulk scoring with an engine instance
+
+Reads queries from a JSON-lines or CSV file, sends them to an engine
+instance through EngineClient and writes one JSON line per query to the
+output file, in the same order as the input:
+
+  {"query": {...}, "prediction": {...}}
+  {"query": {...}, "error": "..."}
+
+At most --window queries are in flight at any time, so memory use does not
+depend on the size of the input. The progress is saved to a checkpoint file
+every --checkpoint-every queries; running the same command again resumes
+after the last checkpoint.
+
+Usage: python -m predictionio.score [options] INPUT OUTPUT
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+
+from collections import deque
+
+from predictionio import EngineClient
+from predictionio import MAX_BATCH_QUERIES
+from predictionio.codec import DEFAULT_DECODER
+from predictionio.codec import DEFAULT_ENCODER
+from predictionio.connection import PredictionIOAPIError
+
+_replace = getattr(os, "replace", os.rename)
+
+
+def read_queries(f, fmt="jsonl", json_columns=()):
+    """generate the queries of a text file
+
+    Args:
+      f: file object opened in text mode
+      fmt: "jsonl" for one JSON object per line, blank lines are skipped, or
+        "csv" for a CSV file with a header row
+      json_columns: names of the CSV columns whose values are decoded as
+        JSON, eg. numbers. The other values are strings.
+    """
+    if fmt == "csv":
+        for row in csv.DictReader(f):
+            for column in json_columns:
+                row[column] = json.loads(row[column])
+            yield row
+    else:
+        for line in f:
+            if line.strip():
+                yield DEFAULT_DECODER(line)
+
+
+def _result_line(query, prediction):
+    if isinstance(prediction, PredictionIOAPIError):
+        result = {"query": query, "error": str(prediction)}
+    else:
+        result = {"query": query, "prediction": prediction}
+    line = DEFAULT_ENCODER(result)
+    if not isinstance(line, bytes):
+        line = line.encode("utf8")
+    return line + b"\n"
+
+
+def _predictions(batch, request, batch_size):
+    try:
+        if batch_size > 1:
+            return request.get_response()
+        return [request.get_response()]
+    except PredictionIOAPIError as e:
+        return [e] * len(batch)
+
+
+def score(client, queries, output, window=1000, batch_size=1,
+          checkpoint=None):
+    """send the queries and write their results to output, in order
+
+    Args:
+      client: EngineClient sending the queries
+      queries: iterable of queries
+      output: file object opened in binary mode
+      window: max number of queries in flight
+      batch_size: number of queries per request. Greater than 1 uses the
+        batch endpoint of the engine instance.
+      checkpoint: function called with the number of results written, after
+        every batch of results, to save the progress
+
+    Returns the number of results written.
+    """
+    pending = deque()  # (queries, AsyncRequest), in input order
+    in_flight = 0
+    written = 0
+
+    def write_oldest():
+        batch, request = pending.popleft()
+        for query, prediction in zip(
+                batch, _predictions(batch, request, batch_size)):
+            output.write(_result_line(query, prediction))
+        if checkpoint is not None:
+            checkpoint(written + len(batch))
+        return len(batch)
+
+    def submit(batch):
+        if batch_size > 1:
+            request = client.asend_queries(batch, batch_size)[0]
+        else:
+            request = client.asend_query(batch[0])
+        pending.append((batch, request))
+
+    batch = []
+    for query in queries:
+        batch.append(query)
+        if len(batch) < batch_size:
+            continue
+        while pending and in_flight + len(batch) > window:
+            n = write_oldest()
+            written += n
+            in_flight -= n
+        submit(batch)
+        in_flight += len(batch)
+        batch = []
+
+    if batch:
+        submit(batch)
+    while pending:
+        written += write_oldest()
+    return written
+
+
+class Checkpoint(object):
+    """progress of a scoring run, saved next to its output file
+
+    The checkpoint records the number of queries scored and the size of the
+    output file at that point, so that results written after the last
+    checkpoint can be discarded when resuming.
+    """
+
+    def __init__(self, file_name, every=10000):
+        self.file_name = file_name
+        self.every = every
+        self.queries = 0
+        self.offset = 0
+        self._last = 0
+
+    def load(self):
+        """load the saved progress, if any. Returns True if it exists.
+        """
+        try:
+            with open(self.file_name) as f:
+                state = json.load(f)
+        except IOError:
+            return False
+        self.queries = state["queries"]
+        self.offset = state["offset"]
+        self._last = self.queries
+        return True
+
+    def update(self, output, queries, force=False):
+        """save the progress when every queries were scored since the last
+        save, or if force is True
+        """
+        if not force and queries - self._last < self.every:
+            return
+        output.flush()
+        os.fsync(output.fileno())
+        self.queries = queries
+        self.offset = output.tell()
+        self._last = queries
+        tmp = self.file_name + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"queries": self.queries, "offset": self.offset}, f)
+        _replace(tmp, self.file_name)
+
+
+def _skip(iterable, n):
+    for i, item in enumerate(iterable):
+        if i >= n:
+            yield item
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Send the queries of a file to an engine instance and "
+                    "write the predictions to a JSON-lines file.")
+    parser.add_argument("input", help="JSON-lines or CSV file of queries")
+    parser.add_argument("output", help="JSON-lines file of the results")
+    parser.add_argument("--url", default="http://localhost:8000",
+                        help="url of the engine instance")
+    parser.add_argument("--format", choices=("jsonl", "csv"),
+                        help="format of the input file. Default: csv if the "
+                             "input file name ends with .csv, else jsonl")
+    parser.add_argument("--json-column", action="append", default=[],
+                        help="CSV column whose values are JSON, eg. numbers "
+                             "(repeatable)")
+    parser.add_argument("--threads", type=int, default=4,
+                        help="number of connections to the engine instance")
+    parser.add_argument("--timeout", type=float, default=5,
+                        help="timeout of the requests in seconds")
+    parser.add_argument("--window", type=int, default=1000,
+                        help="max number of queries in flight")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="queries per request, > 1 uses the batch "
+                             "endpoint (max %d)" % MAX_BATCH_QUERIES)
+    parser.add_argument("--checkpoint",
+                        help="checkpoint file. Default: OUTPUT.checkpoint")
+    parser.add_argument("--checkpoint-every", type=int, default=10000,
+                        help="queries scored between checkpoints")
+    parser.add_argument("--restart", action="store_true",
+                        help="ignore the checkpoint and start over")
+    args = parser.parse_args(argv)
+
+    if args.window < args.batch_size:
+        parser.error("--window must be >= --batch-size")
+    if not 1 <= args.batch_size <= MAX_BATCH_QUERIES:
+        parser.error("--batch-size must be between 1 and %d" %
+                     MAX_BATCH_QUERIES)
+    fmt = args.format or (
+        "csv" if args.input.lower().endswith(".csv") else "jsonl")
+
+    checkpoint = Checkpoint(args.checkpoint or args.output + ".checkpoint",
+                            args.checkpoint_every)
+    if not args.restart and checkpoint.load():
+        output = open(args.output, "r+b")
+        output.seek(checkpoint.offset)
+        output.truncate()
+    else:
+        output = open(args.output, "wb")
+
+    client = EngineClient(url=args.url, threads=args.threads,
+                          timeout=args.timeout)
+    start = checkpoint.queries
+    try:
+        with io.open(args.input, encoding="utf8", newline="") as f:
+            queries = _skip(read_queries(f, fmt, args.json_column), start)
+            total = score(
+                client, queries, output, args.window, args.batch_size,
+                lambda n: checkpoint.update(output, start + n))
+        checkpoint.update(output, start + total, force=True)
+    finally:
+        client.close()
+        output.close()
+    print("%d queries scored, %d in total" % (total, start + total))
+
+
+if __name__ == "__main__":
+    main()
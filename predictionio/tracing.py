@@ -0,0 +1,133 @@
+"""Tracing of the stages of the requests sent by a client
+
+A Tracer is called, in the thread reaching it, at each stage of a request:
+
+  enqueued            put into the queue of the Connection by make_request
+  dequeued            taken from the queue by a connection thread
+  connect_start       opening an http connection (DNS resolution and TCP)
+  connect_end         TCP connection established
+  tls_done            TLS handshake of an https connection done
+  request_sent        request written on the connection
+  first_byte          status line and headers of the response received
+  body_read           response body read
+  response_delivered  response set, ie. get_response() does not block
+  json_decoded        response body decoded, when it is first accessed
+  retry               scheduled to be sent again by the RetryPolicy
+
+The connect stages are only reported for requests which open a connection.
+Requests sent together, ie. batched or pipelined, report the same connect
+and request_sent stages. json_decoded usually follows response_delivered,
+since bodies are decoded lazily by get_response().
+
+Tracing is disabled unless a client is given a tracer, and then costs a
+test per stage. OpenTelemetryTracer reports the stages to OpenTelemetry.
+"""
+
+from predictionio.metrics import endpoint
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+ENQUEUED = "enqueued"
+DEQUEUED = "dequeued"
+CONNECT_START = "connect_start"
+CONNECT_END = "connect_end"
+TLS_DONE = "tls_done"
+REQUEST_SENT = "request_sent"
+FIRST_BYTE = "first_byte"
+BODY_READ = "body_read"
+DELIVERED = "response_delivered"
+JSON_DECODED = "json_decoded"
+RETRY = "retry"
+
+
+class Tracer(object):
+    """receiver of the stages of the requests of a client, which does
+    nothing. Subclasses override stage().
+
+    stage() is called by the connection threads, and must not block.
+    """
+
+    def stage(self, request, stage, timestamp, start=None):
+        """called when the AsyncRequest reaches the stage
+
+        Args:
+          request: the AsyncRequest. Its trace_context attribute is free for
+            the tracer to use, eg. to store a span.
+          stage: name of the stage, eg. DEQUEUED
+          timestamp: time of the stage, as returned by time.time()
+          start: time the stage started, for stages measuring an operation
+            (json_decoded). None for the others.
+        """
+
+
+def _ns(timestamp):
+    return int(timestamp * 1e9)
+
+
+class OpenTelemetryTracer(Tracer):
+    """Tracer recording a span per request with OpenTelemetry
+
+    The span, named after the method and endpoint of the request, starts
+    when it is enqueued and ends when its response is delivered. The other
+    stages are events of the span, but json_decoded, coming once the span
+    ended, is recorded as a child span of the decoding time.
+
+    It does nothing if the opentelemetry-api package is not installed.
+    """
+
+    def __init__(self, tracer_provider=None, name="predictionio"):
+        """constructor
+
+        Args:
+          tracer_provider: OpenTelemetry TracerProvider. None means the
+            global one.
+          name: name of the instrumentation library
+        """
+        if otel_trace is None:
+            self._tracer = None
+        else:
+            self._tracer = otel_trace.get_tracer(
+                name, tracer_provider=tracer_provider)
+
+    def stage(self, request, stage, timestamp, start=None):
+        if self._tracer is None:
+            return
+        span = request.trace_context
+        if stage == ENQUEUED:
+            if span is None:
+                path = endpoint(request.path)
+                request.trace_context = self._tracer.start_span(
+                    "%s %s" % (request.method, path),
+                    kind=otel_trace.SpanKind.CLIENT,
+                    start_time=_ns(timestamp),
+                    attributes={"http.method": request.method,
+                                "http.route": path})
+            return
+        if span is None:
+            return
+        if stage == JSON_DECODED and not span.is_recording():
+            context = otel_trace.set_span_in_context(span)
+            child = self._tracer.start_span(
+                stage, context=context, start_time=_ns(start or timestamp))
+            child.end(end_time=_ns(timestamp))
+            return
+        span.add_event(stage, timestamp=_ns(timestamp))
+        if stage == DELIVERED:
+            response = request._raw_response
+            error = None
+            if request.cancelled():
+                error = "request cancelled"
+            elif response is not None:
+                if response.error is not None:
+                    error = str(response.error)
+                elif response.status is not None:
+                    span.set_attribute("http.status_code", response.status)
+                    if response.status >= 400:
+                        error = "http status %s" % response.status
+            if error is not None:
+                span.set_status(otel_trace.Status(
+                    otel_trace.StatusCode.ERROR, error))
+            span.end(end_time=_ns(timestamp))
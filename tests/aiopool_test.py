@@ -0,0 +1,30 @@
+import unittest
+
+from benchmarks.mock_server import MockServer
+
+try:
+    import asyncio
+    from predictionio.aio import AsyncEngineClient
+except (ImportError, SyntaxError):
+    AsyncEngineClient = None
+
+
+@unittest.skipIf(AsyncEngineClient is None,
+                 "asyncio clients need Python 3.5+")
+class AsyncHTTPConnectionPoolTest(unittest.TestCase):
+
+    def test_connection_reused(self):
+        loop = asyncio.new_event_loop()
+        with MockServer() as server:
+            client = AsyncEngineClient(url=server.url)
+            for i in range(5):
+                self.assertEqual(
+                    loop.run_until_complete(client.send_query({"user": i})),
+                    {"query": {"user": i}})
+            self.assertEqual(server.connections, 1)
+            client.close()
+        loop.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
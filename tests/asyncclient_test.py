@@ -0,0 +1,52 @@
+import subprocess
+import unittest
+
+try:
+    import asyncio
+    from predictionio.aio import AsyncEventClient
+except (ImportError, SyntaxError):
+    AsyncEventClient = None
+
+app_name = 'AsyncClientApp'
+access_key = 'ASYNC_CLIENT_TEST'
+
+@unittest.skipIf(AsyncEventClient is None, "asyncio clients need Python 3.5+")
+class AsyncEventClientTest(unittest.TestCase):
+
+    def setUp(self):
+        subprocess.call(['pio', 'app', 'new', '--access-key', access_key, app_name])
+
+    def tearDown(self):
+        subprocess.call(['pio', 'app', 'delete', '-f', app_name])
+
+    def test_eventclient(self):
+        loop = asyncio.new_event_loop()
+        client = AsyncEventClient(access_key=access_key, url="http://127.0.0.1:7070")
+
+        # Check status
+        print("Check status")
+        status = loop.run_until_complete(client.get_status())
+        print(status)
+        self.assertEqual(status, {'status': 'alive'})
+
+        # Create events concurrently
+        print("Record user actions")
+        tasks = [
+            loop.create_task(
+                client.record_user_action_on_item("view", str(i), "bar"))
+            for i in range(20)]
+        responses = [loop.run_until_complete(t) for t in tasks]
+        for response in responses:
+            self.assertEqual(response.status, 201)
+
+        # Get an event back from Event Server
+        event_id = responses[3].json_body["eventId"]
+        event = loop.run_until_complete(client.get_event(event_id))
+        print(event)
+        self.assertEqual(event.get('entityId'), "3")
+
+        client.close()
+        loop.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,181 @@
+import logging
+import threading
+import time
+import unittest
+
+from predictionio import AsyncRequest
+from predictionio import DeadlineExceededError
+from predictionio import FIRST_COMPLETED
+from predictionio import NotFoundError
+from predictionio import RequestCancelledError
+from predictionio import TimeoutError
+from predictionio import as_completed
+from predictionio import wait
+from predictionio.connection import AsyncResponse
+from predictionio.connection import Future
+
+
+def _complete_later(request, response, delay):
+    timer = threading.Timer(delay, request.set_response, [response])
+    timer.start()
+    return timer
+
+
+def _raise(response):
+    raise NotFoundError(response)
+
+
+class ListHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class AsyncRequestTest(unittest.TestCase):
+
+    def test_result_and_callbacks(self):
+        request = AsyncRequest("GET", "/")
+        completed = []
+        request.add_done_callback(completed.append)
+        self.assertFalse(request.done())
+        self.assertRaises(TimeoutError, request.result, 0.01)
+        request.set_response("ok")
+        self.assertTrue(request.done())
+        self.assertEqual(completed, [request])
+        self.assertEqual(request.result(), "ok")
+        self.assertIsNone(request.exception())
+        # callbacks added later are called right away
+        request.add_done_callback(completed.append)
+        self.assertEqual(completed, [request, request])
+
+    def test_failing_callback_logged(self):
+        request = AsyncRequest("GET", "/")
+        completed = []
+        request.add_done_callback(_raise)
+        request.add_done_callback(completed.append)
+        logger = logging.getLogger("predictionio.connection")
+        handler = ListHandler()
+        logger.addHandler(handler)
+        try:
+            request.set_response("ok")
+        finally:
+            logger.removeHandler(handler)
+        self.assertEqual(completed, [request])
+        self.assertEqual([r.levelno for r in handler.records],
+                         [logging.ERROR])
+        self.assertIsInstance(handler.records[0].exc_info[1], NotFoundError)
+
+    def test_exception(self):
+        request = AsyncRequest("GET", "/")
+        request.set_rfunc(_raise)
+        request.set_response("not found")
+        self.assertIsInstance(request.exception(), NotFoundError)
+        self.assertRaises(NotFoundError, request.get_response)
+
+    @unittest.skipIf(Future is None, "concurrent.futures is not available")
+    def test_as_future(self):
+        request = AsyncRequest("GET", "/")
+        future = request.as_future()
+        _complete_later(request, "ok", 0.01)
+        self.assertEqual(future.result(1), "ok")
+
+    def test_as_completed(self):
+        slow, fast = AsyncRequest("GET", "/slow"), AsyncRequest("GET", "/fast")
+        _complete_later(slow, "slow", 0.1)
+        _complete_later(fast, "fast", 0.01)
+        self.assertEqual(list(as_completed([slow, fast])), [fast, slow])
+
+    def test_wait(self):
+        slow, fast = AsyncRequest("GET", "/slow"), AsyncRequest("GET", "/fast")
+        timer = _complete_later(slow, "slow", 1)
+        _complete_later(fast, "fast", 0.01)
+        start = time.time()
+        done, not_done = wait([slow, fast], return_when=FIRST_COMPLETED)
+        self.assertEqual((done, not_done), (set([fast]), set([slow])))
+        done, not_done = wait([slow, fast], timeout=0.01)
+        self.assertEqual(not_done, set([slow]))
+        self.assertLess(time.time() - start, 0.5)
+        timer.cancel()
+
+    def test_cancel(self):
+        request = AsyncRequest("GET", "/")
+        completed = []
+        request.add_done_callback(completed.append)
+        self.assertTrue(request.cancel())
+        self.assertTrue(request.cancelled())
+        self.assertEqual(completed, [request])
+        self.assertRaises(RequestCancelledError, request.get_response)
+        # workers skip it, and a late response is ignored
+        self.assertFalse(request._claim())
+        request.set_response("late")
+        self.assertRaises(RequestCancelledError, request.get_response)
+
+    def test_claim_while_cancelling(self):
+        claimed = []
+
+        class Request(AsyncRequest):
+            __slots__ = ()
+
+            def set_response(self, response):
+                # a worker taking the request before its response is set
+                claimed.append(self._claim())
+                AsyncRequest.set_response(self, response)
+
+        request = Request("GET", "/")
+        self.assertTrue(request.cancel())
+        self.assertEqual(claimed, [False])
+
+    def test_cancel_sent_request(self):
+        request = AsyncRequest("GET", "/")
+        self.assertTrue(request._claim())
+        self.assertFalse(request.cancel())
+        request.set_response("ok")
+        self.assertEqual(request.get_response(), "ok")
+        self.assertFalse(request.cancelled())
+
+    def test_deadline(self):
+        request = AsyncRequest("GET", "/")
+        request.set_deadline(-1)
+        self.assertFalse(request._claim())
+        self.assertTrue(request.done())
+        self.assertIsInstance(request.get_response().error,
+                              DeadlineExceededError)
+        request = AsyncRequest("GET", "/")
+        request.set_deadline(60)
+        self.assertTrue(request._claim())
+
+    def test_wait_timeout(self):
+        request = AsyncRequest("GET", "/")
+        for i in range(3):
+            self.assertRaises(TimeoutError, request.get_response, 0.001)
+        # the callbacks of the timed out waits are removed
+        self.assertEqual(request._callbacks, [])
+        _complete_later(request, "ok", 0.01)
+        self.assertEqual(request.get_response(1), "ok")
+
+    def test_qpath(self):
+        request = AsyncRequest("GET", "/events.json", accessKey="abc")
+        self.assertIsNone(request._qpath)
+        self.assertEqual(request.qpath, "/events.json?accessKey=abc")
+
+    def test_compact(self):
+        request = AsyncRequest("POST", "/events.json")
+        request.compact = True
+        request.set_rfunc(lambda response: response.json_body["eventId"])
+        response = AsyncResponse()
+        response.set_resp(11, 201, "Created", {"a": "b"}, b'{"eventId": "1"}')
+        request.set_response(response)
+        # the response is checked when set, without its body afterwards
+        self.assertTrue(request._resolved)
+        self.assertIsNone(response.body)
+        self.assertIsNone(response.headers)
+        self.assertEqual(response.json_body, {"eventId": "1"})
+        self.assertEqual(request.get_response(), "1")
+
+
+if __name__ == "__main__":
+    unittest.main()
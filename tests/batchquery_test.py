@@ -0,0 +1,79 @@
+import unittest
+
+from predictionio import EngineClient
+from predictionio import InvalidArgumentError
+from predictionio import PredictionIOAPIError
+
+from benchmarks.mock_server import MockServer
+
+try:
+    import asyncio
+    from predictionio.aio import AsyncEngineClient
+except (ImportError, SyntaxError):
+    AsyncEngineClient = None
+
+# 4 chunks of 3 queries, the mock server fails the second one
+QUERIES = [{"user": str(i)} for i in range(3)] + [
+    {"user": "3"}, "invalid", {"user": "5"}] + [
+    {"user": str(i)} for i in range(6, 10)]
+
+
+class BatchQueryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def assertPredictions(self, results):
+        self.assertEqual(len(results), len(QUERIES))
+        for i, (query, result) in enumerate(zip(QUERIES, results)):
+            if 3 <= i < 6:
+                self.assertIsInstance(result, PredictionIOAPIError)
+            else:
+                self.assertEqual(result, {"query": query})
+        # the same error for every query of the failed chunk
+        self.assertTrue(results[3] is results[4] is results[5])
+
+    def test_send_queries(self):
+        client = EngineClient(url=self.server.url, threads=2)
+        self.assertPredictions(client.send_queries(iter(QUERIES), 3))
+        self.assertEqual(self.server.requests, 4)
+        client.close()
+
+    def test_asend_queries(self):
+        client = EngineClient(url=self.server.url, threads=2)
+        requests = client.asend_queries(QUERIES, 3)
+        self.assertEqual([len(r.items) for r in requests], [3, 3, 3, 1])
+        self.assertEqual(requests[0].get_response(),
+                         [{"query": q} for q in QUERIES[:3]])
+        self.assertRaises(PredictionIOAPIError, requests[1].get_response)
+        self.assertEqual(requests[3].get_response(), [{"query": QUERIES[9]}])
+        client.close()
+
+    def test_invalid_chunk_size(self):
+        client = EngineClient(url=self.server.url, threads=1)
+        self.assertRaises(InvalidArgumentError, client.asend_queries,
+                          QUERIES, 0)
+        self.assertRaises(InvalidArgumentError, client.send_queries,
+                          QUERIES, 0)
+        self.assertEqual(self.server.requests, 0)
+        client.close()
+
+    @unittest.skipIf(AsyncEngineClient is None,
+                     "asyncio clients need Python 3.5+")
+    def test_async_send_queries(self):
+        loop = asyncio.new_event_loop()
+        client = AsyncEngineClient(url=self.server.url)
+        self.assertPredictions(
+            loop.run_until_complete(client.send_queries(QUERIES, 3)))
+        self.assertRaises(InvalidArgumentError, loop.run_until_complete,
+                          client.send_queries(QUERIES, 0))
+        self.assertEqual(self.server.requests, 4)
+        client.close()
+        loop.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+import logging
+import time
+import unittest
+
+from predictionio import EngineClient
+from predictionio import QueryCache
+from predictionio import RequestLog
+
+from benchmarks.mock_server import MockServer
+
+
+class ListHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class QueryCacheTest(unittest.TestCase):
+
+    def test_canonical_key(self):
+        self.assertEqual(QueryCache.key({"user": "1", "num": 4}),
+                         QueryCache.key({"num": 4, "user": "1"}))
+        self.assertNotEqual(QueryCache.key({"user": "1", "num": 4}),
+                            QueryCache.key({"user": "1", "num": 5}))
+
+    def test_hit_and_miss(self):
+        cache = QueryCache()
+        self.assertEqual(cache.get("q"), (False, None, False))
+        cache.put("q", {"itemScores": []})
+        self.assertEqual(cache.get("q"), (True, {"itemScores": []}, False))
+        self.assertEqual(cache.stats(), {"size": 1, "hits": 1,
+                                         "stale_hits": 0, "misses": 1})
+
+    def test_lru_eviction(self):
+        cache = QueryCache(max_size=2)
+        cache.put("a", 1)
+        cache.put("b", 2)
+        cache.get("a")
+        cache.put("c", 3)
+        self.assertTrue(cache.get("a")[0])
+        self.assertFalse(cache.get("b")[0])
+        self.assertTrue(cache.get("c")[0])
+
+    def test_expiry(self):
+        cache = QueryCache(ttl=0.01)
+        cache.put("a", 1)
+        time.sleep(0.02)
+        self.assertEqual(cache.get("a"), (False, None, False))
+
+    def test_stale_while_refresh(self):
+        cache = QueryCache(ttl=0.01, stale_ttl=60)
+        cache.put("a", 1)
+        time.sleep(0.02)
+        # only the first caller refreshes
+        self.assertEqual(cache.get("a"), (True, 1, True))
+        self.assertEqual(cache.get("a"), (True, 1, False))
+        cache.refresh_failed("a")
+        self.assertEqual(cache.get("a"), (True, 1, True))
+        cache.put("a", 2)
+        self.assertEqual(cache.get("a"), (True, 2, False))
+
+    def test_invalidate(self):
+        cache = QueryCache()
+        cache.put(QueryCache.key({"user": "1"}), 1)
+        cache.put(QueryCache.key({"user": "2"}), 2)
+        cache.invalidate({"user": "1"})
+        self.assertFalse(cache.get(QueryCache.key({"user": "1"}))[0])
+        self.assertTrue(cache.get(QueryCache.key({"user": "2"}))[0])
+        cache.invalidate()
+        self.assertEqual(cache.stats()["size"], 0)
+
+
+class CachedQueryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockServer().start()
+        self.logger = logging.getLogger("predictionio.requests.test")
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.propagate = False
+        self.handler = ListHandler()
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+        self.server.stop()
+
+    def assertRefreshNotReported(self, **options):
+        called = []
+        log = RequestLog(self.logger, sample_rate=1)
+        client = EngineClient(url=self.server.url, threads=1,
+                              cache=QueryCache(ttl=0.01, stale_ttl=60),
+                              callback=called.append, request_log=log,
+                              **options)
+        query = {"user": "1"}
+        self.assertEqual(client.send_query(query), {"query": query})
+        time.sleep(0.02)
+        # the stale prediction, refreshed in the background
+        self.assertEqual(client.send_query(query), {"query": query})
+        client.close()
+        self.assertEqual(self.server.requests, 2)
+        # once per send_query, and only the first http request is sampled
+        self.assertEqual(len(called), 2)
+        self.assertEqual(len(self.handler.records), 1)
+        log.close()
+
+    def test_refresh_not_reported(self):
+        self.assertRefreshNotReported()
+
+    def test_refresh_not_reported_single_flight(self):
+        self.assertRefreshNotReported(single_flight=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
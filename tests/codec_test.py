@@ -0,0 +1,55 @@
+import unittest
+
+from predictionio import get_codec
+from predictionio.codec import CODECS
+from predictionio.connection import AsyncResponse
+
+
+class CodecTest(unittest.TestCase):
+
+    def test_codecs(self):
+        event = {"event": "view", "properties": {"name": u"\u00e9"}}
+        for name in CODECS:
+            encoder, decoder = get_codec(name)
+            body = encoder(event)
+            if not isinstance(body, bytes):
+                body = body.encode("utf8")
+            self.assertEqual(decoder(body), event)
+
+    def test_non_str_keys_and_big_ints(self):
+        for name in CODECS:
+            encoder, decoder = get_codec(name)
+            body = encoder({1: "a", "big": 2 ** 70})
+            if not isinstance(body, bytes):
+                body = body.encode("utf8")
+            self.assertEqual(decoder(body), {"1": "a", "big": 2 ** 70})
+
+    def test_fallback(self):
+        self.assertIn("json", CODECS)
+        self.assertIn(get_codec(), CODECS.values())
+
+    def test_lazy_json_body(self):
+        decoded = []
+
+        def decoder(body):
+            decoded.append(body)
+            return {"eventId": "1"}
+
+        response = AsyncResponse()
+        response.set_resp(version=11, status=201, reason="Created",
+                          headers={}, body=b'{"eventId": "1"}',
+                          decoder=decoder)
+        self.assertEqual(decoded, [])
+        self.assertEqual(response.json_body, {"eventId": "1"})
+        self.assertEqual(response.json_body, {"eventId": "1"})
+        self.assertEqual(len(decoded), 1)
+
+    def test_invalid_json_body(self):
+        response = AsyncResponse()
+        response.set_resp(version=11, status=500, reason="Error",
+                          headers={}, body=b'<html>')
+        self.assertIsNone(response.json_body)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+from predictionio import AdaptiveConcurrency
+from predictionio.connection import AsyncRequest
+from predictionio.connection import AsyncResponse
+
+
+def _request(status):
+    request = AsyncRequest("POST", "/events.json")
+    response = AsyncResponse()
+    response.set_resp(11, status, "", {}, b"{}")
+    request.set_response(response)
+    return request
+
+
+class AdaptiveConcurrencyTest(unittest.TestCase):
+
+    def test_grows_with_queue(self):
+        concurrency = AdaptiveConcurrency(min_threads=2, max_threads=4)
+        for i in range(5):
+            concurrency.sample(0.01, [_request(201)])
+            concurrency.update(queue_depth=100)
+        self.assertEqual(concurrency.limit, 4)
+
+    def test_shrinks_when_idle(self):
+        concurrency = AdaptiveConcurrency(min_threads=1, max_threads=4)
+        concurrency.limit = 3
+        concurrency.update(queue_depth=0)
+        self.assertEqual(concurrency.limit, 2)
+        # a backlog without completed requests is not idle
+        concurrency.update(queue_depth=10)
+        self.assertEqual(concurrency.limit, 2)
+
+    def test_backs_off_on_latency_and_errors(self):
+        concurrency = AdaptiveConcurrency(min_threads=1, max_threads=16)
+        concurrency.limit = 16
+        concurrency.sample(0.01, [_request(201)])
+        concurrency.update(queue_depth=100)
+        self.assertEqual(concurrency.limit, 16)
+        concurrency.sample(0.1, [_request(201)])
+        concurrency.update(queue_depth=100)
+        self.assertEqual(concurrency.limit, 12)
+        concurrency.sample(0.01, [_request(503)])
+        concurrency.update(queue_depth=100)
+        self.assertEqual(concurrency.limit, 9)
+
+    def test_bounds(self):
+        self.assertRaises(ValueError, AdaptiveConcurrency, 4, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
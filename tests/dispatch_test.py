@@ -0,0 +1,107 @@
+import gc
+import json
+import threading
+import time
+import unittest
+
+from predictionio.connection import AsyncRequest
+from predictionio.connection import AsyncResponse
+from predictionio.connection import Connection
+from predictionio.connection import _dispatch
+from predictionio.connection import _send_batch
+
+from benchmarks.mock_server import MockServer
+
+
+def _response(status, body):
+    response = AsyncResponse()
+    response.set_resp(11, status, "", {}, json.dumps(body).encode("utf8"))
+    return response
+
+
+class FakeConnection(object):
+    """PredictionIOHttpConnection answering every request with status 200,
+    or 201 for every event of a batch, and recording the http requests
+    sent"""
+
+    encoder = staticmethod(json.dumps)
+    metrics = None
+
+    def __init__(self):
+        self.sent = []
+
+    def request(self, method, url, body={}, headers={}, trace=None,
+                resend=True, sampled=True):
+        self.sent.append([(method, url, body)])
+        if url.startswith("/batch/"):
+            return _response(200, [{"status": 201}
+                                   for e in json.loads(body.decode("utf8"))])
+        return _response(200, {})
+
+    def pipeline_request(self, requests, trace=None, resend=None,
+                         sampled=None):
+        self.sent.append(requests)
+        return [_response(200, {}) for r in requests]
+
+
+class DispatchTest(unittest.TestCase):
+
+    def test_not_pipelined(self):
+        connect = FakeConnection()
+        requests = [AsyncRequest("POST", "/events.json", event="view"),
+                    AsyncRequest("GET", "/")]
+        _dispatch(connect, requests)
+        self.assertEqual([len(sent) for sent in connect.sent], [1, 1])
+        self.assertTrue(all(r.done() for r in requests))
+
+    def test_pipelined(self):
+        connect = FakeConnection()
+        requests = [AsyncRequest("GET", "/"), AsyncRequest("GET", "/")]
+        _dispatch(connect, requests, pipeline=2)
+        self.assertEqual([len(sent) for sent in connect.sent], [2])
+        self.assertTrue(all(r.done() for r in requests))
+
+    def test_batch_with_unserializable_event(self):
+        connect = FakeConnection()
+        batch = [AsyncRequest("POST", "/events.json", event=str(i))
+                 for i in range(3)]
+        batch[1].params["properties"] = {"x": object()}
+        for r in batch:
+            r.batch_path = "/batch/events.json"
+        self.assertEqual(_send_batch(connect, batch), 0)
+        [(method, url, body)] = connect.sent[0]
+        self.assertEqual(json.loads(body.decode("utf8")),
+                         [{"event": "0"}, {"event": "2"}])
+        self.assertIsInstance(batch[1]._raw_response.error, TypeError)
+        self.assertEqual([batch[0]._raw_response.status,
+                          batch[2]._raw_response.status], [201, 201])
+
+
+class InlineConnectionTest(unittest.TestCase):
+
+    def test_closed_when_thread_ends(self):
+        with MockServer() as server:
+            connection = Connection(server.url[len("http://"):], threads=0,
+                                    https=False)
+            requests = [AsyncRequest("GET", "/") for i in range(3)]
+            threads = [threading.Thread(target=connection.make_request,
+                                        args=(r,)) for r in requests]
+            for t in threads:
+                t.start()
+                t.join()
+            # python 2 clears the locals of a thread after join() returns
+            for i in range(100):
+                gc.collect()
+                if not connection._inline_connections:
+                    break
+                time.sleep(0.01)
+            self.assertEqual(len(connection._inline_connections), 0)
+            self.assertEqual([r.get_response().status for r in requests],
+                             [200] * 3)
+            connection.make_request(AsyncRequest("GET", "/"))
+            self.assertEqual(len(connection._inline_connections), 1)
+            connection.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
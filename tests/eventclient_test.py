@@ -3,6 +3,7 @@ import subprocess
 import unittest
 
 from datetime import datetime
+from predictionio import ConnectionPool
 from predictionio import EventClient
 from predictionio import NotFoundError
 from predictionio import InvalidArgumentError
@@ -175,6 +176,120 @@ class EventClientTest(unittest.TestCase):
         self.assertEqual(response.status, 201)
 
 
+    def test_create_events(self):
+        client = EventClient(access_key=access_key, url="http://127.0.0.1:7070")
+
+        events = [{
+            "event": "view",
+            "entity_type": "user",
+            "entity_id": str(i),
+            "target_entity_type": "item",
+            "target_entity_id": str(i % 7),
+            "event_time": datetime(2014, 12, 13, 21, 38, 45, 618000, pytz.utc),
+        } for i in range(120)]
+        print("Create events")
+        results = client.create_events(events)
+        self.assertEqual(len(results), len(events))
+        for event, (result_event, status) in zip(events, results):
+            self.assertIs(result_event, event)
+            self.assertEqual(status["status"], 201)
+
+        # Check that a created event can be retrieved
+        event = client.get_event(results[0][1]["eventId"])
+        print(event)
+        self.assertEqual(event.get('entityId'), "0")
+
+        client.close()
+
+
+    def test_eventclient_batching(self):
+        client = EventClient(access_key=access_key, url="http://127.0.0.1:7070",
+                             threads=2, batch_size=50, linger_ms=20)
+
+        print("Record user actions with batching")
+        requests = [client.arecord_user_action_on_item("view", str(i), "bar")
+                    for i in range(120)]
+        responses = [r.get_response() for r in requests]
+        for response in responses:
+            self.assertEqual(response.status, 201)
+
+        # Each response carries the id of its own event
+        event_id = responses[7].json_body["eventId"]
+        event = client.get_event(event_id)
+        print(event)
+        self.assertEqual(event.get('entityId'), "7")
+
+        client.close()
+
+
+    def test_eventclient_pipelining(self):
+        client = EventClient(access_key=access_key, url="http://127.0.0.1:7070",
+                             pipeline=8)
+
+        print("Set users with pipelining")
+        requests = [client.aset_user(str(i)) for i in range(50)]
+        get_request = client.aget_event("no-such-event")
+        for r in requests:
+            self.assertEqual(r.get_response().status, 201)
+        # responses are matched to their requests in order
+        self.assertRaises(NotFoundError, get_request.get_response)
+
+        client.close()
+
+
+    def test_connection_pool(self):
+        pool = ConnectionPool(max_connections=4)
+        client = EventClient(access_key=access_key, url="http://127.0.0.1:7070",
+                             threads=4, pool=pool)
+        other_client = EventClient(access_key=access_key,
+                                   url="http://127.0.0.1:7070", threads=4,
+                                   pool=pool)
+        self.assertEqual(pool.connections(), 4)
+
+        print("Set users through a shared connection")
+        response = client.set_user("foo")
+        self.assertEqual(response.status, 201)
+        response = other_client.set_user("bar")
+        self.assertEqual(response.status, 201)
+
+        client.close()
+        self.assertEqual(other_client.set_user("baz").status, 201)
+        other_client.close()
+        self.assertEqual(pool.connections(), 0)
+
+
+    def test_eventclient_inline(self):
+        client = EventClient(access_key=access_key, url="http://127.0.0.1:7070",
+                             threads=0)
+
+        print("Set user without threads")
+        response = client.set_user("foo")
+        self.assertEqual(response.status, 201)
+        # asynchronous requests are already complete when returned
+        request = client.aget_event(response.json_body["eventId"])
+        self.assertEqual(client.pending_requests(), 0)
+        self.assertEqual(request.get_response().get('entityId'), "foo")
+
+        client.close()
+
+    def test_import_stream(self):
+        client = EventClient(access_key=access_key, url="http://127.0.0.1:7070",
+                             threads=4)
+
+        print("Import a stream of events")
+        events = ({"event": "view", "entity_type": "user",
+                   "entity_id": str(i), "target_entity_type": "item",
+                   "target_entity_id": "bar"} for i in range(100))
+        entity_ids = set()
+        for event, response in client.import_stream(events, max_in_flight=10):
+            self.assertEqual(response.status, 201)
+            entity_ids.add(event["entity_id"])
+            self.assertLessEqual(client.pending_requests(), 10)
+        self.assertEqual(entity_ids, set(str(i) for i in range(100)))
+
+        client.close()
+
+
     def test_eventclient_channel(self):
         subprocess.call(['pio', 'app', 'channel-new', app_name, channel])
 
@@ -0,0 +1,81 @@
+import pytz
+import sys
+import unittest
+
+from datetime import datetime
+from datetime import timedelta
+from datetime import tzinfo
+from predictionio import format_event_time
+
+
+def strftime_event_time(t):
+    # the formatting used by the SDK before format_event_time
+    return t.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + t.strftime("%z")
+
+
+class UnhashableTz(tzinfo):
+    # like the tzinfos of dateutil, eg. tzutc()
+    __hash__ = None
+
+    def utcoffset(self, dt):
+        return timedelta(hours=-8)
+
+    def dst(self, dt):
+        return timedelta(0)
+
+
+class FormatEventTimeTest(unittest.TestCase):
+
+    def test_same_as_strftime(self):
+        times = [
+            datetime(2004, 12, 13, 21, 39, 45, 618000, pytz.timezone('US/Mountain')),
+            datetime(2014, 12, 13, 21, 38, 45, 618999, pytz.utc),
+            datetime(2014, 8, 31, 4, 56, tzinfo=pytz.timezone('US/Pacific')),
+            pytz.timezone('US/Pacific').localize(datetime(2014, 8, 31, 4, 56)),
+            pytz.timezone('US/Pacific').localize(datetime(2014, 1, 31, 4, 56)),
+            pytz.timezone('Asia/Kolkata').localize(datetime(1999, 1, 1, 0, 0, 0, 1)),
+            datetime(1970, 1, 1, tzinfo=pytz.FixedOffset(-90)),
+        ]
+        if sys.version_info[0] >= 3:
+            # strftime of python 2 rejects the years before 1900
+            times.append(datetime(999, 1, 2, 3, 4, 5, 6000, pytz.utc))
+        for t in times:
+            # twice, to use the cached offset
+            self.assertEqual(format_event_time(t), strftime_event_time(t))
+            self.assertEqual(format_event_time(t), strftime_event_time(t))
+
+    def test_dst_changes(self):
+        tz = pytz.timezone('Europe/Paris')
+        t = tz.localize(datetime(2017, 3, 25, 12))
+        for i in range(4):
+            t = tz.normalize(t + timedelta(hours=12))
+            self.assertEqual(format_event_time(t), strftime_event_time(t))
+
+    def test_unhashable_tzinfo(self):
+        t = datetime(2014, 9, 9, 16, 17, 42, 937000, UnhashableTz())
+        self.assertEqual(format_event_time(t), "2014-09-09T16:17:42.937-0800")
+
+    def test_epoch_milliseconds(self):
+        self.assertEqual(format_event_time(0), "1970-01-01T00:00:00.000+0000")
+        self.assertEqual(format_event_time(1410279462937),
+                         "2014-09-09T16:17:42.937+0000")
+        self.assertEqual(format_event_time(1410279462937.9),
+                         "2014-09-09T16:17:42.937+0000")
+
+    def test_string(self):
+        self.assertEqual(format_event_time("2014-09-09T16:17:42.937-08:00"),
+                         "2014-09-09T16:17:42.937-08:00")
+
+    def test_now(self):
+        before = datetime.now(pytz.utc).replace(microsecond=0)
+        now = datetime.strptime(format_event_time(None)[:19],
+                                "%Y-%m-%dT%H:%M:%S")
+        self.assertTrue(now >= before.replace(tzinfo=None))
+
+    def test_invalid(self):
+        self.assertRaises(AttributeError, format_event_time, datetime(2014, 1, 1))
+        self.assertRaises(AttributeError, format_event_time, [2014])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,11 @@
+import gzip
+import json
+import os
 import pytz
 import re
+import shutil
 import subprocess
+import tempfile
 import unittest
 
 from datetime import datetime
@@ -11,6 +16,13 @@ app_name ='FileExporterApp'
 access_key = 'FILE_EXPORT_TEST'
 filename = 'export_events.json'
 
+
+def dying_shard_events(shard, shards):
+    if shard == 1:
+        os._exit(1)
+    return []
+
+
 class FileExporterTest(unittest.TestCase):
 
     def setUp(self):
@@ -70,5 +82,69 @@ class FileExporterTest(unittest.TestCase):
         # print(event)
         # self.assertEqual(event.get('eventId'), event_id)
 
+    def test_export_compressed(self):
+        exporter = predictionio.FileExporter(
+            file_name='export_events.json.gz', max_events=10)
+
+        for i in range(25):
+            exporter.create_event(
+                event="view",
+                entity_type="user",
+                entity_id=str(i),
+                event_time=datetime(2014, 12, 13, 21, 38, 45, 618000, pytz.utc))
+
+        exporter.close()
+
+        self.assertEqual(exporter.file_names, [
+            'export_events-00001.json.gz',
+            'export_events-00002.json.gz',
+            'export_events-00003.json.gz'])
+        lines = []
+        for name in exporter.file_names:
+            with gzip.open(name) as f:
+                lines.extend(f.read().decode('utf-8').splitlines())
+            os.remove(name)
+        self.assertEqual(len(lines), 25)
+        self.assertEqual(json.loads(lines[24])["entityId"], "24")
+        self.assertEqual(json.loads(lines[0])["eventTime"],
+                         "2014-12-13T21:38:45.618+0000")
+
+    def test_parallel_export(self):
+        exporter = predictionio.ParallelFileExporter(
+            file_name='export_events.json', processes=3, chunk_size=10)
+
+        file_names = exporter.export({
+            "event": "view",
+            "entity_type": "user",
+            "entity_id": str(i),
+            "event_time": datetime(2014, 12, 13, 21, 38, 45, 618000, pytz.utc),
+        } for i in range(100))
+
+        self.assertEqual(file_names, [
+            'export_events-00000-of-00003.json',
+            'export_events-00001-of-00003.json',
+            'export_events-00002-of-00003.json'])
+        entity_ids = []
+        for name in file_names:
+            with open(name) as f:
+                entity_ids.extend(json.loads(l)["entityId"] for l in f)
+            os.remove(name)
+        self.assertEqual(sorted(entity_ids, key=int),
+                         [str(i) for i in range(100)])
+        # chunks are handed to the processes in turn
+        self.assertEqual(entity_ids[:10], [str(i) for i in range(10)])
+
+    def test_parallel_export_process_died(self):
+        # the shards are created before the process dies
+        directory = tempfile.mkdtemp()
+        try:
+            exporter = predictionio.ParallelFileExporter(
+                file_name=os.path.join(directory, 'export_events.json'),
+                processes=2)
+            self.assertRaises(predictionio.PredictionIOAPIError,
+                              exporter.export, dying_shard_events)
+        finally:
+            shutil.rmtree(directory)
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+
+from predictionio.connection import AsyncRequest
+from predictionio.connection import AsyncResponse
+from predictionio.metrics import Histogram
+from predictionio.metrics import Metrics
+from predictionio.metrics import endpoint
+
+
+def _response(status=200, body=b"{}", error=None):
+    response = AsyncResponse()
+    if error is not None:
+        response.set_error(error)
+    else:
+        response.set_resp(11, status, "", {}, body)
+    return response
+
+
+class HistogramTest(unittest.TestCase):
+
+    def test_percentiles(self):
+        h = Histogram()
+        self.assertIsNone(h.percentile(50))
+        for i in range(99):
+            h.record(0.001)
+        h.record(1.0)
+        # upper bounds of the buckets, within a factor sqrt(2)
+        self.assertTrue(0.001 <= h.percentile(50) < 0.0015)
+        self.assertTrue(1.0 <= h.percentile(99.9) < 1.5)
+        self.assertEqual(h.count, 100)
+        self.assertAlmostEqual(h.sum, 1.099)
+
+    def test_out_of_range(self):
+        h = Histogram()
+        h.record(0)
+        h.record(1e6)
+        self.assertEqual(h.percentile(100), float("inf"))
+
+
+class MetricsTest(unittest.TestCase):
+
+    def test_endpoint(self):
+        self.assertEqual(endpoint("/events.json?accessKey=abc"),
+                         "/events.json")
+        self.assertEqual(endpoint("/events/a1b2.json?accessKey=abc"),
+                         "/events/{id}.json")
+
+    def test_snapshot(self):
+        metrics = Metrics()
+        metrics.record_exchange("/queries.json", 0.01, 100,
+                                _response(body=b"x" * 10))
+        metrics.record_exchange("/queries.json", 0.02, 100, _response(503))
+        metrics.record_exchange("/queries.json", 5, 100,
+                                _response(error=ValueError("bad body")))
+        metrics.record_retry()
+        request = AsyncRequest("POST", "/queries.json")
+        metrics.record_dequeued([request], request.queued + 0.5)
+        self.assertEqual(metrics.snapshot()["in_flight"], 1)
+        metrics.record_sent([request], 0.01)
+
+        stats = metrics.snapshot()
+        self.assertEqual(stats["requests"], 3)
+        self.assertEqual(stats["in_flight"], 0)
+        self.assertEqual(stats["bytes_sent"], 300)
+        self.assertEqual(stats["bytes_received"], 12)
+        self.assertEqual(stats["retries"], 1)
+        self.assertEqual(stats["errors"], {"http_503": 1, "ValueError": 1})
+        self.assertEqual(stats["latency"]["/queries.json"]["count"], 3)
+        self.assertEqual(stats["queue_time"]["count"], 1)
+        self.assertTrue(stats["queue_time"]["p50"] >= 0.5)
+
+    def test_prometheus_text(self):
+        metrics = Metrics()
+        metrics.record_exchange("/events.json", 0.01, 100, _response(201))
+        text = metrics.prometheus_text(gauges={"queue_depth": 3})
+        self.assertIn('predictionio_request_duration_seconds_count'
+                      '{endpoint="/events.json"} 1', text)
+        self.assertIn('predictionio_request_duration_seconds_bucket'
+                      '{endpoint="/events.json",le="+Inf"} 1', text)
+        self.assertIn("predictionio_queue_depth 3", text)
+        self.assertIn("predictionio_requests_total 1", text)
+
+
+if __name__ == "__main__":
+    unittest.main()
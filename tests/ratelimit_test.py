@@ -0,0 +1,49 @@
+import json
+import time
+import unittest
+
+from predictionio import RateLimiter
+from predictionio.connection import AsyncRequest
+from predictionio.connection import _throttle
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def test_events_per_second(self):
+        limiter = RateLimiter(events_per_second=100, burst=0.1)
+        start = time.time()
+        for i in range(30):
+            self.assertTrue(limiter.acquire(1))
+        # 10 events of burst, then 20 events at 100 per second
+        self.assertGreaterEqual(time.time() - start, 0.15)
+
+    def test_batch_larger_than_burst(self):
+        limiter = RateLimiter(events_per_second=100, burst=0.1)
+        self.assertTrue(limiter.acquire(50))
+        start = time.time()
+        # the batch left the bucket in debt
+        self.assertTrue(limiter.acquire(1))
+        self.assertGreaterEqual(time.time() - start, 0.3)
+
+    def test_bytes_per_second(self):
+        limiter = RateLimiter(bytes_per_second=1000, block=False)
+        self.assertTrue(limiter.acquire(1, 1000))
+        self.assertFalse(limiter.acquire(1, 100))
+
+    def test_reject(self):
+        limiter = RateLimiter(events_per_second=10, block=False)
+        results = [limiter.acquire(1) for i in range(15)]
+        self.assertEqual(results.count(True), 10)
+
+    def test_unserializable_body(self):
+        limiter = RateLimiter(bytes_per_second=1000)
+        bad = AsyncRequest("POST", "/events.json", x=object())
+        good = AsyncRequest("POST", "/events.json", x=1)
+        kept, bodies = _throttle(limiter, [bad, good], json.dumps)
+        self.assertEqual(kept, [good])
+        self.assertEqual(bodies, {id(good): b'{"x": 1}'})
+        self.assertIsInstance(bad._raw_response.error, TypeError)
+
+
+if __name__ == "__main__":
+    unittest.main()
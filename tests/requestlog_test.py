@@ -0,0 +1,93 @@
+import logging
+import threading
+import unittest
+
+from predictionio import RequestLog
+from predictionio.connection import AsyncResponse
+
+
+def _response(status=200, body=b"{}", error=None):
+    response = AsyncResponse()
+    if error is not None:
+        response.set_error(error)
+    else:
+        response.set_resp(11, status, "", {}, body)
+    return response
+
+
+class ListHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class RequestLogTest(unittest.TestCase):
+
+    def setUp(self):
+        self.logger = logging.getLogger("predictionio.requests.test")
+        self.logger.setLevel(logging.DEBUG)
+        self.logger.propagate = False
+        self.handler = ListHandler()
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+
+    def test_sampling(self):
+        log = RequestLog(self.logger, sample_rate=10)
+        for i in range(100):
+            log.log("POST", "/events.json?accessKey=secret", 0.01,
+                    _response(201))
+        log.flush()
+        self.assertEqual(len(self.handler.records), 10)
+        record = self.handler.records[0]
+        self.assertEqual(record.levelno, logging.DEBUG)
+        self.assertEqual(record.url, "/events.json")
+        self.assertNotIn("secret", record.getMessage())
+        log.close()
+
+    def test_errors_always_logged(self):
+        log = RequestLog(self.logger, sample_rate=0)
+        log.log("POST", "/events.json", 0.01, _response(201))
+        log.log("POST", "/events.json", 0.01, _response(503))
+        log.log("GET", "/", 0.01, _response(error=IOError("refused")))
+        log.flush()
+        self.assertEqual([(r.levelno, r.status)
+                          for r in self.handler.records],
+                         [(logging.WARNING, 503), (logging.WARNING, None)])
+        self.assertIn("refused", self.handler.records[1].getMessage())
+        log.close()
+
+    def test_truncated_body(self):
+        log = RequestLog(self.logger, sample_rate=1, max_body=10)
+        log.log("POST", "/batch/events.json", 0.01,
+                _response(200, b"x" * 1000))
+        log.flush()
+        self.assertEqual(self.handler.records[0].body, b"x" * 10)
+        log.close()
+
+    def test_full_queue(self):
+        blocked = threading.Event()
+
+        class BlockingHandler(logging.Handler):
+            def emit(self, record):
+                blocked.wait()
+
+        handler = BlockingHandler()
+        self.logger.addHandler(handler)
+        log = RequestLog(self.logger, sample_rate=1, queue_size=2)
+        for i in range(10):
+            log.log("GET", "/", 0.01, _response())
+        # one record is being handled, two are queued
+        self.assertTrue(log.dropped >= 7)
+        blocked.set()
+        log.close()
+        self.logger.removeHandler(handler)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+import os
+import socket
+import sys
+import threading
+import time
+import unittest
+
+from predictionio import RetryPolicy
+from predictionio.connection import AsyncRequest
+from predictionio.connection import AsyncResponse
+from predictionio.connection import Connection
+from predictionio.connection import MAX_RETRY
+from predictionio.connection import _dropped
+
+try:
+    import resource
+except ImportError:
+    # windows
+    resource = None
+
+
+def _response(status=None, headers=None, error=None):
+    response = AsyncResponse()
+    if error is not None:
+        response.set_error(error)
+    else:
+        response.set_resp(11, status, "", headers or {}, b"")
+    return response
+
+
+class RetryPolicyTest(unittest.TestCase):
+
+    def test_exponential_backoff(self):
+        policy = RetryPolicy(max_attempts=4, backoff=0.1, max_backoff=0.3,
+                             jitter=0)
+        request = AsyncRequest("GET", "/")
+        delays = []
+        while True:
+            delay = policy.delay(request, _response(503))
+            if delay is None:
+                break
+            delays.append(delay)
+            request.attempts += 1
+        self.assertEqual(delays, [0.1, 0.2, 0.3])
+
+    def test_jitter(self):
+        policy = RetryPolicy(backoff=1, jitter=0.5)
+        for i in range(20):
+            delay = policy.delay(AsyncRequest("GET", "/"), _response(429))
+            self.assertTrue(0.5 <= delay <= 1)
+
+    def test_final_responses(self):
+        policy = RetryPolicy()
+        request = AsyncRequest("GET", "/")
+        self.assertIsNone(policy.delay(request, _response(200)))
+        self.assertIsNone(policy.delay(request, _response(404)))
+
+    def test_idempotency(self):
+        policy = RetryPolicy()
+        error = _response(error=IOError("connection refused"))
+        self.assertIsNotNone(policy.delay(AsyncRequest("GET", "/"), error))
+        post = AsyncRequest("POST", "/events.json")
+        self.assertIsNone(policy.delay(post, error))
+        # the server did not handle a rejected POST
+        self.assertIsNotNone(policy.delay(post, _response(503)))
+
+    def test_retry_after(self):
+        policy = RetryPolicy(backoff=0.1)
+        response = _response(503, {"retry-after": "2"})
+        self.assertEqual(policy.delay(AsyncRequest("GET", "/"), response), 2)
+
+    def test_deadline(self):
+        policy = RetryPolicy(backoff=1, jitter=0, deadline=0.5)
+        request = AsyncRequest("GET", "/")
+        self.assertIsNone(policy.delay(request, _response(503)))
+        request = AsyncRequest("GET", "/")
+        request.created = time.time() - 10
+        self.assertIsNone(RetryPolicy(deadline=5).delay(request,
+                                                        _response(503)))
+
+
+class DroppingServer(object):
+    """server closing every connection once it received a request, without
+    answering it"""
+
+    def __init__(self):
+        self.sock = socket.socket()
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.listen(16)
+        self.host = "127.0.0.1:%s" % self.sock.getsockname()[1]
+        self.requests = 0
+        thread = threading.Thread(target=self._run)
+        thread.daemon = True
+        thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                conn, address = self.sock.accept()
+            except (OSError, socket.error):
+                return
+            if conn.recv(65536):
+                self.requests += 1
+            conn.close()
+
+    def close(self):
+        self.sock.close()
+
+
+class ResendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = DroppingServer()
+
+    def tearDown(self):
+        self.server.close()
+
+    def _send(self, request, retry):
+        connection = Connection(self.server.host, threads=0, https=False,
+                                retry=retry)
+        connection.make_request(request)
+        self.assertIsNotNone(request._raw_response.error)
+        connection.close()
+        return self.server.requests
+
+    def test_post_not_sent_again_with_policy(self):
+        request = AsyncRequest("POST", "/events.json", event="view")
+        self.assertEqual(self._send(request, RetryPolicy()), 1)
+
+    def test_post_sent_again_without_policy(self):
+        request = AsyncRequest("POST", "/events.json", event="view")
+        self.assertEqual(self._send(request, None), MAX_RETRY + 1)
+
+    def test_get_sent_again_with_policy(self):
+        request = AsyncRequest("GET", "/")
+        self.assertEqual(self._send(request, RetryPolicy(max_attempts=1)),
+                         MAX_RETRY + 1)
+
+
+class DroppedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sock, self.peer = socket.socketpair()
+
+    def tearDown(self):
+        self.sock.close()
+        self.peer.close()
+
+    def test_idle(self):
+        self.assertFalse(_dropped(self.sock))
+
+    def test_closed_by_peer(self):
+        self.peer.close()
+        self.assertTrue(_dropped(self.sock))
+
+    def test_unexpected_data(self):
+        self.peer.sendall(b"HTTP/1.1 408 Request Timeout\r\n\r\n")
+        self.assertTrue(_dropped(self.sock))
+
+    @unittest.skipIf(resource is None or sys.version_info < (3,),
+                     "needs resource, and socket(fileno=) of python 3")
+    def test_large_file_descriptor(self):
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft <= 2000:
+            self.skipTest("cannot open 2000 files")
+        os.dup2(self.sock.fileno(), 2000)
+        sock = socket.socket(fileno=2000)
+        try:
+            self.assertFalse(_dropped(sock))
+            self.peer.close()
+            self.assertTrue(_dropped(sock))
+        finally:
+            sock.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import io
+import json
+import unittest
+
+from predictionio import NotFoundError
+from predictionio.score import read_queries
+from predictionio.score import score
+
+
+class _Request(object):
+
+    def __init__(self, result):
+        self.result = result
+
+    def get_response(self):
+        if isinstance(self.result, Exception):
+            raise self.result
+        return self.result
+
+
+class _Client(object):
+    """answers queries right away, failing those of user "bad"."""
+
+    def __init__(self):
+        self.sent = 0
+
+    def asend_query(self, query):
+        self.sent += 1
+        if query["user"] == "bad":
+            return _Request(NotFoundError("bad user"))
+        return _Request({"user": query["user"]})
+
+    def asend_queries(self, queries, chunk_size):
+        self.sent += 1
+        return [_Request([{"user": q["user"]} for q in queries])]
+
+
+class ScoreTest(unittest.TestCase):
+
+    def test_read_queries(self):
+        jsonl = io.StringIO(u'{"user": "1"}\n\n{"user": "2"}\n')
+        self.assertEqual(list(read_queries(jsonl)),
+                         [{"user": "1"}, {"user": "2"}])
+        csv = io.StringIO(u"user,num\n1,4\n")
+        self.assertEqual(list(read_queries(csv, "csv", ["num"])),
+                         [{"user": "1", "num": 4}])
+
+    def test_score_in_order(self):
+        queries = [{"user": str(i)} for i in range(10)] + [{"user": "bad"}]
+        output = io.BytesIO()
+        checkpoints = []
+        self.assertEqual(score(_Client(), queries, output, window=3,
+                               checkpoint=checkpoints.append), 11)
+        lines = [json.loads(l) for l in output.getvalue().splitlines()]
+        self.assertEqual([l["query"] for l in lines], queries)
+        self.assertEqual(lines[3]["prediction"], {"user": "3"})
+        self.assertEqual(lines[10]["error"], "bad user")
+        self.assertEqual(checkpoints[-1], 11)
+
+    def test_score_batches(self):
+        client = _Client()
+        queries = [{"user": str(i)} for i in range(10)]
+        output = io.BytesIO()
+        self.assertEqual(score(client, queries, output, batch_size=4), 10)
+        self.assertEqual(client.sent, 3)
+        self.assertEqual(len(output.getvalue().splitlines()), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
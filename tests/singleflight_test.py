@@ -0,0 +1,90 @@
+import time
+import unittest
+
+from predictionio import EngineClient
+from predictionio import PredictionIOAPIError
+
+from benchmarks.mock_server import MockServer
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MockServer().start()
+        self.client = EngineClient(url=self.server.url, threads=1,
+                                   single_flight=True)
+
+    def tearDown(self):
+        self.server.release()
+        self.client.close()
+        self.server.stop()
+
+    def _hold_worker(self):
+        """keep the connection thread busy, so that the next queries stay
+        queued"""
+        self.server.hold()
+        request = self.client.asend_query({"user": "blocker"})
+        while self.server.requests == 0:
+            time.sleep(0.01)
+        return request
+
+    def test_one_http_request(self):
+        self.server.hold()
+        requests = [self.client.asend_query({"user": "1", "num": 4})
+                    for i in range(5)]
+        # same query, whatever the order of its keys
+        requests.append(self.client.asend_query({"num": 4, "user": "1"}))
+        self.server.release()
+        results = [r.get_response(5) for r in requests]
+        self.assertEqual(self.server.requests, 1)
+        self.assertEqual(results,
+                         [{"query": {"user": "1", "num": 4}}] * 6)
+        self.assertEqual(self.client._in_flight, {})
+
+    def test_different_queries(self):
+        self.server.hold()
+        first = self.client.asend_query({"user": "1"})
+        second = self.client.asend_query({"user": "2"})
+        self.server.release()
+        self.assertEqual(first.get_response(5), {"query": {"user": "1"}})
+        self.assertEqual(second.get_response(5), {"query": {"user": "2"}})
+        self.assertEqual(self.server.requests, 2)
+
+    def test_failure_shared(self):
+        server = MockServer(error_rate=1).start()
+        client = EngineClient(url=server.url, threads=1, single_flight=True)
+        server.hold()
+        requests = [client.asend_query({"user": "1"}) for i in range(3)]
+        server.release()
+        for r in requests:
+            self.assertRaises(PredictionIOAPIError, r.get_response, 5)
+        self.assertEqual(server.requests, 1)
+        self.assertEqual(client._in_flight, {})
+        # the next identical query is sent again
+        self.assertRaises(PredictionIOAPIError, client.send_query,
+                          {"user": "1"})
+        self.assertEqual(server.requests, 2)
+        client.close()
+        server.stop()
+
+    def test_cancel_one_caller(self):
+        self._hold_worker()
+        first = self.client.asend_query({"user": "1"})
+        second = self.client.asend_query({"user": "1"})
+        self.assertTrue(first.cancel())
+        self.server.release()
+        self.assertEqual(second.get_response(5), {"query": {"user": "1"}})
+        self.assertTrue(first.cancelled())
+
+    def test_deadline_of_one_caller(self):
+        self._hold_worker()
+        first = self.client.asend_query({"user": "1"}, deadline=0.01)
+        second = self.client.asend_query({"user": "1"})
+        time.sleep(0.05)
+        self.server.release()
+        self.assertEqual(second.get_response(5), {"query": {"user": "1"}})
+        self.assertEqual(first.get_response(5), {"query": {"user": "1"}})
+
+
+if __name__ == "__main__":
+    unittest.main()
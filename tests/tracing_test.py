@@ -0,0 +1,121 @@
+import logging
+import unittest
+
+from predictionio import OpenTelemetryTracer
+from predictionio import Tracer
+from predictionio import tracing
+from predictionio.connection import AsyncRequest
+from predictionio.connection import AsyncResponse
+from predictionio.connection import Connection
+from predictionio.connection import _tracing
+
+
+class RecordingTracer(Tracer):
+
+    def __init__(self):
+        self.stages = []
+
+    def stage(self, request, stage, timestamp, start=None):
+        self.stages.append((request, stage))
+
+
+class RaisingTracer(Tracer):
+
+    def stage(self, request, stage, timestamp, start=None):
+        raise ValueError(stage)
+
+
+class ListHandler(logging.Handler):
+
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class TracingTest(unittest.TestCase):
+
+    def test_delivered_and_decoded(self):
+        tracer = RecordingTracer()
+        request = AsyncRequest("GET", "/")
+        request.tracer = tracer
+        response = AsyncResponse()
+        response.set_resp(11, 200, "", {}, b'{"a": 1}')
+        response.set_request(request)
+        request.set_response(response)
+        self.assertEqual(request.get_response().json_body, {"a": 1})
+        self.assertEqual(tracer.stages, [(request, tracing.DELIVERED),
+                                         (request, tracing.JSON_DECODED)])
+
+    def test_cancelled(self):
+        tracer = RecordingTracer()
+        request = AsyncRequest("GET", "/")
+        request.tracer = tracer
+        request.cancel()
+        self.assertEqual(tracer.stages, [(request, tracing.DELIVERED)])
+
+    def test_not_traced(self):
+        requests = [AsyncRequest("GET", "/"), AsyncRequest("GET", "/")]
+        self.assertIsNone(_tracing(requests))
+
+    def test_pipelined_stages(self):
+        tracer = RecordingTracer()
+        requests = [AsyncRequest("GET", "/"), AsyncRequest("GET", "/"),
+                    AsyncRequest("GET", "/")]
+        requests[0].tracer = requests[2].tracer = tracer
+        trace = _tracing(requests)
+        trace(tracing.REQUEST_SENT)
+        trace(tracing.FIRST_BYTE, 2)
+        trace(tracing.FIRST_BYTE, 1)
+        self.assertEqual(tracer.stages, [(requests[0], tracing.REQUEST_SENT),
+                                         (requests[2], tracing.REQUEST_SENT),
+                                         (requests[2], tracing.FIRST_BYTE)])
+
+    def test_connection_refused(self):
+        tracer = RecordingTracer()
+        connection = Connection("127.0.0.1:1", threads=0, https=False,
+                                tracer=tracer)
+        request = AsyncRequest("GET", "/")
+        connection.make_request(request)
+        self.assertIsNotNone(request._raw_response.error)
+        stages = [stage for r, stage in tracer.stages]
+        self.assertEqual(stages[0], tracing.ENQUEUED)
+        self.assertIn(tracing.CONNECT_START, stages)
+        self.assertNotIn(tracing.CONNECT_END, stages)
+        self.assertEqual(stages[-1], tracing.DELIVERED)
+        connection.close()
+
+    def test_raising_tracer(self):
+        connection = Connection("127.0.0.1:1", threads=1, https=False,
+                                tracer=RaisingTracer())
+        requests = [AsyncRequest("GET", "/"), AsyncRequest("GET", "/")]
+        logger = logging.getLogger("predictionio.connection")
+        handler = ListHandler()
+        logger.addHandler(handler)
+        try:
+            for request in requests:
+                connection.make_request(request)
+                # completed by the thread, which is still alive
+                self.assertIsNotNone(request.get_response(5).error)
+        finally:
+            logger.removeHandler(handler)
+            connection.close()
+        self.assertTrue(handler.records)
+        for record in handler.records:
+            self.assertEqual(record.levelno, logging.ERROR)
+            self.assertIn("tracer", record.getMessage())
+            self.assertIsInstance(record.exc_info[1], ValueError)
+
+    @unittest.skipIf(tracing.otel_trace is not None,
+                     "opentelemetry is installed")
+    def test_opentelemetry_not_installed(self):
+        tracer = OpenTelemetryTracer()
+        request = AsyncRequest("GET", "/")
+        tracer.stage(request, tracing.ENQUEUED, 0)
+        self.assertIsNone(request.trace_context)
+
+
+if __name__ == "__main__":
+    unittest.main()